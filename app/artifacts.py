@@ -0,0 +1,228 @@
+import json
+import os
+import shutil
+import time
+import logging
+from typing import Optional, Sequence, Tuple
+
+from .catalog import ItemCatalog
+from .collaborative import COLLABORATIVE_DIR, CollaborativeModel
+from .facets import FACETS_DIR, FacetIndex
+from .index import INDEX_DIR
+from .neighbors import NEIGHBORS_DIR
+from .popularity import POPULARITY_DIR, PopularityRanking
+from .shards import SHARDS_DIR
+from .vectors import load_item_vectors, save_item_vectors
+
+logger = logging.getLogger(__name__)
+
+# Bundle único com tudo que a API precisa para servir. Todos os arrays são
+# .npy brutos, abertos com np.load(mmap_mode='r'): N workers no mesmo host
+# compartilham o page cache em vez de cada um desserializar uma cópia.
+BUNDLE_FORMAT = "recommendation-bundle"
+BUNDLE_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+VECTORIZER_FILE = "tfidf_vectorizer.pkl"
+DEFAULT_BUNDLE_PATH = os.getenv("MODEL_BUNDLE_PATH", "models/bundle")
+# Cada treino grava uma versão em <diretório do bundle>/versions/<versão>; o
+# caminho do bundle é um symlink trocado atomicamente para a versão publicada
+VERSIONS_DIR = "versions"
+# Versões mantidas em disco (a publicada sempre fica)
+MODEL_KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", 3))
+
+
+class ArtifactBundle:
+    """Artefatos do modelo carregados (em geral via mmap) a partir de um bundle"""
+
+    def __init__(self, path: str, manifest: dict, catalog: ItemCatalog, item_vectors,
+                 popularity: Optional[PopularityRanking] = None, facets: Optional[FacetIndex] = None,
+                 collaborative: Optional[CollaborativeModel] = None):
+        self.path = path
+        self.manifest = manifest
+        self.catalog = catalog
+        self.item_vectors = item_vectors
+        self.popularity = popularity
+        self.facets = facets
+        self.collaborative = collaborative
+        self._vectorizer = None
+
+    def __len__(self) -> int:
+        return len(self.catalog)
+
+    @property
+    def version(self) -> str:
+        return manifest_version(self.manifest)
+
+    def popular(self, k: int, allowed=None) -> Tuple[Sequence[int], Sequence[float]]:
+        """Cold start: (linhas, scores) dos k itens do ranking de popularidade, O(k)
+
+        Bundles treinados sem avaliações não têm ranking; nesse caso vêm os
+        primeiros itens do catálogo com score 0. `allowed` (RowSelection)
+        restringe o ranking a um filtro.
+        """
+        if self.popularity is None:
+            rows = range(min(k, len(self))) if allowed is None else allowed.rows[:k].tolist()
+            return rows, [0.0] * len(rows)
+        rows, scores = self.popularity.top(k) if allowed is None else self.popularity.top_allowed(k, allowed)
+        return rows.tolist(), scores.tolist()
+
+    @property
+    def vectorizer(self):
+        """TF-IDF treinado; só é desserializado quando alguém precisa dele"""
+        if self._vectorizer is None:
+            import joblib
+            self._vectorizer = joblib.load(os.path.join(self.path, VECTORIZER_FILE))
+        return self._vectorizer
+
+
+def save_bundle(path: str, items_df, item_vectors, vectorizer=None, index=None, neighbor_table=None,
+                popularity=None, collaborative=None, shards=None, extra: Optional[dict] = None,
+                version: Optional[str] = None):
+    """Escreve o bundle: vetores CSR, ids, títulos, gêneros, índice, vizinhos, popularidade,
+    embeddings colaborativos, shards e manifesto
+
+    `version` identifica o modelo (namespace de cache e perfis; padrão: created_at).
+    `extra` entra no manifesto como está (ex.: dados da última atualização incremental).
+    """
+    if item_vectors.shape[0] != len(items_df):
+        raise ValueError(f"Vetores ({item_vectors.shape[0]}) e itens ({len(items_df)}) não batem")
+
+    os.makedirs(path, exist_ok=True)
+    item_ids = ItemCatalog.save(path, items_df)
+    # Facetas de filtro (gênero, ano do título): O(N), refeitas a cada gravação
+    FacetIndex.build(items_df['title'].tolist(), items_df['genres'].tolist()).save(os.path.join(path, FACETS_DIR))
+    save_item_vectors(item_vectors, os.path.join(path, "item_vectors"))
+    if vectorizer is not None:
+        import joblib
+        joblib.dump(vectorizer, os.path.join(path, VECTORIZER_FILE))
+    if index is not None:
+        index.save(os.path.join(path, INDEX_DIR))
+    if neighbor_table is not None:
+        neighbor_table.save(os.path.join(path, NEIGHBORS_DIR))
+    if popularity is not None:
+        popularity.save(os.path.join(path, POPULARITY_DIR))
+    if collaborative is not None:
+        if collaborative.item_factors.shape[0] != len(items_df):
+            raise ValueError(f"Embeddings colaborativos ({collaborative.item_factors.shape[0]}) "
+                             f"e itens ({len(items_df)}) não batem")
+        collaborative.save(os.path.join(path, COLLABORATIVE_DIR))
+    if shards is not None:
+        if shards.bounds[-1] != len(items_df):
+            raise ValueError(f"Shards ({shards.bounds[-1]} linhas) e itens ({len(items_df)}) não batem")
+        shards.save(os.path.join(path, SHARDS_DIR))
+
+    created_at = int(time.time())
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "model_version": version or str(created_at),
+        "created_at": created_at,
+        "num_items": int(len(item_ids)),
+        "num_features": int(item_vectors.shape[1]),
+        "arrays": {
+            "item_vectors": "item_vectors/",
+            "item_ids": "item_ids.npy",
+            "titles": ["titles_data.npy", "titles_offsets.npy"],
+            "genres": ["genres_data.npy", "genres_offsets.npy"],
+            "facets": f"{FACETS_DIR}/",
+        },
+        "vectorizer": VECTORIZER_FILE if vectorizer is not None else None,
+        "index": {"backend": index.backend, **index.params()} if index is not None else None,
+        "neighbor_table_k": neighbor_table.k if neighbor_table is not None else None,
+        "popularity_genres": len(popularity.genres) if popularity is not None else None,
+        "collaborative": collaborative.params if collaborative is not None else None,
+        "shards": shards.bounds if shards is not None else None,
+        **(extra or {}),
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def manifest_version(manifest: dict) -> str:
+    """Versão do modelo; bundles anteriores ao versionamento usam o created_at"""
+    return str(manifest.get("model_version") or manifest.get("created_at", "default"))
+
+
+def read_manifest(path: str = DEFAULT_BUNDLE_PATH) -> dict:
+    """Manifesto do bundle (barato: permite checar a versão publicada sem carregá-lo)"""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"Bundle não encontrado: {manifest_path}")
+
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def new_version_path(path: str = DEFAULT_BUNDLE_PATH) -> str:
+    """Diretório ainda inexistente para uma nova versão do bundle publicado em path"""
+    root = os.path.join(os.path.dirname(os.path.abspath(path)), VERSIONS_DIR)
+    version = time.strftime("%Y%m%d-%H%M%S")
+    candidate, suffix = os.path.join(root, version), 1
+    while os.path.exists(candidate):
+        candidate, suffix = os.path.join(root, f"{version}-{suffix}"), suffix + 1
+    return candidate
+
+
+def publish_bundle(version_path: str, path: str = DEFAULT_BUNDLE_PATH, keep: int = MODEL_KEEP_VERSIONS):
+    """Publica a versão: path vira um symlink para ela, trocado com os.replace (atômico)
+
+    Quem abrir path depois da troca vê a versão nova inteira; quem já tinha
+    aberto a antiga continua com ela. As versões mais antigas que `keep` são
+    apagadas (processos que ainda as mapeiam mantêm os arquivos abertos).
+    """
+    path = os.path.abspath(path)
+    if os.path.isdir(path) and not os.path.islink(path):
+        if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            # Layout antigo (diretório no lugar do symlink): vira uma versão
+            legacy = new_version_path(path)
+            os.makedirs(os.path.dirname(legacy), exist_ok=True)
+            os.rename(path, legacy)
+            logger.info(f"Bundle existente movido para {legacy}")
+        else:
+            os.rmdir(path)
+
+    link = f"{path}.tmp-{os.getpid()}"
+    os.symlink(os.path.relpath(version_path, os.path.dirname(path)), link)
+    os.replace(link, path)
+    logger.info(f"Bundle publicado: {path} -> {version_path}")
+    prune_versions(path, keep)
+
+
+def prune_versions(path: str, keep: int = MODEL_KEEP_VERSIONS):
+    """Apaga as versões mais antigas, mantendo as `keep` mais recentes e a publicada"""
+    root = os.path.join(os.path.dirname(os.path.abspath(path)), VERSIONS_DIR)
+    current = os.path.realpath(path)
+    versions = sorted(
+        (os.path.join(root, name) for name in os.listdir(root)),
+        key=os.path.getmtime, reverse=True
+    )
+    for version_path in versions[max(keep, 1):]:
+        if os.path.realpath(version_path) != current:
+            shutil.rmtree(version_path, ignore_errors=True)
+
+
+def load_bundle(path: str = DEFAULT_BUNDLE_PATH, mmap_mode: Optional[str] = "r") -> ArtifactBundle:
+    """Abre o bundle; com mmap_mode='r' nada é copiado para a memória do processo
+
+    O symlink é resolvido uma vez: todos os arquivos vêm da mesma versão,
+    mesmo que outra seja publicada durante ou depois da carga.
+    """
+    path = os.path.realpath(path)
+    manifest = read_manifest(path)
+
+    if manifest.get("format") != BUNDLE_FORMAT or manifest.get("version") != BUNDLE_VERSION:
+        raise ValueError(
+            f"Bundle incompatível: {manifest.get('format')} v{manifest.get('version')} "
+            f"(esperado {BUNDLE_FORMAT} v{BUNDLE_VERSION})"
+        )
+
+    return ArtifactBundle(
+        path=path,
+        manifest=manifest,
+        catalog=ItemCatalog.load(path, mmap_mode),
+        item_vectors=load_item_vectors(os.path.join(path, "item_vectors"), mmap_mode=mmap_mode),
+        popularity=PopularityRanking.load(os.path.join(path, POPULARITY_DIR), mmap_mode),
+        facets=FacetIndex.load(os.path.join(path, FACETS_DIR), mmap_mode),
+        collaborative=CollaborativeModel.load(os.path.join(path, COLLABORATIVE_DIR), mmap_mode),
+    )
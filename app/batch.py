@@ -0,0 +1,31 @@
+import os
+import logging
+from typing import List, Sequence, Tuple, Union
+
+from .profiles import ProfileState, sync_profile_state
+from .scoring import recommend_states
+
+logger = logging.getLogger(__name__)
+
+# Máximo de usuários aceitos por chamada de /recommend/batch
+BATCH_MAX_USERS = int(os.getenv("BATCH_MAX_USERS", 1000))
+
+
+def recommend_batch(serving, histories: List[Union[ProfileState, Sequence[int]]], k: int,
+                    allowed=None) -> List[Tuple[bytes, str]]:
+    """Recomendações para vários usuários de uma vez: [(resultado JSON, estratégia)]
+
+    `histories` traz, por usuário, as linhas (não os ids) dos itens ou o
+    estado do perfil armazenado. O scoring é o de /recommend
+    (`recommend_states`): os perfis que vão ao índice são pontuados juntos
+    com um produto de matrizes por bloco, e cada usuário recebe exatamente o
+    resultado que /recommend daria ao mesmo histórico, com os mesmos k e
+    filtros. Por isso o lote e /recommend compartilham as chaves de cache.
+    `allowed` (RowSelection) restringe todos os usuários ao mesmo filtro.
+    """
+    item_vectors = serving.bundle.item_vectors
+    states = [
+        history if isinstance(history, ProfileState) else sync_profile_state(None, item_vectors, history)[0]
+        for history in histories
+    ]
+    return recommend_states(serving, states, k, allowed)
@@ -1,55 +1,234 @@
-import redis
-import json
+import redis.asyncio as redis
+import asyncio
+import hashlib
 import os
-from typing import Optional, List
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, List, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Configuração Redis
-try:
-    redis_client = redis.Redis(
-        host=os.getenv('REDIS_HOST', 'localhost'),
-        port=int(os.getenv('REDIS_PORT', 6379)),
-        decode_responses=True,
-        socket_connect_timeout=5,
-        socket_timeout=5
-    )
-    # Testar conexão
-    redis_client.ping()
-    logger.info("Conectado ao Redis")
-except Exception as e:
-    logger.warning(f"Redis não disponível: {e}. Cache desabilitado.")
-    redis_client = None
-
-def get_cached_recommendations(user_id: str, item_ids: List[str]) -> Optional[dict]:
-    """Busca recomendações em cache"""
+# Configuração Redis: cliente asyncio com pool de conexões compartilhado.
+# Nenhuma chamada bloqueia o event loop; a conexão é testada no startup.
+# Respostas em bytes: o JSON cacheado vai direto para a resposta e os perfis são binários.
+redis_pool = redis.ConnectionPool(
+    host=os.getenv('REDIS_HOST', 'localhost'),
+    port=int(os.getenv('REDIS_PORT', 6379)),
+    max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', 50)),
+    socket_connect_timeout=float(os.getenv('REDIS_CONNECT_TIMEOUT', 1.0)),
+    socket_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.5))
+)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+async def connect_cache():
+    """Testa a conexão com o Redis; sem Redis o cache fica desabilitado"""
+    global redis_client
+    if not redis_client:
+        return
+
+    try:
+        await redis_client.ping()
+        logger.info("Conectado ao Redis")
+    except Exception as e:
+        logger.warning(f"Redis não disponível: {e}. Cache desabilitado.")
+        redis_client = None
+
+async def close_cache():
+    """Fecha as conexões do pool"""
+    if redis_client:
+        await redis_client.close()
+    await redis_pool.disconnect()
+
+class LocalCache:
+    """Cache L1 em processo: LRU limitado por número de entradas, com TTL"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+
+class SingleFlight:
+    """Coalesce chamadas concorrentes com a mesma chave: só a primeira calcula"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Marca a exceção como consumida caso ninguém esteja esperando
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del self._inflight[key]
+
+
+local_cache = LocalCache(
+    max_entries=int(os.getenv('CACHE_L1_MAX_ENTRIES', 10000)),
+    ttl=float(os.getenv('CACHE_L1_TTL', 60))
+)
+single_flight = SingleFlight()
+CACHE_TTL = int(os.getenv('CACHE_TTL', 3600))
+_counters = {"l1": {"hits": 0, "misses": 0}, "l2": {"hits": 0, "misses": 0, "errors": 0}}
+
+def recommendation_key(rows, num_recommendations: int, namespace: str = "default",
+                       filters: str = "") -> str:
+    """Chave pelo histórico (não pelo usuário): digest das linhas do histórico
+
+    `rows` são as linhas ordenadas e sem repetição (`unique_rows`, a forma
+    de ProfileState.rows): usuários com o mesmo histórico compartilham a
+    entrada, venha ele em item_ids ou do perfil armazenado, e o custo é um
+    digest de bytes, sem ordenar ids em Python. Estável entre processos e
+    restarts (hash() do Python é salgado por processo). O namespace é a
+    versão do modelo, a quem as linhas se referem: um modelo novo não lê
+    resultados do anterior, que expiram pelo TTL. `filters` é a forma
+    canônica dos filtros de negócio da requisição. Um evento novo muda as
+    linhas do perfil e portanto a chave; não há o que invalidar.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(num_recommendations).encode())
+    if filters:
+        digest.update(b"\x1d" + filters.encode())
+    digest.update(b"\x1e")
+    digest.update(rows.tobytes())
+    return f"rec:{namespace}:{digest.hexdigest()}"
+
+def _count(tier: str, hit: bool):
+    _counters[tier]["hits" if hit else "misses"] += 1
+
+async def get_cached_recommendations(cache_key: str) -> Optional[bytes]:
+    """Busca recomendações no L1 (processo) e depois no L2 (Redis)
+
+    O valor é o resultado já serializado em JSON: um hit no Redis volta como
+    os bytes recebidos, sem json.loads.
+    """
+    cached = local_cache.get(cache_key)
+    _count("l1", cached is not None)
+    if cached is not None:
+        return cached
+
     if not redis_client:
         return None
-        
-    cache_key = f"rec:{user_id}:{hash(tuple(sorted(item_ids)))}"
-    
+
     try:
-        cached = redis_client.get(cache_key)
-        if cached:
-            return json.loads(cached)
+        value = await redis_client.get(cache_key)
+        _count("l2", bool(value))
+        if value:
+            local_cache.set(cache_key, value)
+            return value
     except Exception as e:
+        _counters["l2"]["errors"] += 1
         logger.warning(f"Erro ao buscar cache: {e}")
-    
+
     return None
 
-def cache_recommendations(user_id: str, item_ids: List[str], recommendations: dict, ttl: int = 3600):
-    """Salva recomendações em cache"""
+async def cache_recommendations(cache_key: str, recommendations: bytes, ttl: int = CACHE_TTL):
+    """Salva recomendações no L1 e no L2"""
+    local_cache.set(cache_key, recommendations)
     if not redis_client:
         return
-        
-    cache_key = f"rec:{user_id}:{hash(tuple(sorted(item_ids)))}"
-    
+
     try:
-        redis_client.setex(
-            cache_key, 
-            ttl, 
-            json.dumps(recommendations)
+        await redis_client.setex(
+            cache_key,
+            ttl,
+            recommendations
         )
     except Exception as e:
-        logger.warning(f"Erro ao salvar cache: {e}")
\ No newline at end of file
+        _counters["l2"]["errors"] += 1
+        logger.warning(f"Erro ao salvar cache: {e}")
+
+async def get_cached_recommendations_many(cache_keys: List[str]) -> List[Optional[bytes]]:
+    """Busca várias chaves: L1 primeiro, e as faltantes com um único MGET no L2"""
+    results = [local_cache.get(key) for key in cache_keys]
+    for cached in results:
+        _count("l1", cached is not None)
+
+    missing = [i for i, cached in enumerate(results) if cached is None]
+    if not redis_client or not missing:
+        return results
+
+    try:
+        values = await redis_client.mget([cache_keys[i] for i in missing])
+        for i, value in zip(missing, values):
+            _count("l2", bool(value))
+            if value:
+                results[i] = value
+                local_cache.set(cache_keys[i], value)
+    except Exception as e:
+        _counters["l2"]["errors"] += 1
+        logger.warning(f"Erro ao buscar cache em lote: {e}")
+
+    return results
+
+async def cache_recommendations_many(entries: List[Tuple[str, bytes]], ttl: int = CACHE_TTL):
+    """Salva várias recomendações no L1 e no L2 (pipeline, um round trip)"""
+    for cache_key, recommendations in entries:
+        local_cache.set(cache_key, recommendations)
+    if not redis_client or not entries:
+        return
+
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        for cache_key, recommendations in entries:
+            pipeline.setex(cache_key, ttl, recommendations)
+        await pipeline.execute()
+    except Exception as e:
+        _counters["l2"]["errors"] += 1
+        logger.warning(f"Erro ao salvar cache em lote: {e}")
+
+def cache_stats() -> dict:
+    """Hits/misses por camada, para dimensionar o cache"""
+    stats = {}
+    for tier, counters in _counters.items():
+        lookups = counters["hits"] + counters["misses"]
+        stats[tier] = {**counters, "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else None}
+    stats["l1"].update(size=len(local_cache), max_entries=local_cache.max_entries,
+                       ttl=local_cache.ttl, evictions=local_cache.evictions)
+    stats["l2"]["enabled"] = redis_client is not None
+    stats["coalesced"] = single_flight.coalesced
+    return stats
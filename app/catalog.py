@@ -0,0 +1,183 @@
+import os
+import json
+import logging
+from itertools import repeat
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class StringColumn:
+    """Coluna de strings mapeável em memória: bytes UTF-8 contíguos + offsets
+
+    A leitura passa por memoryviews dos arrays: fatiar um memoryview não cria
+    objetos numpy (um np.memmap por fatia custa microssegundos) e continua
+    sem copiar nada do mmap.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+        self._data = memoryview(np.ascontiguousarray(data))
+        self._offsets = memoryview(np.ascontiguousarray(offsets))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        offsets = self._offsets
+        return str(self._data[offsets[row]:offsets[row + 1]], "utf-8")
+
+    def raw(self, row: int) -> memoryview:
+        """Bytes UTF-8 da linha, sem decodificar nem copiar"""
+        offsets = self._offsets
+        return self._data[offsets[row]:offsets[row + 1]]
+
+    @staticmethod
+    def _encode(values: Sequence[str]):
+        encoded = [value if isinstance(value, bytes) else str(value).encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+    @classmethod
+    def from_values(cls, values: Sequence[str]) -> "StringColumn":
+        """Coluna em memória (sem arquivo), no mesmo formato da mapeada"""
+        return cls(*cls._encode(values))
+
+    @staticmethod
+    def save(path: str, name: str, values: Sequence[str]):
+        data, offsets = StringColumn._encode(values)
+        np.save(os.path.join(path, f"{name}_data.npy"), data)
+        np.save(os.path.join(path, f"{name}_offsets.npy"), offsets)
+
+    @classmethod
+    def load(cls, path: str, name: str, mmap_mode: Optional[str] = "r") -> "StringColumn":
+        return cls(
+            np.load(os.path.join(path, f"{name}_data.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, f"{name}_offsets.npy"), mmap_mode=mmap_mode),
+        )
+
+
+class ItemCatalog:
+    """Catálogo imutável de itens em arrays: ids ordenados, títulos e gêneros por linha
+
+    Todas as rotas servem daqui, sem pandas. Ids chegam como string nas
+    requisições; o dict id -> linha é montado na primeira consulta (memória
+    privada do processo, por isso não no load) e ids em formato não canônico
+    ("007") caem na busca binária sobre item_ids.
+
+    `item_json` guarda o JSON de cada item pronto, sem o "}" final, para que
+    as respostas sejam montadas concatenando bytes (com o score emendado).
+    """
+
+    def __init__(self, item_ids: np.ndarray, titles: StringColumn, genres: StringColumn,
+                 item_json: Optional[StringColumn] = None):
+        self.item_ids = item_ids
+        self.titles = titles
+        self.genres = genres
+        if item_json is None:
+            # Bundles antigos: fragmentos montados no load, na memória do processo
+            item_json = StringColumn.from_values(item_fragments(
+                item_ids.tolist(), [titles[row] for row in range(len(titles))],
+                [genres[row] for row in range(len(genres))]
+            ))
+        self.item_json = item_json
+        self._ids = memoryview(np.ascontiguousarray(item_ids))
+        self._row_by_id: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    def _index(self) -> Dict[str, int]:
+        if self._row_by_id is None:
+            # Corrida entre threads só monta o dict duas vezes; o resultado é o mesmo
+            self._row_by_id = {str(item_id): row for row, item_id in enumerate(self.item_ids.tolist())}
+        return self._row_by_id
+
+    def _search(self, item_id) -> Optional[int]:
+        """Busca binária em item_ids ordenados (ids fora do formato canônico)"""
+        try:
+            item_id = int(item_id)
+        except (ValueError, OverflowError, TypeError):
+            return None
+        row = int(np.searchsorted(self.item_ids, item_id))
+        if row < len(self.item_ids) and self._ids[row] == item_id:
+            return row
+        return None
+
+    def row_of(self, item_id) -> Optional[int]:
+        """Linha do item (id int ou string) ou None"""
+        row = self._index().get(item_id if isinstance(item_id, str) else str(item_id))
+        return row if row is not None else self._search(item_id)
+
+    def rows_of(self, item_ids: Iterable) -> np.ndarray:
+        """Linhas dos ids conhecidos, na ordem recebida (desconhecidos são ignorados)
+
+        Os ids passam pelo dict em um único map (sem loop em Python); só os
+        que faltam no dict vão, um a um, para a busca binária.
+        """
+        item_ids = item_ids if isinstance(item_ids, (list, tuple)) else list(item_ids)
+        rows = list(map(self._index().get, item_ids, repeat(-1)))
+        if -1 in rows:
+            rows = [row if row >= 0 else self._search(item_id) for row, item_id in zip(rows, item_ids)]
+            rows = [row for row in rows if row is not None]
+        return np.array(rows, dtype=np.int64)
+
+    def item(self, row: int) -> dict:
+        return {
+            "item_id": str(self._ids[row]),
+            "title": self.titles[row],
+            "genres": self.genres[row],
+        }
+
+    def items(self, rows: Iterable[int], scores: Optional[Iterable[float]] = None) -> List[dict]:
+        """Dicts de vários itens; com `scores`, cada um leva o seu "score" (float)"""
+        if scores is None:
+            return [self.item(row) for row in rows]
+        return [{**self.item(row), "score": float(score)} for row, score in zip(rows, scores)]
+
+    def item_json_bytes(self, row: int) -> bytes:
+        return bytes(self.item_json.raw(row)) + b"}"
+
+    def items_json(self, rows: Iterable[int], scores: Optional[Iterable[float]] = None) -> bytes:
+        """Array JSON dos itens, concatenando os fragmentos pré-serializados"""
+        raw = self.item_json.raw
+        if scores is None:
+            parts = [b"%s}" % raw(row) for row in rows]
+        else:
+            parts = [b'%s,"score":%r}' % (raw(row), float(score)) for row, score in zip(rows, scores)]
+        return b"[" + b",".join(parts) + b"]"
+
+    @staticmethod
+    def save(path: str, items_df) -> np.ndarray:
+        """Escreve ids, títulos e gêneros a partir do items_df (ordenado por id)"""
+        item_ids = items_df.index.to_numpy(dtype=np.int64)
+        if len(item_ids) > 1 and not np.all(item_ids[1:] > item_ids[:-1]):
+            raise ValueError("items_df deve estar ordenado por id (únicos) para o bundle")
+        np.save(os.path.join(path, "item_ids.npy"), item_ids)
+        StringColumn.save(path, "titles", items_df["title"])
+        StringColumn.save(path, "genres", items_df["genres"])
+        StringColumn.save(path, "item_json", item_fragments(item_ids.tolist(), items_df["title"], items_df["genres"]))
+        return item_ids
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> "ItemCatalog":
+        has_json = os.path.exists(os.path.join(path, "item_json_data.npy"))
+        return cls(
+            np.load(os.path.join(path, "item_ids.npy"), mmap_mode=mmap_mode),
+            StringColumn.load(path, "titles", mmap_mode),
+            StringColumn.load(path, "genres", mmap_mode),
+            StringColumn.load(path, "item_json", mmap_mode) if has_json else None,
+        )
+
+
+def item_fragments(item_ids: Sequence[int], titles: Sequence[str], genres: Sequence[str]) -> List[bytes]:
+    """JSON de cada item sem o "}" final: '{"item_id":"1","title":...,"genres":...'"""
+    return [
+        json.dumps({"item_id": str(item_id), "title": title, "genres": genre},
+                   ensure_ascii=False, separators=(",", ":"))[:-1].encode("utf-8")
+        for item_id, title, genre in zip(item_ids, titles, genres)
+    ]
@@ -0,0 +1,172 @@
+import os
+import json
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .vectors import RowSelection, top_k, top_k_similar
+
+logger = logging.getLogger(__name__)
+
+COLLABORATIVE_DIR = "collaborative"
+# Dimensão dos embeddings colaborativos (SVD truncado da matriz usuário x item)
+CF_FACTORS = int(os.getenv("CF_FACTORS", 64))
+# Peso do score colaborativo na mistura: (1 - peso) * conteúdo + peso * colaborativo; 0 desliga
+CF_WEIGHT = float(os.getenv("CF_WEIGHT", 0.5))
+# Candidatos de cada componente re-pontuados na mistura, em múltiplos de k
+CF_CANDIDATES = int(os.getenv("CF_CANDIDATES", 4))
+
+
+class InteractionsBuilder:
+    """Avaliações (usuário, filme, nota) acumuladas pedaço a pedaço em arrays compactos
+
+    12 bytes por avaliação (int32, int32, float32), sem as colunas e o
+    índice do DataFrame: é o que a matriz usuário x item do SVD precisa.
+    """
+
+    def __init__(self):
+        self._users: List[np.ndarray] = []
+        self._movies: List[np.ndarray] = []
+        self._ratings: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(users) for users in self._users)
+
+    def add(self, ratings_df):
+        """Pedaço com as colunas de ratings.csv (userId, movieId, rating)"""
+        self._users.append(ratings_df["userId"].to_numpy(dtype=np.int32))
+        self._movies.append(ratings_df["movieId"].to_numpy(dtype=np.int32))
+        self._ratings.append(ratings_df["rating"].to_numpy(dtype=np.float32))
+
+    def matrix(self, item_ids: np.ndarray) -> sparse.csr_matrix:
+        """Matriz usuário x linha do bundle (CSR float32); ids fora do catálogo são descartados"""
+        if not self._users:
+            return sparse.csr_matrix((0, len(item_ids)), dtype=np.float32)
+        users = np.concatenate(self._users)
+        movies = np.concatenate(self._movies).astype(np.int64)
+        ratings = np.concatenate(self._ratings)
+
+        rows = np.searchsorted(item_ids, movies)
+        known = rows < len(item_ids)
+        known[known] = item_ids[rows[known]] == movies[known]
+        user_ids, user_rows = np.unique(users[known], return_inverse=True)
+        return sparse.csr_matrix(
+            (ratings[known], (user_rows, rows[known])), shape=(len(user_ids), len(item_ids)), dtype=np.float32
+        )
+
+
+class CollaborativeModel:
+    """Embeddings colaborativos dos itens (N x F, float32, L2-normalizados)
+
+    Itens sem avaliações têm embedding nulo: o score colaborativo deles é 0
+    e só o conteúdo conta. F é pequeno (dezenas), então pontuar o catálogo
+    inteiro é um produto matriz-vetor denso de N x F.
+    """
+
+    def __init__(self, item_factors: np.ndarray, params: Optional[dict] = None):
+        self.item_factors = item_factors
+        self.params = params or {}
+
+    @property
+    def factors(self) -> int:
+        return self.item_factors.shape[1]
+
+    def profile(self, rows: np.ndarray) -> Optional[np.ndarray]:
+        """Perfil colaborativo: média dos embeddings do histórico, L2-normalizada (None se nulo)"""
+        if len(rows) == 0:
+            return None
+        profile = self.item_factors[rows].sum(axis=0, dtype=np.float32)
+        norm = np.linalg.norm(profile)
+        if norm == 0:
+            return None
+        return profile / norm
+
+    def profiles(self, histories: Sequence[Sequence[int]]) -> np.ndarray:
+        """Perfis colaborativos de vários históricos (B x F); linhas nulas sem avaliações"""
+        profiles = np.zeros((len(histories), self.factors), dtype=np.float32)
+        for i, rows in enumerate(histories):
+            profile = self.profile(np.asarray(rows, dtype=np.int64))
+            if profile is not None:
+                profiles[i] = profile
+        return profiles
+
+    def search(self, profile: np.ndarray, k: int, exclude: Optional[np.ndarray] = None,
+               allowed: Optional[RowSelection] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k exato pelo score colaborativo (um produto N x F denso)"""
+        return top_k_similar(self.item_factors, profile, k, exclude, allowed)
+
+    def blend(self, item_vectors, content_profile: np.ndarray, profile: np.ndarray,
+              candidates: Sequence[np.ndarray], k: int,
+              weight: float = CF_WEIGHT) -> Tuple[np.ndarray, np.ndarray]:
+        """Re-pontua a união dos candidatos com a mistura dos dois scores e devolve o top-k
+
+        Os candidatos já vêm sem itens vistos e dentro dos filtros; o custo é
+        proporcional a eles (linhas do CSR + linhas de F floats).
+        """
+        rows = np.unique(np.concatenate([np.asarray(part, dtype=np.int64) for part in candidates]))
+        scores = (1 - weight) * np.asarray(item_vectors[rows] @ content_profile, dtype=np.float32)
+        scores += weight * (self.item_factors[rows] @ profile)
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def patch(self, old_to_new: np.ndarray, num_items: int) -> "CollaborativeModel":
+        """Embeddings para o catálogo atualizado: itens novos entram sem avaliações (nulos)
+
+        Os embeddings não dependem do texto: itens alterados mantêm os seus.
+        """
+        item_factors = np.zeros((num_items, self.factors), dtype=np.float32)
+        item_factors[old_to_new] = self.item_factors
+        return CollaborativeModel(item_factors, self.params)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "item_factors.npy"), self.item_factors)
+        with open(os.path.join(path, "params.json"), "w") as f:
+            json.dump(self.params, f)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> Optional["CollaborativeModel"]:
+        if not os.path.exists(os.path.join(path, "item_factors.npy")):
+            return None
+        with open(os.path.join(path, "params.json")) as f:
+            params = json.load(f)
+        return cls(np.load(os.path.join(path, "item_factors.npy"), mmap_mode=mmap_mode), params)
+
+
+def build_collaborative(matrix: sparse.csr_matrix, factors: int = CF_FACTORS,
+                        seed: int = 0) -> Optional[CollaborativeModel]:
+    """Embeddings dos itens pelo SVD truncado da matriz usuário x item centrada
+
+    Cada nota vira a diferença para a média do usuário (tira o viés de quem
+    avalia tudo alto ou baixo). Com R ≈ U S Vᵀ, o embedding do item é a linha
+    de V S, L2-normalizada: o produto escalar entre itens aproxima o cosseno
+    das suas colunas em R. None quando não há avaliações suficientes.
+    """
+    # Só no treino: scipy.sparse.linalg (ARPACK) fica fora do import da API
+    from scipy.sparse.linalg import svds
+
+    matrix = sparse.csr_matrix(matrix, dtype=np.float32, copy=True)
+    factors = min(factors, min(matrix.shape) - 1)
+    if matrix.nnz == 0 or factors < 1:
+        logger.warning("Avaliações insuficientes para o modelo colaborativo")
+        return None
+
+    counts = np.diff(matrix.indptr)
+    sums = np.asarray(matrix.sum(axis=1), dtype=np.float32).ravel()
+    means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+    matrix.data -= np.repeat(means, counts)
+
+    rng = np.random.default_rng(seed)
+    # v0 fixo: o ARPACK parte de um vetor aleatório e o resultado varia entre treinos
+    _, singular_values, vt = svds(matrix, k=factors, v0=rng.standard_normal(min(matrix.shape)).astype(np.float32))
+    item_factors = np.ascontiguousarray((vt.T * singular_values).astype(np.float32))
+    norms = np.linalg.norm(item_factors, axis=1, keepdims=True)
+    np.divide(item_factors, norms, out=item_factors, where=norms > 0)
+
+    rated = int((np.diff(matrix.tocsc().indptr) > 0).sum())
+    logger.info(f"Modelo colaborativo: {matrix.shape[0]} usuários, {rated} itens avaliados, "
+                f"{matrix.nnz} avaliações, {factors} fatores")
+    return CollaborativeModel(item_factors, {"factors": factors, "users": int(matrix.shape[0]),
+                                             "ratings": int(matrix.nnz)})
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Eventos aceitos e ainda não aplicados; com a fila cheia o POST /events espera
+EVENTS_QUEUE_MAX = int(os.getenv("EVENTS_QUEUE_MAX", 100000))
+# Máximo de eventos aplicados por micro-lote
+EVENTS_BATCH_SIZE = int(os.getenv("EVENTS_BATCH_SIZE", 2000))
+# Espera (s) para juntar mais eventos quando o lote sai pequeno
+EVENTS_LINGER = float(os.getenv("EVENTS_LINGER", 0.005))
+# Janela de eventos usada para os percentis de lag
+LAG_WINDOW = 10000
+
+# (user_id, item_id, instante de recebimento em time.monotonic())
+Event = Tuple[str, str, float]
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Linhas de um corpo NDJSON lido em streaming (linhas vazias são puladas)"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+def parse_event(line: bytes) -> Optional[Tuple[str, str]]:
+    """Interação {"user_id": ..., "item_id": ...}; None se a linha for inválida"""
+    try:
+        event = json.loads(line)
+        user_id, item_id = event["user_id"], event["item_id"]
+    except (ValueError, TypeError, KeyError):
+        return None
+    if user_id in (None, "") or item_id in (None, ""):
+        return None
+    return str(user_id), str(item_id)
+
+
+class EventConsumer:
+    """Consumidor em background: drena a fila em micro-lotes e aplica cada lote de uma vez"""
+
+    def __init__(self, apply_batch: Callable[[List[Event]], Awaitable[int]],
+                 batch_size: int = EVENTS_BATCH_SIZE, linger: float = EVENTS_LINGER,
+                 queue_max: int = EVENTS_QUEUE_MAX):
+        self.apply_batch = apply_batch
+        self.batch_size = batch_size
+        self.linger = linger
+        self.queue_max = queue_max
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lags = deque(maxlen=LAG_WINDOW)
+        self.received = 0
+        self.applied = 0
+        self.ignored = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_max)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Aplica o que já foi aceito e encerra o consumidor"""
+        if self._task is None:
+            return
+        await self.wait_idle()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, user_id: str, item_id: str):
+        await self._queue.put((user_id, item_id, time.monotonic()))
+        self.received += 1
+
+    async def wait_idle(self):
+        """Espera até todos os eventos aceitos terem sido aplicados"""
+        await self._queue.join()
+
+    def _drain(self, batch: List[Event]):
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < self.batch_size and self.linger > 0:
+                await asyncio.sleep(self.linger)
+                self._drain(batch)
+
+            try:
+                applied = await self.apply_batch(batch)
+                self.applied += applied
+                self.ignored += len(batch) - applied
+                now = time.monotonic()
+                self._lags.extend(now - received_at for _, _, received_at in batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"Erro ao aplicar lote de {len(batch)} eventos: {e}")
+            finally:
+                self.batches += 1
+                for _ in batch:
+                    self._queue.task_done()
+
+    def stats(self) -> dict:
+        lags = np.asarray(self._lags, dtype=np.float64) * 1000
+        return {
+            "received": self.received,
+            "applied": self.applied,
+            "ignored": self.ignored,
+            "failed": self.failed,
+            "batches": self.batches,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "lag_p50_ms": round(float(np.percentile(lags, 50)), 3) if lags.size else None,
+            "lag_p99_ms": round(float(np.percentile(lags, 99)), 3) if lags.size else None,
+        }
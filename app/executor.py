@@ -0,0 +1,80 @@
+import asyncio
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Tempo entre a submissão e o início no pool (fila de scoring)
+_QUEUE_WAIT = stage("scoring_queue")
+
+# "thread": scoring em um pool de threads limitado, fora do event loop;
+# "inline": roda no próprio event loop (comportamento antigo, útil para comparar)
+SCORING_MODE = os.getenv("SCORING_MODE", "thread")
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", os.cpu_count() or 1))
+# Máximo de tarefas em execução + na fila; acima disso a requisição recebe 429
+SCORING_QUEUE_DEPTH = int(os.getenv("SCORING_QUEUE_DEPTH", SCORING_WORKERS * 8))
+
+
+class ScoringQueueFull(Exception):
+    """Fila de scoring saturada: a requisição deve ser descartada (429)"""
+
+
+class ScoringExecutor:
+    """Executor limitado para o scoring CPU-bound (numpy/scipy liberam o GIL)"""
+
+    def __init__(self, workers: int = SCORING_WORKERS, queue_depth: int = SCORING_QUEUE_DEPTH,
+                 mode: str = SCORING_MODE):
+        if mode not in ("thread", "inline"):
+            raise ValueError(f"SCORING_MODE inválido: {mode}")
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.mode = mode
+        self.pending = 0
+        self.rejected = 0
+        self._pool = None
+
+    def start(self):
+        if self.mode == "thread" and self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scoring")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn, *args, **kwargs):
+        """Executa fn(*args) no pool; levanta ScoringQueueFull se a fila estiver cheia"""
+        if self.pending >= self.queue_depth:
+            self.rejected += 1
+            raise ScoringQueueFull(f"Fila de scoring cheia ({self.pending}/{self.queue_depth})")
+
+        self.pending += 1
+        try:
+            if self._pool is None:
+                return fn(*args, **kwargs)
+            submitted = time.perf_counter()
+
+            def task():
+                _QUEUE_WAIT.observe(time.perf_counter() - submitted)
+                return fn(*args, **kwargs)
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, task)
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+
+scoring_executor = ScoringExecutor()
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .vectors import RowSelection
+
+logger = logging.getLogger(__name__)
+
+FACETS_DIR = "facets"
+# Máscaras de filtro recentes guardadas por processo (N bytes cada)
+FACET_MASK_CACHE_ENTRIES = int(os.getenv("FACET_MASK_CACHE_ENTRIES", 32))
+# Ano no fim do título do MovieLens: "Toy Story (1995)"
+YEAR_PATTERN = re.compile(r"\((\d{4})\)\s*$")
+UNKNOWN_YEAR = 0
+NO_GENRE = "(no genres listed)"
+# Bits ligados de cada byte (popcount dos bitsets empacotados)
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.int64)
+
+
+def parse_year(title: str) -> int:
+    match = YEAR_PATTERN.search(title)
+    return int(match.group(1)) if match else UNKNOWN_YEAR
+
+
+class ItemFilter:
+    """Regras de negócio de uma requisição: gêneros aceitos/excluídos e faixa de anos
+
+    `genres` aceita itens com qualquer um dos gêneros; `exclude_genres`
+    remove itens com qualquer um deles; a faixa de anos é inclusiva e itens
+    sem ano no título ficam de fora quando ela é usada.
+    """
+
+    __slots__ = ("genres", "exclude_genres", "year_min", "year_max")
+
+    def __init__(self, genres: Sequence[str] = (), exclude_genres: Sequence[str] = (),
+                 year_min: Optional[int] = None, year_max: Optional[int] = None):
+        self.genres = tuple(sorted(set(genres or ())))
+        self.exclude_genres = tuple(sorted(set(exclude_genres or ())))
+        self.year_min = year_min
+        self.year_max = year_max
+
+    def __bool__(self) -> bool:
+        return bool(self.genres or self.exclude_genres or self.year_min is not None or self.year_max is not None)
+
+    def key(self) -> str:
+        """Forma canônica (ordem dos gêneros não importa): chave de cache e de máscara"""
+        if not self:
+            return ""
+        return (f"g={','.join(self.genres)};x={','.join(self.exclude_genres)};"
+                f"y={self.year_min if self.year_min is not None else ''}-"
+                f"{self.year_max if self.year_max is not None else ''}")
+
+
+class FacetIndex:
+    """Facetas dos itens calculadas no treino: um bitset por gênero e o ano por linha
+
+    Os bitsets ficam empacotados (N/8 bytes por gênero, np.packbits) e são
+    combinados com operações bit a bit antes de virar a máscara booleana por
+    linha usada na busca. As máscaras das combinações recentes ficam em um
+    LRU: filtros de produto ("só Comédia") se repetem muito.
+    """
+
+    def __init__(self, genres: Sequence[str], genre_bits: np.ndarray, years: np.ndarray):
+        self.genres = list(genres)
+        self.genre_bits = genre_bits
+        self.years = years
+        self._genre_index: Dict[str, int] = {genre: i for i, genre in enumerate(self.genres)}
+        self._masks: "OrderedDict[str, RowSelection]" = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.years)
+
+    def _bits_of(self, genres: Sequence[str]) -> np.ndarray:
+        """OR dos bitsets dos gêneros (empacotado)"""
+        unknown = [genre for genre in genres if genre not in self._genre_index]
+        if unknown:
+            raise ValueError(f"Gênero desconhecido: {', '.join(unknown)}")
+        bits = np.zeros(self.genre_bits.shape[1], dtype=np.uint8)
+        for genre in genres:
+            np.bitwise_or(bits, self.genre_bits[self._genre_index[genre]], out=bits)
+        return bits
+
+    def select(self, item_filter: ItemFilter) -> Optional[RowSelection]:
+        """Linhas aceitas pelo filtro (None sem filtro); ValueError para gênero desconhecido"""
+        if not item_filter:
+            return None
+        key = item_filter.key()
+        with self._lock:
+            selection = self._masks.get(key)
+            if selection is not None:
+                self._masks.move_to_end(key)
+                return selection
+
+        num_items = len(self)
+        if item_filter.genres:
+            bits = self._bits_of(item_filter.genres)
+        else:
+            bits = np.full(self.genre_bits.shape[1], 0xFF, dtype=np.uint8)
+        if item_filter.exclude_genres:
+            np.bitwise_and(bits, ~self._bits_of(item_filter.exclude_genres), out=bits)
+        mask = np.unpackbits(bits, count=num_items).view(bool)
+
+        if item_filter.year_min is not None or item_filter.year_max is not None:
+            years = self.years
+            mask &= years != UNKNOWN_YEAR
+            if item_filter.year_min is not None:
+                mask &= years >= item_filter.year_min
+            if item_filter.year_max is not None:
+                mask &= years <= item_filter.year_max
+
+        selection = RowSelection(mask)
+        with self._lock:
+            self._masks[key] = selection
+            while len(self._masks) > FACET_MASK_CACHE_ENTRIES:
+                self._masks.popitem(last=False)
+        return selection
+
+    def counts(self, selection: Optional[RowSelection] = None) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Facetas: itens por gênero e por década, dentro da seleção (ou do catálogo todo)"""
+        genre_bits = self.genre_bits
+        years = self.years
+        if selection is not None:
+            genre_bits = genre_bits & np.packbits(selection.mask)
+            years = years[selection.mask]
+        genre_counts = _POPCOUNT[genre_bits].sum(axis=1)
+        decades, decade_counts = np.unique(years[years != UNKNOWN_YEAR] // 10 * 10, return_counts=True)
+        return (
+            {genre: int(count) for genre, count in zip(self.genres, genre_counts) if count},
+            {str(decade): int(count) for decade, count in zip(decades, decade_counts)},
+        )
+
+    @classmethod
+    def build(cls, titles: Sequence[str], genres: Sequence[str]) -> "FacetIndex":
+        """Bitsets por gênero (gêneros separados por '|') e anos extraídos dos títulos"""
+        num_items = len(titles)
+        years = np.fromiter((parse_year(title) for title in titles), dtype=np.int16, count=num_items)
+
+        rows_by_genre: Dict[str, list] = {}
+        for row, value in enumerate(genres):
+            for genre in value.split("|"):
+                if genre and genre != NO_GENRE:
+                    rows_by_genre.setdefault(genre, []).append(row)
+        names = sorted(rows_by_genre)
+        genre_bits = np.zeros((len(names), (num_items + 7) // 8), dtype=np.uint8)
+        for i, name in enumerate(names):
+            mask = np.zeros(num_items, dtype=bool)
+            mask[rows_by_genre[name]] = True
+            genre_bits[i] = np.packbits(mask)
+
+        return cls(names, genre_bits, years)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "genre_bits.npy"), self.genre_bits)
+        np.save(os.path.join(path, "years.npy"), self.years)
+        with open(os.path.join(path, "genres.json"), "w") as f:
+            json.dump(self.genres, f)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> Optional["FacetIndex"]:
+        if not os.path.exists(os.path.join(path, "years.npy")):
+            return None
+        with open(os.path.join(path, "genres.json")) as f:
+            genres = json.load(f)
+        return cls(
+            genres,
+            np.load(os.path.join(path, "genre_bits.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, "years.npy"), mmap_mode=mmap_mode),
+        )
@@ -0,0 +1,327 @@
+import json
+import os
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .vectors import (
+    RowSelection, excluded_mask, load_item_vectors, save_item_vectors, to_item_vectors, top_k, top_k_in_rows,
+    top_k_masked, top_k_similar, top_k_similar_many
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = "index"
+MANIFEST_FILE = "manifest.json"
+
+# Backend usado para servir: "auto" usa o índice persistido no bundle;
+# "exact" força a busca exata (não precisa de artefato extra)
+INDEX_BACKEND = os.getenv("INDEX_BACKEND", "auto")
+# Número de listas visitadas por consulta no IVF (recall x latência)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 16))
+ASSIGN_CHUNK_ROWS = 65536
+
+
+class VectorIndex:
+    """Interface dos índices de busca sobre os vetores de itens (L2-normalizados)"""
+
+    backend = None
+
+    def __init__(self, item_vectors: sparse.csr_matrix):
+        self.item_vectors = item_vectors
+
+    def search(self, query: np.ndarray, k: int, exclude: Optional[np.ndarray] = None,
+               allowed: Optional[RowSelection] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Devolve (linhas, scores de cosseno) dos k itens mais similares, em ordem decrescente
+
+        Linhas em `exclude` (array ordenado, ex.: itens já vistos) e fora de
+        `allowed` (filtros de negócio) nunca são devolvidas; são descartadas
+        antes da seleção do top-k, então não é preciso pedir candidatos a mais.
+        """
+        raise NotImplementedError
+
+    def search_many(self, queries: np.ndarray, k: int, excludes: Sequence[Optional[np.ndarray]],
+                    allowed: Optional[RowSelection] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """`search` para várias consultas (B x D), cada uma com o seu `exclude`
+
+        Devolve o mesmo que `search` consulta a consulta; backends que sabem
+        pontuar o lote de uma vez (produto de matrizes) sobrescrevem.
+        """
+        return [self.search(query, k, exclude, allowed) for query, exclude in zip(queries, excludes)]
+
+    def params(self) -> dict:
+        return {}
+
+    def patch(self, item_vectors, old_to_new: np.ndarray, changed_rows: np.ndarray) -> "VectorIndex":
+        """Índice para o catálogo atualizado (itens adicionados/alterados)
+
+        `old_to_new` leva cada linha antiga à linha nova; `changed_rows` são
+        as linhas novas dos itens adicionados ou alterados. Backends sem
+        estrutura própria só trocam os vetores.
+        """
+        return type(self)(item_vectors)
+
+    def save_arrays(self, path: str):
+        pass
+
+    @classmethod
+    def load_arrays(cls, path: str, item_vectors, params: dict, mmap_mode: Optional[str]):
+        return cls(item_vectors)
+
+    def close(self):
+        """Libera recursos fora do processo (ex.: processos de shards); nada para índices em memória"""
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.save_arrays(path)
+        with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+            json.dump({"backend": self.backend, "params": self.params()}, f, indent=2)
+
+
+class ExactIndex(VectorIndex):
+    """Busca exata (força bruta) em numpy: um produto matriz-vetor esparso + argpartition"""
+
+    backend = "exact"
+
+    def search(self, query, k, exclude=None, allowed=None):
+        return top_k_similar(self.item_vectors, query, k, exclude, allowed)
+
+    def search_many(self, queries, k, excludes, allowed=None):
+        return top_k_similar_many(self.item_vectors, queries, k, excludes, allowed)
+
+
+class IVFIndex(VectorIndex):
+    """Índice IVF: k-means esférico particiona os itens em listas invertidas
+
+    Na consulta, só as `nprobe` listas com centróide mais próximo são pontuadas.
+    `nlist` (treino) e `nprobe` (consulta) controlam o trade-off recall x latência.
+    Os centróides são truncados nas `centroid_nnz` maiores features e guardados
+    em CSR: com vetores TF-IDF esparsos, centróides densos custariam mais que a
+    própria busca exata.
+    """
+
+    backend = "ivf"
+
+    def __init__(self, item_vectors, centroids: sparse.csr_matrix, list_offsets: np.ndarray,
+                 list_rows: np.ndarray, nprobe: int = IVF_NPROBE):
+        super().__init__(item_vectors)
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def search(self, query, k, exclude=None, allowed=None, nprobe: Optional[int] = None,
+               centroid_scores: Optional[np.ndarray] = None):
+        """Busca nas `nprobe` listas mais próximas, ampliando a sondagem se faltarem itens
+
+        Itens excluídos ou fora do filtro são mascarados antes do top-k. Se as
+        listas sondadas não tiverem k itens válidos, a sondagem dobra (só as
+        listas novas são pontuadas) até completar k ou esgotar as listas: o
+        custo acompanha k, não o tamanho do histórico. Com filtro, a sondagem
+        cresce na proporção inversa da seletividade (mesmo número esperado de
+        candidatos válidos, logo o mesmo recall); se isso pontuaria mais
+        linhas do que o filtro aceita, vira busca exata nas linhas aceitas.
+        `centroid_scores` são os scores da consulta nos centróides, quando já
+        calculados (search_many).
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        if allowed is not None:
+            nprobe = min(self.nlist, int(np.ceil(nprobe * len(self.list_rows) / max(allowed.count, 1))))
+            if allowed.count <= nprobe * len(self.list_rows) / self.nlist:
+                return top_k_in_rows(self.item_vectors, query, k, allowed.rows, exclude)
+        if centroid_scores is None:
+            centroid_scores = self.centroids @ query
+        lists = top_k(centroid_scores, nprobe)
+        order, probed = None, 0
+        rows, scores = [], []
+        valid = 0
+
+        while True:
+            candidates = self._list_rows(lists)
+            candidate_scores = np.asarray(self.item_vectors[candidates] @ query, dtype=np.float32)
+            excluded = excluded_mask(candidates, exclude)
+            if allowed is not None:
+                excluded |= ~allowed.mask[candidates]
+            candidate_scores[excluded] = -np.inf
+            rows.append(candidates)
+            scores.append(candidate_scores)
+            valid += int(candidates.size - excluded.sum())
+            if valid >= k or nprobe >= self.nlist:
+                break
+            # Raro (histórico longo ou listas pequenas): ordem completa das listas, uma vez
+            if order is None:
+                order = np.argsort(-centroid_scores, kind="stable")
+                order = order[~np.isin(order, lists)]
+            step = min(nprobe, len(order) - probed)
+            lists = order[probed:probed + step]
+            probed += step
+            nprobe += step
+
+        candidates = np.concatenate(rows) if len(rows) > 1 else rows[0]
+        candidate_scores = np.concatenate(scores) if len(scores) > 1 else scores[0]
+        best = top_k_masked(candidate_scores, k)
+        return candidates[best].astype(np.int64), candidate_scores[best]
+
+    def search_many(self, queries, k, excludes, allowed=None):
+        """Os scores nos centróides saem de um produto de matrizes para o lote inteiro"""
+        centroid_scores = np.asarray(self.centroids @ queries.T)
+        return [
+            self.search(query, k, exclude, allowed, centroid_scores=centroid_scores[:, i])
+            for i, (query, exclude) in enumerate(zip(queries, excludes))
+        ]
+
+    def _list_rows(self, lists: np.ndarray) -> np.ndarray:
+        if len(lists) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([
+            self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists
+        ])
+
+    def params(self):
+        return {"nlist": self.nlist, "nprobe": self.nprobe}
+
+    def patch(self, item_vectors, old_to_new, changed_rows):
+        """Centróides congelados: só os itens alterados são atribuídos de novo às listas"""
+        old_assignment = np.empty(len(self.list_rows), dtype=np.int64)
+        old_assignment[self.list_rows] = np.repeat(np.arange(self.nlist), np.diff(self.list_offsets))
+
+        assignment = np.empty(item_vectors.shape[0], dtype=np.int64)
+        assignment[old_to_new] = old_assignment
+        changed_rows = np.asarray(changed_rows, dtype=np.int64)
+        if changed_rows.size:
+            assignment[changed_rows] = assign_to_centroids(item_vectors[changed_rows], self.centroids)
+
+        list_offsets, list_rows = inverted_lists(assignment, self.nlist)
+        return IVFIndex(item_vectors, self.centroids, list_offsets, list_rows, self.nprobe)
+
+    def save_arrays(self, path):
+        save_item_vectors(self.centroids, os.path.join(path, "centroids"))
+        np.save(os.path.join(path, "list_offsets.npy"), self.list_offsets)
+        np.save(os.path.join(path, "list_rows.npy"), self.list_rows)
+
+    @classmethod
+    def load_arrays(cls, path, item_vectors, params, mmap_mode):
+        return cls(
+            item_vectors,
+            centroids=load_item_vectors(os.path.join(path, "centroids"), mmap_mode=mmap_mode),
+            list_offsets=np.load(os.path.join(path, "list_offsets.npy"), mmap_mode=mmap_mode),
+            list_rows=np.load(os.path.join(path, "list_rows.npy"), mmap_mode=mmap_mode),
+            nprobe=params.get("nprobe", IVF_NPROBE),
+        )
+
+    @classmethod
+    def build(cls, item_vectors, nlist: Optional[int] = None, nprobe: int = IVF_NPROBE,
+              iterations: int = 10, sample_size: int = 100000, centroid_nnz: int = 256,
+              seed: int = 42) -> "IVFIndex":
+        """Treina os centróides (k-means esférico em uma amostra) e monta as listas"""
+        num_items = item_vectors.shape[0]
+        nlist = max(1, min(nlist or int(4 * np.sqrt(num_items)), num_items))
+        rng = np.random.default_rng(seed)
+
+        sample_rows = np.sort(rng.choice(num_items, size=min(num_items, max(sample_size, nlist)), replace=False))
+        sample = item_vectors[sample_rows]
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].toarray()
+
+        for _ in range(iterations):
+            assignment = assign_to_centroids(sample, centroids)
+            members = sparse.csr_matrix(
+                (np.ones(len(assignment), dtype=np.float32), (assignment, np.arange(len(assignment)))),
+                shape=(nlist, sample.shape[0]),
+            )
+            centroids = np.asarray((members @ sample).todense(), dtype=np.float32)
+
+            # Listas vazias são re-semeadas com itens aleatórios da amostra
+            empty = np.flatnonzero(np.asarray(members.sum(axis=1)).ravel() == 0)
+            if empty.size:
+                centroids[empty] = sample[rng.choice(sample.shape[0], size=empty.size, replace=False)].toarray()
+
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.maximum(norms, 1e-12)
+
+        centroids = truncate_rows(centroids, centroid_nnz)
+        list_offsets, list_rows = inverted_lists(assign_to_centroids(item_vectors, centroids), nlist)
+
+        logger.info(f"Índice IVF treinado: {nlist} listas, maior lista com "
+                    f"{int(np.diff(list_offsets).max())} itens")
+        return cls(item_vectors, centroids, list_offsets, list_rows, nprobe)
+
+
+def inverted_lists(assignment: np.ndarray, nlist: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(offsets, linhas) das listas invertidas a partir da lista de cada item"""
+    list_rows = np.argsort(assignment, kind="stable").astype(np.int32)
+    list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=nlist), out=list_offsets[1:])
+    return list_offsets, list_rows
+
+
+def truncate_rows(matrix: np.ndarray, nnz_per_row: int) -> sparse.csr_matrix:
+    """Mantém as nnz_per_row maiores entradas de cada linha, renormalizadas (CSR)"""
+    nnz_per_row = min(nnz_per_row, matrix.shape[1])
+    keep = np.argpartition(-matrix, nnz_per_row - 1, axis=1)[:, :nnz_per_row]
+    rows = np.repeat(np.arange(matrix.shape[0]), nnz_per_row)
+    values = np.take_along_axis(matrix, keep, axis=1).ravel()
+    truncated = sparse.csr_matrix(
+        (values, (rows, keep.ravel())), shape=matrix.shape, dtype=np.float32
+    )
+    truncated.eliminate_zeros()
+    return to_item_vectors(truncated)
+
+
+def assign_to_centroids(item_vectors, centroids) -> np.ndarray:
+    """Centróide mais próximo (maior cosseno) de cada linha, em blocos"""
+    assignment = np.empty(item_vectors.shape[0], dtype=np.int64)
+    centroids_t = centroids.T.tocsc() if sparse.issparse(centroids) else np.ascontiguousarray(centroids.T)
+    for start in range(0, item_vectors.shape[0], ASSIGN_CHUNK_ROWS):
+        end = start + ASSIGN_CHUNK_ROWS
+        scores = item_vectors[start:end] @ centroids_t
+        if sparse.issparse(scores):
+            scores = scores.toarray()
+        assignment[start:end] = np.asarray(scores).argmax(axis=1)
+    return assignment
+
+
+INDEX_BACKENDS = {
+    ExactIndex.backend: ExactIndex,
+    IVFIndex.backend: IVFIndex,
+}
+
+
+def build_index(backend: str, item_vectors, **params) -> VectorIndex:
+    """Constrói um índice do backend pedido a partir dos vetores de itens"""
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Backend de índice desconhecido: {backend} (opções: {sorted(INDEX_BACKENDS)})")
+    if backend == ExactIndex.backend:
+        return ExactIndex(item_vectors)
+    return INDEX_BACKENDS[backend].build(item_vectors, **params)
+
+
+def load_index(path: str, item_vectors, backend: str = INDEX_BACKEND,
+               mmap_mode: Optional[str] = "r") -> VectorIndex:
+    """Abre o índice persistido em path; backend="exact" dispensa o artefato"""
+    if backend == ExactIndex.backend:
+        return ExactIndex(item_vectors)
+
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        if backend == "auto":
+            logger.warning(f"Índice não encontrado em {path}; usando busca exata")
+            return ExactIndex(item_vectors)
+        raise FileNotFoundError(f"Índice não encontrado: {manifest_path}")
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    if backend not in ("auto", manifest["backend"]):
+        raise ValueError(f"Bundle tem índice '{manifest['backend']}', mas INDEX_BACKEND={backend}")
+
+    index_cls = INDEX_BACKENDS[manifest["backend"]]
+    index = index_cls.load_arrays(path, item_vectors, manifest.get("params", {}), mmap_mode)
+    if isinstance(index, IVFIndex) and "IVF_NPROBE" in os.environ:
+        index.nprobe = IVF_NPROBE
+    return index
@@ -1,15 +1,33 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional
-import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.neighbors import NearestNeighbors
-import joblib
 import os
-from functools import lru_cache
+import time
+import asyncio
 import logging
-from .cache import get_cached_recommendations, cache_recommendations
+import contextvars
+from . import cache
+from .cache import (
+    connect_cache, close_cache, cache_stats, recommendation_key, single_flight,
+    get_cached_recommendations, cache_recommendations,
+    get_cached_recommendations_many, cache_recommendations_many
+)
+from .events import EventConsumer, iter_ndjson, parse_event
+from .executor import ScoringQueueFull, scoring_executor
+from .facets import ItemFilter
+from .artifacts import DEFAULT_BUNDLE_PATH
+from .batch import BATCH_MAX_USERS, recommend_batch
+from .profiles import (
+    ProfileCatalog, ProfileState, contains_rows, create_profile_store, extend_profile_state, merge_history_state,
+    unique_rows,
+)
+from .scoring import cacheable, recommend_from_state
+from .serving import MODEL_CLOSE_DELAY, MODEL_WATCH_INTERVAL, ModelReloader, ServingModel, load_serving_model, warm_up
+from .responses import RawJSONResponse, batch_body, dumps, recommendation_body
+from .metrics import RECOMMENDATIONS, CallbackCollector, instrument, registry, stage
+from .profiler import PROFILER_ENABLED, sampling_profiler
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -21,193 +39,731 @@ app = FastAPI(
     description="API de recomendação em tempo real usando MovieLens dataset"
 )
 
-# Modelos globais
-vectorizer = None
-nn_model = None
-items_df = None
-item_vectors = None
+# Modelo em serviço: bundle mapeado em memória (compartilhado entre workers),
+# índice, tabela de vizinhos e perfis da mesma versão. Trocado inteiro no reload;
+# cada requisição lê a referência uma vez.
+model: Optional[ServingModel] = None
+# Consumidor de /events (aplica interações nos perfis em micro-lotes)
+event_consumer = None
+# Reload a quente (endpoint /admin/reload e watcher da versão publicada)
+model_reloader = None
+# Worker pronto (/health/ready): serviços no ar, modelo em serviço e rotas aquecidas
+ready = False
+# Carregamento em background (MODEL_LOAD_BACKGROUND); referência mantida até terminar
+loading_task = None
+
+# Carrega o modelo depois do startup: o processo aceita conexões na hora (/health/live)
+# e só fica pronto (/health/ready) com o modelo carregado e aquecido
+MODEL_LOAD_BACKGROUND = os.getenv("MODEL_LOAD_BACKGROUND", "0") == "1"
+
+# Histogramas por etapa do pipeline (séries resolvidas uma vez, fora do caminho quente)
+CACHE_GET = stage("cache_get")
+CACHE_SET = stage("cache_set")
+PROFILE_LOAD = stage("profile_load")
+PROFILE_SAVE = stage("profile_save")
+PROFILE_SYNC = stage("profile")
+BATCH_SCORE = stage("batch_score")
+# Máximo de recomendações por pedido (num_recommendations fora de 1..máximo responde 422)
+MAX_RECOMMENDATIONS = int(os.getenv("MAX_RECOMMENDATIONS", 100))
+# user_id das requisições de aquecimento das rotas
+WARMUP_USER = "__warmup__"
+# Ligado durante warm_up_routes: as rotas pontuam e respondem, mas não gravam cache nem perfis
+warming_up = contextvars.ContextVar("warming_up", default=False)
+
+class RecommendationFilters(BaseModel):
+    # Só itens com algum destes gêneros / sem nenhum destes
+    genres: Optional[List[str]] = None
+    exclude_genres: Optional[List[str]] = None
+    # Faixa inclusiva do ano (extraído do título)
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
 
 class RecommendationRequest(BaseModel):
     user_id: str
-    item_ids: List[str]
-    num_recommendations: Optional[int] = 5
+    # Histórico completo; se omitido, usa o perfil armazenado (alimentado por /events)
+    item_ids: Optional[List[str]] = None
+    num_recommendations: int = Field(5, ge=1, le=MAX_RECOMMENDATIONS)
+    # Regras de negócio aplicadas antes do top-k
+    filters: Optional[RecommendationFilters] = None
 
 class RecommendationResponse(BaseModel):
     user_id: str
     recommendations: List[dict]
     cached: Optional[bool] = False
+    # Caminho usado: "neighbor_table" ou "vector_search" (+ "_hybrid" com o colaborativo) ou "popular"
+    strategy: Optional[str] = None
+
+class BatchRecommendationRequest(BaseModel):
+    requests: List[RecommendationRequest]
+    # Vale para os pedidos que não trazem o seu
+    num_recommendations: int = Field(5, ge=1, le=MAX_RECOMMENDATIONS)
+
+class BatchRecommendationResponse(BaseModel):
+    results: List[RecommendationResponse]
+
+def describe_model(serving: ServingModel) -> str:
+    bundle, index, neighbor_table = serving.bundle, serving.index, serving.neighbor_table
+    return (f"versão {serving.version}, {len(bundle)} itens "
+            f"(vetores {bundle.item_vectors.shape}, nnz={bundle.item_vectors.nnz}, "
+            f"índice {index.backend} {index.params()}, "
+            f"tabela de vizinhos {'k=' + str(neighbor_table.k) if neighbor_table else 'ausente'}, "
+            f"popularidade {'presente' if bundle.popularity is not None else 'ausente'}, "
+            f"colaborativo {str(bundle.collaborative.factors) + ' fatores' if bundle.collaborative else 'ausente'})")
+
+def prepare_model(path: str) -> ServingModel:
+    """Carrega e aquece uma versão para o startup ou o reload (roda fora do event loop)"""
+    serving = load_serving_model(path)
+    # Perfis sobrevivem ao reload: os de outra versão são refeitos pelos ids dos itens na leitura
+    previous = model.profile_store if model is not None else None
+    serving.profile_store = create_profile_store(cache.redis_client, ProfileCatalog.of(serving.bundle), previous)
+    warm_up(serving, lambda m, state: recommend_from_state(m, state, 10))
+    logger.info(f"Modelo pronto: {describe_model(serving)}")
+    return serving
+
+def swap_model(serving: ServingModel):
+    """Instala o modelo: uma atribuição, vista de uma vez por todas as requisições novas"""
+    global model
+    previous, model = model, serving
+    # As chaves do cache levam a versão: o L1 só teria entradas órfãs
+    cache.local_cache.clear()
+    if previous is not None:
+        # Requisições em andamento ainda usam o anterior (ex.: shards): fecha depois de um tempo
+        asyncio.get_running_loop().call_later(MODEL_CLOSE_DELAY, previous.close)
+
+def preload_model(path: str = DEFAULT_BUNDLE_PATH):
+    """Carrega e aquece o modelo no processo pai, antes do fork dos workers (app.server)
+
+    O que vive no heap Python (dict id -> linha, manifesto, índices) passa a
+    ser compartilhado copy-on-write pelos workers em vez de recriado em cada um.
+    """
+    global model
+    model = load_serving_model(path)
+    warm_up(model, lambda m, state: recommend_from_state(m, state, 10))
+    logger.info(f"Modelo pré-carregado: {describe_model(model)}")
+
+async def asgi_request(method: str, path: str, body=None) -> int:
+    """Uma requisição pelo app ASGI (middlewares, rota, resposta) sem passar por socket; devolve o status"""
+    messages = [{"type": "http.request", "body": dumps(body) if body is not None else b"", "more_body": False}]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+        "method": method, "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"localhost"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 0),
+    }
+    statuses = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await app(scope, receive, send)
+    return statuses[0] if statuses else 0
+
+async def warm_up_routes():
+    """Aquece as rotas principais pelo app ASGI inteiro, sem socket
+
+    O aquecimento do modelo cobre o scoring; a primeira chamada de cada rota
+    ainda paga o que o FastAPI e o executor montam sob demanda (contexto do
+    endpoint, validação, threads de scoring, serialização). As requisições
+    usam itens populares e aparecem em /metrics como as demais, mas rodam
+    com `warming_up` ligado: nada vai para o cache nem para o store de
+    perfis (compartilhados com os outros workers via Redis).
+    """
+    serving = model
+    rows, _ = serving.bundle.popular(5)
+    item_ids = [str(serving.bundle.catalog.item_ids[row]) for row in rows]
+    genres = serving.bundle.popularity.genres[:1] if serving.bundle.popularity is not None else []
+    requests = [
+        ("POST", "/recommend", {"user_id": WARMUP_USER, "item_ids": item_ids[:1], "num_recommendations": 10}),
+        ("POST", "/recommend", {"user_id": WARMUP_USER, "item_ids": item_ids, "num_recommendations": 10,
+                                "filters": {"genres": genres, "year_min": 1900}}),
+        ("POST", "/recommend", {"user_id": WARMUP_USER, "num_recommendations": 10}),
+        ("POST", "/recommend/batch", {"requests": [{"user_id": WARMUP_USER, "item_ids": item_ids}],
+                                      "num_recommendations": 10}),
+        ("GET", "/items/popular", None),
+        ("GET", f"/items/{item_ids[0]}" if item_ids else "/items", None),
+        ("GET", "/items", None),
+    ]
+    start = time.perf_counter()
+    statuses = []
+    token = warming_up.set(True)
+    try:
+        for method, path, body in requests:
+            try:
+                statuses.append(await asgi_request(method, path, body))
+            except Exception as e:
+                # O ServerErrorMiddleware repassa a exceção depois do 500: aquecimento não derruba o worker
+                logger.warning(f"Aquecimento de {method} {path} falhou: {e}")
+                statuses.append(500)
+    finally:
+        warming_up.reset(token)
+    logger.info(f"Rotas aquecidas em {time.perf_counter() - start:.3f}s (status {statuses})")
 
-@app.on_event("startup")
 async def load_models():
-    global vectorizer, nn_model, items_df, item_vectors
-    
+    """Carrega e aquece a versão publicada fora do event loop e a coloca em serviço
+
+    Em background (MODEL_LOAD_BACKGROUND=1) um bundle ausente ou inválido não
+    derruba o processo: ele segue vivo, não pronto, e tenta de novo até um
+    modelo ser publicado.
+    """
+    while True:
+        try:
+            logger.info("Carregando modelos...")
+            swap_model(await asyncio.to_thread(prepare_model, DEFAULT_BUNDLE_PATH))
+            return
+        except Exception as e:
+            logger.error(f"Erro ao carregar modelos: {e}")
+            logger.error("Execute primeiro: python train_model.py")
+            if not MODEL_LOAD_BACKGROUND:
+                raise
+            await asyncio.sleep(MODEL_WATCH_INTERVAL or 10)
+
+async def serve_model(load: bool):
+    """Com os serviços no ar: carrega o modelo (se preciso), aquece as rotas e marca o worker pronto"""
+    global ready
+    if load:
+        await load_models()
+    await warm_up_routes()
+    ready = True
+    model_reloader.start()
+
+@app.on_event("startup")
+async def start_services():
+    global event_consumer, model_reloader, loading_task
+    await connect_cache()
+    scoring_executor.start()
+    if PROFILER_ENABLED:
+        sampling_profiler.start()
+    event_consumer = EventConsumer(apply_events)
+    event_consumer.start()
+    model_reloader = ModelReloader(lambda: model, prepare_model, swap_model, DEFAULT_BUNDLE_PATH)
+    if model is not None:
+        # Pré-carregado e aquecido pelo processo pai (app.server): herdado no fork
+        model.profile_store = create_profile_store(cache.redis_client, ProfileCatalog.of(model.bundle))
+        logger.info(f"Usando modelo pré-carregado (versão {model.version}, perfis: backend "
+                    f"{model.profile_store.backend})")
+        await serve_model(load=False)
+    elif MODEL_LOAD_BACKGROUND:
+        loading_task = asyncio.get_running_loop().create_task(serve_model(load=True))
+    else:
+        await serve_model(load=True)
+
+@app.on_event("shutdown")
+async def stop_services():
+    global ready
+    ready = False
+    if loading_task is not None:
+        loading_task.cancel()
+    if model_reloader is not None:
+        await model_reloader.stop()
+    if event_consumer is not None:
+        await event_consumer.stop()
+    scoring_executor.shutdown()
+    sampling_profiler.stop()
+    await close_cache()
+    if model is not None:
+        model.close()
+
+def resolve_filters(serving: ServingModel, item_filter: ItemFilter):
+    """Filtro da requisição -> linhas aceitas (RowSelection), None sem filtro; 400 se inválido"""
+    if not item_filter:
+        return None
+    if serving.bundle.facets is None:
+        raise HTTPException(status_code=400, detail="Filtros não disponíveis neste modelo (retreine o bundle)")
     try:
-        logger.info("Carregando modelos...")
-        
-        # Verificar se modelos existem
-        model_files = [
-            "models/tfidf_vectorizer.pkl",
-            "models/nearest_neighbors.pkl", 
-            "models/items_df.pkl",
-            "models/item_vectors.pkl"
+        return serving.bundle.facets.select(item_filter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def request_filter(request: RecommendationRequest) -> ItemFilter:
+    filters = request.filters
+    if filters is None:
+        return ItemFilter()
+    return ItemFilter(filters.genres, filters.exclude_genres, filters.year_min, filters.year_max)
+
+def compute_recommendations(serving: ServingModel, history_rows: np.ndarray, num_recommendations: int,
+                            profile_state=None, allowed=None):
+    """Scoring CPU-bound de /recommend: devolve (resultado JSON, estratégia, estado a salvar, mudou?)
+
+    Roda fora do event loop, no executor de scoring. O perfil vem do estado
+    incremental do usuário: só a diferença entre o histórico e o perfil
+    armazenado é somada (ou subtraída). O estado a salvar é a união do
+    perfil armazenado com o histórico (os itens vindos de /events não se
+    perdem).
+    """
+    with PROFILE_SYNC.time():
+        history_state, profile_state, changed = merge_history_state(
+            profile_state, serving.bundle.item_vectors, history_rows
+        )
+    result, strategy = recommend_from_state(serving, history_state, num_recommendations, allowed)
+    return result, strategy, profile_state, changed
+
+def compute_batch_recommendations(serving: ServingModel, groups: list):
+    """Scoring CPU-bound de /recommend/batch (roda no executor de scoring)
+
+    `groups` traz (históricos, k, allowed) dos pedidos com o mesmo k e o
+    mesmo filtro: um `recommend_batch` por grupo. Cada histórico são as
+    linhas dos item_ids ou, para pedidos só com user_id, o perfil armazenado.
+    """
+    with BATCH_SCORE.time():
+        return [
+            recommend_batch(serving, histories, num_recommendations, allowed)
+            for histories, num_recommendations, allowed in groups
         ]
-        
-        for file in model_files:
-            if not os.path.exists(file):
-                raise FileNotFoundError(f"Modelo não encontrado: {file}")
-        
-        # Carregar modelos salvos
-        vectorizer = joblib.load("models/tfidf_vectorizer.pkl")
-        nn_model = joblib.load("models/nearest_neighbors.pkl")
-        items_df = pd.read_pickle("models/items_df.pkl")
-        item_vectors = joblib.load("models/item_vectors.pkl")
-        
-        logger.info(f"Modelos carregados com sucesso! {len(items_df)} itens disponíveis")
-        
-    except Exception as e:
-        logger.error(f"Erro ao carregar modelos: {e}")
-        logger.error("Execute primeiro: python train_model.py")
-        raise
-
-@lru_cache(maxsize=1000)
-def get_user_profile_vector(item_ids_tuple: tuple) -> np.ndarray:
-    """Calcula vetor de perfil do usuário baseado no histórico"""
-    item_indices = []
+
+def apply_event_batch(serving: ServingModel, user_ids: List[str], item_ids_lists: List[List[str]], states: list):
+    """Soma os itens de cada usuário ao seu perfil; devolve (estados alterados, eventos válidos)"""
+    changed, applied = [], 0
+    for user_id, item_ids, state in zip(user_ids, item_ids_lists, states):
+        rows = serving.bundle.catalog.rows_of(item_ids)
+        applied += len(rows)
+        state, updated = extend_profile_state(state, serving.bundle.item_vectors, rows)
+        if updated:
+            changed.append((user_id, state))
+    return changed, applied
+
+async def remember_history(serving: ServingModel, user_id: str, history_rows: np.ndarray):
+    """Acrescenta ao perfil um histórico cujo resultado veio pronto (cache ou single-flight)"""
+    if warming_up.get():
+        return
+    with PROFILE_LOAD.time():
+        state = await serving.profile_store.get(user_id)
+    # Caso comum: o perfil já tem o histórico todo e não há o que somar
+    if (state is not None and state.total.shape[0] == serving.bundle.item_vectors.shape[1]
+            and contains_rows(state, history_rows)):
+        return
+    try:
+        state, changed = await scoring_executor.run(
+            extend_profile_state, state, serving.bundle.item_vectors, history_rows
+        )
+    except ScoringQueueFull:
+        # O resultado já está pronto: sob sobrecarga o perfil espera o próximo pedido
+        return
+    if changed:
+        with PROFILE_SAVE.time():
+            await serving.profile_store.put(user_id, state)
+
+async def apply_events(events: list) -> int:
+    """Aplica um micro-lote de /events: um MGET, um scoring e um pipeline de escrita"""
+    by_user = {}
+    for user_id, item_id, _ in events:
+        by_user.setdefault(user_id, []).append(item_id)
+    user_ids = list(by_user)
+    serving = model
+    states = await serving.profile_store.get_many(user_ids)
     
-    for item_id in item_ids_tuple:
+    while True:
         try:
-            item_id_int = int(item_id)
-            if item_id_int in items_df.index:
-                idx = items_df.index.get_loc(item_id_int)
-                item_indices.append(idx)
-        except (ValueError, KeyError):
-            continue
-    
-    if not item_indices:
-        logger.warning(f"Nenhum item válido encontrado no histórico: {item_ids_tuple}")
-        return np.zeros(item_vectors.shape[1])
+            changed, applied = await scoring_executor.run(
+                apply_event_batch, serving, user_ids, [by_user[u] for u in user_ids], states
+            )
+            break
+        except ScoringQueueFull:
+            # Ingestão é assíncrona: cede a vez às requisições e tenta de novo
+            await asyncio.sleep(0.01)
     
-    # Média dos vetores dos itens do histórico
-    user_vectors = item_vectors[item_indices]
-    return np.mean(user_vectors, axis=0)
+    await serving.profile_store.put_many(changed)
+    return applied
+
+def serving_model() -> ServingModel:
+    """Modelo em serviço; 503 enquanto ele ainda carrega (MODEL_LOAD_BACKGROUND)"""
+    serving = model
+    if serving is None:
+        raise HTTPException(status_code=503, detail="Modelo ainda carregando, tente novamente",
+                            headers={"Retry-After": "1"})
+    return serving
+
+def overloaded(e: ScoringQueueFull) -> HTTPException:
+    """Load shedding: recusa rápido em vez de enfileirar sem limite"""
+    logger.warning(str(e))
+    return HTTPException(status_code=429, detail="Servidor sobrecarregado, tente novamente",
+                         headers={"Retry-After": "1"})
 
 @app.post("/recommend", response_model=RecommendationResponse)
 async def recommend_items(request: RecommendationRequest):
-    """Endpoint principal de recomendação"""
+    """Endpoint principal de recomendação
+
+    O corpo é montado em bytes a partir do resultado cacheado (L1, Redis ou
+    recém-calculado): nada passa por json.loads nem pelo modelo pydantic.
+    """
+    serving = serving_model()
+    item_filter = request_filter(request)
+    allowed = resolve_filters(serving, item_filter)
+    if request.item_ids is None:
+        return await recommend_for_user(serving, request, item_filter, allowed)
+    
     try:
-        # Verificar cache primeiro
-        cached_result = get_cached_recommendations(request.user_id, request.item_ids)
+        # Verificar cache primeiro (L1 em processo, depois Redis); a chave são as
+        # linhas do histórico, então usuários com o mesmo histórico compartilham a entrada
+        history_rows = unique_rows(serving.bundle.catalog.rows_of(request.item_ids))
+        cache_key = recommendation_key(history_rows, request.num_recommendations, serving.version,
+                                       item_filter.key())
+        with CACHE_GET.time():
+            cached_result = await get_cached_recommendations(cache_key)
         if cached_result:
             logger.info(f"Retornando recomendações do cache para usuário {request.user_id}")
-            return RecommendationResponse(**cached_result, cached=True)
+            await remember_history(serving, request.user_id, history_rows)
+            return RawJSONResponse(recommendation_body(request.user_id, cached_result, cached=True))
         
-        # Converter lista para tupla para usar com cache
-        item_ids_tuple = tuple(request.item_ids)
+        leader = False
         
-        # Obter vetor de perfil do usuário
-        user_profile = get_user_profile_vector(item_ids_tuple)
-        
-        # Verificar se o perfil é válido
-        if np.all(user_profile == 0):
-            # Retornar itens populares se não há histórico válido
-            popular_items = items_df.head(request.num_recommendations)
-            recommendations = []
-            for idx, (item_id, item_data) in enumerate(popular_items.iterrows()):
-                recommendations.append({
-                    "item_id": str(item_id),
-                    "title": item_data.get("title", ""),
-                    "genres": item_data.get("genres", ""),
-                    "score": 1.0 - (idx * 0.1)
-                })
-        else:
-            # Encontrar itens similares
-            distances, indices = nn_model.kneighbors(
-                [user_profile], 
-                n_neighbors=min(request.num_recommendations * 3, len(items_df))
+        async def compute_and_cache():
+            nonlocal leader
+            leader = True
+            with PROFILE_LOAD.time():
+                profile_state = await serving.profile_store.get(request.user_id)
+            result, strategy, profile_state, changed = await scoring_executor.run(
+                compute_recommendations, serving, history_rows, request.num_recommendations, profile_state,
+                allowed
             )
+            RECOMMENDATIONS.labels(strategy).inc()
+            if changed and not warming_up.get():
+                with PROFILE_SAVE.time():
+                    await serving.profile_store.put(request.user_id, profile_state)
             
-            # Filtrar itens já vistos
-            recommendations = []
-            seen_items = set(request.item_ids)
+            # Salvar no cache
+            if cacheable(strategy) and not warming_up.get():
+                with CACHE_SET.time():
+                    await cache_recommendations(cache_key, result)
             
-            for i, idx in enumerate(indices[0]):
-                item_id = items_df.iloc[idx].name
-                if str(item_id) not in seen_items:
-                    item_data = items_df.iloc[idx]
-                    recommendations.append({
-                        "item_id": str(item_id),
-                        "title": item_data.get("title", ""),
-                        "genres": item_data.get("genres", ""),
-                        "score": float(1 - distances[0][i])
-                    })
-                    
-                    if len(recommendations) >= request.num_recommendations:
-                        break
+            logger.info(f"Geradas recomendações para usuário {request.user_id} ({strategy})")
+            return result
         
-        result = {
-            "user_id": request.user_id,
-            "recommendations": recommendations
-        }
+        # Misses concorrentes com a mesma chave calculam uma única vez; quem
+        # aproveitou o cálculo de outro usuário ainda guarda o próprio perfil
+        result = await single_flight.run(cache_key, compute_and_cache)
+        if not leader:
+            await remember_history(serving, request.user_id, history_rows)
+        return RawJSONResponse(recommendation_body(request.user_id, result, cached=False))
+        
+    except ScoringQueueFull as e:
+        raise overloaded(e)
+    except Exception as e:
+        logger.error(f"Erro ao gerar recomendações: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def recommend_for_user(serving: ServingModel, request: RecommendationRequest,
+                             item_filter: ItemFilter, allowed) -> RawJSONResponse:
+    """/recommend só com user_id: usa o perfil armazenado, sem reenviar o histórico"""
+    try:
+        with PROFILE_LOAD.time():
+            profile_state = await serving.profile_store.get(request.user_id)
+        if profile_state is None:
+            profile_state = ProfileState.empty(serving.bundle.item_vectors.shape[1])
+        
+        cache_key = recommendation_key(profile_state.rows, request.num_recommendations, serving.version,
+                                       item_filter.key())
+        with CACHE_GET.time():
+            cached_result = await get_cached_recommendations(cache_key)
+        if cached_result:
+            return RawJSONResponse(recommendation_body(request.user_id, cached_result, cached=True))
         
-        # Salvar no cache
-        cache_recommendations(request.user_id, request.item_ids, result)
+        async def compute_and_cache():
+            result, strategy = await scoring_executor.run(
+                recommend_from_state, serving, profile_state, request.num_recommendations, allowed
+            )
+            RECOMMENDATIONS.labels(strategy).inc()
+            if cacheable(strategy) and not warming_up.get():
+                with CACHE_SET.time():
+                    await cache_recommendations(cache_key, result)
+            return result
         
-        logger.info(f"Geradas {len(recommendations)} recomendações para usuário {request.user_id}")
-        return RecommendationResponse(**result, cached=False)
+        result = await single_flight.run(cache_key, compute_and_cache)
+        return RawJSONResponse(recommendation_body(request.user_id, result, cached=False))
         
+    except ScoringQueueFull as e:
+        raise overloaded(e)
     except Exception as e:
         logger.error(f"Erro ao gerar recomendações: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/recommend/batch", response_model=BatchRecommendationResponse)
+async def recommend_items_batch(request: BatchRecommendationRequest):
+    """Recomendações para vários usuários em uma chamada (scoring vetorizado)
+
+    Os pedidos com o mesmo `num_recommendations` e os mesmos filtros são
+    pontuados juntos pelo scoring de /recommend (os perfis que vão ao índice
+    viram uma matriz); cada usuário recebe o mesmo resultado que /recommend
+    daria ao seu histórico, e as chaves de cache são as mesmas. O cache
+    Redis é lido e escrito em pipeline para o lote inteiro. O
+    `num_recommendations` do lote vale para os pedidos que não trazem o seu.
+    """
+    if len(request.requests) > BATCH_MAX_USERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Lote com {len(request.requests)} usuários excede o máximo de {BATCH_MAX_USERS}"
+        )
+    
+    serving = serving_model()
+    namespace = serving.version
+    # k e filtro de cada pedido; filtros iguais resolvem uma vez (LRU das facetas)
+    ks = [r.num_recommendations if "num_recommendations" in r.model_fields_set else request.num_recommendations
+          for r in request.requests]
+    item_filters = [request_filter(r) for r in request.requests]
+    allowed = [resolve_filters(serving, item_filter) for item_filter in item_filters]
+    try:
+        # Pedidos sem item_ids usam o perfil armazenado (um MGET para o lote)
+        profile_users = [r.user_id for r in request.requests if r.item_ids is None]
+        with PROFILE_LOAD.time():
+            stored = (dict(zip(profile_users, await serving.profile_store.get_many(profile_users)))
+                      if profile_users else {})
+        empty = ProfileState.empty(serving.bundle.item_vectors.shape[1])
+        histories = [
+            unique_rows(serving.bundle.catalog.rows_of(r.item_ids)) if r.item_ids is not None
+            else (stored.get(r.user_id) or empty)
+            for r in request.requests
+        ]
+        cache_keys = [
+            recommendation_key(history.rows if isinstance(history, ProfileState) else history, k, namespace,
+                               item_filter.key())
+            for history, k, item_filter in zip(histories, ks, item_filters)
+        ]
+        with CACHE_GET.time():
+            cached_results = await get_cached_recommendations_many(cache_keys)
+        misses = [i for i, cached in enumerate(cached_results) if cached is None]
+        
+        results = [
+            recommendation_body(r.user_id, cached, cached=True) if cached else None
+            for r, cached in zip(request.requests, cached_results)
+        ]
+        
+        groups = {}
+        for i in misses:
+            groups.setdefault((ks[i], item_filters[i].key()), []).append(i)
+        computed = await scoring_executor.run(
+            compute_batch_recommendations,
+            serving,
+            [([histories[i] for i in members], ks[members[0]], allowed[members[0]]) for members in groups.values()]
+        )
+        
+        to_cache = []
+        for members, group_results in zip(groups.values(), computed):
+            for i, (result, strategy) in zip(members, group_results):
+                results[i] = recommendation_body(request.requests[i].user_id, result, cached=False)
+                if cacheable(strategy):
+                    to_cache.append((cache_keys[i], result))
+                RECOMMENDATIONS.labels(strategy).inc()
+        
+        if not warming_up.get():
+            with CACHE_SET.time():
+                await cache_recommendations_many(to_cache)
+        
+        logger.info(f"Lote de {len(results)} usuários: {len(results) - len(misses)} do cache, "
+                    f"{len(misses)} calculados")
+        return RawJSONResponse(batch_body(results))
+        
+    except ScoringQueueFull as e:
+        raise overloaded(e)
+    except Exception as e:
+        logger.error(f"Erro ao gerar recomendações em lote: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/events", status_code=202)
+async def ingest_events(request: Request):
+    """Ingestão de interações em NDJSON (uma por linha: {"user_id", "item_id"})
+
+    O corpo é lido em streaming e os eventos vão para uma fila; o consumidor
+    em background os aplica nos perfis em micro-lotes. Com a fila cheia a
+    leitura do corpo espera (backpressure). Itens desconhecidos são ignorados
+    na aplicação e contados em /events/stats.
+    """
+    # Sem modelo não há catálogo para validar os itens: o cliente reenvia depois
+    serving_model()
+    accepted = rejected = 0
+    async for line in iter_ndjson(request.stream()):
+        event = parse_event(line)
+        if event is None:
+            rejected += 1
+            continue
+        await event_consumer.submit(*event)
+        accepted += 1
+    
+    return {"accepted": accepted, "rejected": rejected}
+
+@app.get("/events/stats")
+async def get_event_stats():
+    """Eventos recebidos/aplicados, tamanho da fila e lag de frescor (p50/p99)"""
+    return event_consumer.stats()
+
+@app.get("/items/popular")
+async def list_popular_items(limit: int = 20, genre: Optional[str] = None):
+    """Itens mais bem avaliados (média bayesiana), opcionalmente de um gênero"""
+    bundle = serving_model().bundle
+    if genre is None:
+        rows, scores = bundle.popular(max(limit, 0))
+    elif bundle.popularity is None:
+        raise HTTPException(status_code=404, detail="Ranking de popularidade não disponível neste modelo")
+    else:
+        top = bundle.popularity.top(max(limit, 0), genre)
+        if top is None:
+            raise HTTPException(status_code=404, detail=f"Gênero não encontrado: {genre}")
+        rows, scores = top[0].tolist(), top[1].tolist()
+    
+    return RawJSONResponse(
+        b'{"items":' + bundle.catalog.items_json(rows, scores) + b',"genre":' + dumps(genre) + b"}"
+    )
+
 @app.get("/items/{item_id}")
 async def get_item(item_id: str):
     """Buscar informações de um item específico"""
+    catalog = serving_model().bundle.catalog
+    row = catalog.row_of(item_id)
+    if row is not None:
+        return RawJSONResponse(catalog.item_json_bytes(row))
     try:
-        item_id_int = int(item_id)
-        if item_id_int in items_df.index:
-            item_data = items_df.loc[item_id_int]
-            return {
-                "item_id": item_id,
-                "title": item_data.get("title", ""),
-                "genres": item_data.get("genres", "")
-            }
-        else:
-            raise HTTPException(status_code=404, detail="Item não encontrado")
+        int(item_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="ID do item deve ser um número")
+    raise HTTPException(status_code=404, detail="Item não encontrado")
 
 @app.get("/items")
-async def list_items(limit: int = 20, offset: int = 0):
-    """Listar itens disponíveis"""
-    items = items_df.iloc[offset:offset+limit]
-    return {
-        "items": [
-            {
-                "item_id": str(idx),
-                "title": row.get("title", ""),
-                "genres": row.get("genres", "")
-            }
-            for idx, row in items.iterrows()
-        ],
-        "total": len(items_df),
-        "offset": offset,
-        "limit": limit
-    }
+async def list_items(limit: int = Query(20, ge=0), offset: int = Query(0, ge=0), genre: Optional[List[str]] = Query(None),
+                     exclude_genre: Optional[List[str]] = Query(None), year_min: Optional[int] = None,
+                     year_max: Optional[int] = None, facets: bool = False):
+    """Listar itens disponíveis, opcionalmente filtrados por gênero e ano
+
+    Com `facets=true` a resposta traz as contagens por gênero e por década
+    dos itens que passam no filtro.
+    """
+    serving = serving_model()
+    bundle = serving.bundle
+    allowed = resolve_filters(serving, ItemFilter(genre, exclude_genre, year_min, year_max))
+    if allowed is None:
+        total = len(bundle)
+        rows = range(offset, min(offset + limit, total))
+    else:
+        total = allowed.count
+        rows = allowed.rows[offset:offset + limit].tolist()
+    
+    body = (b'{"items":' + bundle.catalog.items_json(rows)
+            + b',"total":%d,"offset":%d,"limit":%d' % (total, offset, limit))
+    if facets:
+        if bundle.facets is None:
+            raise HTTPException(status_code=400, detail="Facetas não disponíveis neste modelo (retreine o bundle)")
+        genre_counts, decade_counts = bundle.facets.counts(allowed)
+        body += b',"facets":' + dumps({"genres": genre_counts, "decades": decade_counts})
+    return RawJSONResponse(body + b"}")
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hits/misses por camada de cache (L1 em processo, L2 Redis) e coalescências"""
+    return cache_stats()
+
+@app.post("/admin/reload")
+async def reload_model(force: bool = False):
+    """Recarrega a versão publicada do bundle sem derrubar o worker
+
+    A versão nova é carregada e aquecida em background; só então a referência
+    servida é trocada. Sem versão nova (e sem force) nada acontece. Se a carga
+    falhar, a versão atual continua servindo.
+    """
+    try:
+        return await model_reloader.reload(force=force)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Falha ao recarregar o modelo: {e}")
+
+def collect_runtime_metrics():
+    """Estatísticas já mantidas pelos componentes, lidas só no scrape de /metrics"""
+    serving = model
+    stats = cache_stats()
+    yield ("cache_hits", "counter", "Hits do cache de recomendações por camada",
+           [({"tier": tier}, stats[tier]["hits"]) for tier in ("l1", "l2")])
+    yield ("cache_misses", "counter", "Misses do cache de recomendações por camada",
+           [({"tier": tier}, stats[tier]["misses"]) for tier in ("l1", "l2")])
+    yield ("cache_hit_ratio", "gauge", "Fração de hits do cache por camada",
+           [({"tier": tier}, stats[tier]["hit_ratio"]) for tier in ("l1", "l2")])
+    yield ("cache_l1_entries", "gauge", "Entradas no cache L1", [({}, stats["l1"]["size"])])
+    yield ("cache_l1_evictions", "counter", "Entradas removidas do L1 por LRU", [({}, stats["l1"]["evictions"])])
+    yield ("cache_coalesced", "counter", "Misses coalescidos pelo single-flight", [({}, stats["coalesced"])])
+    
+    scoring = scoring_executor.stats()
+    yield ("scoring_pending", "gauge", "Tarefas de scoring em execução ou na fila", [({}, scoring["pending"])])
+    yield ("scoring_rejected", "counter", "Requisições recusadas com a fila cheia (429)", [({}, scoring["rejected"])])
+    
+    if serving is not None and serving.profile_store is not None:
+        profiles = serving.profile_store.stats()
+        backend = {"backend": serving.profile_store.backend}
+        yield ("profile_hits", "counter", "Perfis encontrados no store", [(backend, profiles["hits"])])
+        yield ("profile_misses", "counter", "Perfis ausentes no store", [(backend, profiles["misses"])])
+        yield ("profile_hit_ratio", "gauge", "Fração de leituras de perfil com hit", [(backend, profiles["hit_ratio"])])
+        yield ("profile_migrated", "counter", "Perfis de outra versão do modelo refeitos na leitura",
+               [(backend, profiles["migrated"])])
+    
+    if event_consumer is not None:
+        events = event_consumer.stats()
+        yield ("events_applied", "counter", "Eventos aplicados nos perfis", [({}, events["applied"])])
+        yield ("events_queued", "gauge", "Eventos na fila do consumidor", [({}, events["queued"])])
+        yield ("events_lag_p99_seconds", "gauge", "Lag de frescor p99 dos eventos",
+               [({}, events["lag_p99_ms"] / 1000 if events["lag_p99_ms"] is not None else None)])
+    
+    if serving is not None:
+        yield ("model_info", "gauge", "Versão do modelo em serviço",
+               [({"version": serving.version, "index": serving.index.backend}, 1)])
+        yield ("model_items", "gauge", "Itens no catálogo do modelo em serviço", [({}, len(serving.bundle))])
+    yield ("profiler_running", "gauge", "Profiler por amostragem ligado", [({}, int(sampling_profiler.running))])
+
+registry.register(CallbackCollector(collect_runtime_metrics))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas no formato de exposição do Prometheus
+
+    Histogramas por etapa do pipeline e por rota, requisições em voo e as
+    estatísticas de cache, scoring, perfis e eventos (lidas só no scrape).
+    """
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/admin/profiler")
+async def toggle_profiler(enabled: bool = True, interval_ms: Optional[float] = None):
+    """Liga ou desliga o profiler por amostragem sem reiniciar o worker (ligar zera as amostras)"""
+    if enabled:
+        sampling_profiler.start(interval_ms)
+    else:
+        sampling_profiler.stop()
+    return sampling_profiler.stats()
+
+@app.get("/admin/profiler")
+async def get_profile(limit: int = 200):
+    """Pilhas mais amostradas no formato collapsed (flamegraph.pl, speedscope)"""
+    return Response(sampling_profiler.collapsed(max(limit, 1)), media_type="text/plain; charset=utf-8")
 
 @app.get("/health")
 async def health_check():
     """Verificar saúde da API"""
+    serving = model
     return {
         "status": "healthy", 
-        "models_loaded": all([
-            vectorizer is not None,
-            nn_model is not None, 
-            items_df is not None,
-            item_vectors is not None
-        ]),
-        "total_items": len(items_df) if items_df is not None else 0
+        "pid": os.getpid(),
+        "models_loaded": serving is not None,
+        "index": serving.index.backend if serving is not None else None,
+        "model_version": serving.version if serving is not None else None,
+        "model_created_at": serving.bundle.manifest.get("created_at") if serving is not None else None,
+        "total_items": len(serving.bundle) if serving is not None else 0,
+        "scoring": scoring_executor.stats(),
+        "reload": model_reloader.stats() if model_reloader is not None else None
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: o processo responde (não depende do modelo nem do Redis)"""
+    return {"status": "alive", "pid": os.getpid()}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: startup concluído e modelo carregado e aquecido; 503 até lá
+
+    Para o balanceador só mandar tráfego a workers cuja primeira requisição
+    já tem a latência de regime (o aquecimento roda antes do modelo entrar
+    em serviço).
+    """
+    serving = model
+    if serving is None or not ready:
+        return JSONResponse(status_code=503, content={"status": "loading", "pid": os.getpid()})
+    return {"status": "ready", "pid": os.getpid(), "model_version": serving.version}
+
 @app.get("/")
 async def root():
     """Endpoint raiz com informações da API"""
@@ -216,8 +772,20 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "recommend": "POST /recommend - Gerar recomendações",
+            "recommend_batch": "POST /recommend/batch - Recomendações para vários usuários",
+            "events": "POST /events - Ingestão de interações (NDJSON)",
             "items": "GET /items - Listar itens",
+            "popular": "GET /items/popular - Itens mais bem avaliados (por gênero)",
             "item": "GET /items/{item_id} - Buscar item específico",
-            "health": "GET /health - Status da API"
+            "cache_stats": "GET /cache/stats - Estatísticas do cache",
+            "reload": "POST /admin/reload - Recarregar o modelo publicado (sem downtime)",
+            "metrics": "GET /metrics - Métricas no formato Prometheus",
+            "profiler": "POST/GET /admin/profiler - Profiler por amostragem",
+            "health": "GET /health - Status da API",
+            "live": "GET /health/live - Liveness (processo respondendo)",
+            "ready": "GET /health/ready - Readiness (modelo carregado e aquecido)"
         }
-    }
\ No newline at end of file
+    }
+
+# Depois de todas as rotas: o middleware precisa conhecer os templates
+instrument(app)
\ No newline at end of file
@@ -0,0 +1,289 @@
+import os
+import threading
+import time
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Métricas ficam ligadas em produção; 0 desliga coleta e middleware (para comparar overhead)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+PREFIX = "recommender_"
+# Buckets (s) das etapas: de 50µs (hit no L1) a 2.5s (lote grande)
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Métrica com labels; cada combinação de valores é uma série criada sob demanda"""
+
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, series in sorted(self._series.items()):
+            lines.extend(self._render_series(values, series))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_series(self):
+        return _Value()
+
+    def _render_series(self, values, series):
+        return [f"{self.name}_total{_format_labels(self.label_names, values)} {_format_value(series.value)}"]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def _render_series(self, values, series):
+        return [f"{self.name}{_format_labels(self.label_names, values)} {_format_value(series.value)}"]
+
+
+class _HistogramSeries:
+    """Contagens por bucket + soma; observe é um bisect e três somas sob um lock"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        if not METRICS_ENABLED:
+            return
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> "_Timer":
+        """Context manager que observa a duração do bloco"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("series", "start")
+
+    def __init__(self, series: _HistogramSeries):
+        self.series = series
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.series.observe(time.perf_counter() - self.start)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def _render_series(self, values, series):
+        with series._lock:
+            counts, total, count = list(series.counts), series.sum, series.count
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class CallbackCollector:
+    """Métricas lidas na hora do scrape a partir de uma função (estatísticas já existentes)
+
+    `collect` devolve [(nome, tipo, ajuda, [(labels, valor)])]; nada é contado no
+    caminho das requisições. Valores None (ainda sem dados) são omitidos.
+    """
+
+    def __init__(self, collect: Callable[[], Iterable[Tuple[str, str, str, List[Tuple[dict, float]]]]]):
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = []
+        for name, metric_type, help, samples in self.collect():
+            name = PREFIX + name
+            sample_name = name + "_total" if metric_type == "counter" else name
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {metric_type}"])
+            for labels, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"{sample_name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        """Formato texto de exposição do Prometheus (versão 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "stage_seconds", "Tempo por etapa do pipeline de recomendação", ["stage"]
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "request_seconds", "Latência das requisições HTTP por rota e status", ["method", "route", "status"]
+))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "requests_in_flight", "Requisições HTTP em andamento por rota", ["route"]
+))
+RECOMMENDATIONS = registry.register(Counter(
+    "recommendations", "Recomendações calculadas por estratégia", ["strategy"]
+))
+SHARD_FAILURES = registry.register(Counter(
+    "shard_failures", "Consultas a shards sem resposta (timeout ou erro), por shard", ["shard", "reason"]
+))
+
+
+def stage(name: str) -> _HistogramSeries:
+    """Série do histograma de uma etapa (guardar em variável evita o lookup por chamada)"""
+    return STAGE_SECONDS.labels(name)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI puro: latência por rota (template, não o path) e requisições em voo
+
+    Não usa BaseHTTPMiddleware (que cria tasks e filas por requisição); o
+    custo é um perf_counter e duas atualizações de série.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        in_flight = REQUESTS_IN_FLIGHT.labels(_route_of(scope["path"]))
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status["code"])
+            ).observe(time.perf_counter() - start)
+
+
+# A rota casada só é conhecida depois do roteamento; para o gauge de em voo o
+# template vem do path: rotas fixas pelo path exato, com parâmetro pelo prefixo
+_STATIC_ROUTES = set()
+_PREFIX_ROUTES: List[Tuple[str, str]] = []
+
+
+def _route_of(path: str) -> str:
+    if path in _STATIC_ROUTES:
+        return path
+    for prefix, template in _PREFIX_ROUTES:
+        if path.startswith(prefix):
+            return template
+    return "unmatched"
+
+
+def instrument(app):
+    """Liga o middleware de métricas no app, depois de declaradas as rotas (no-op com METRICS_ENABLED=0)"""
+    if not METRICS_ENABLED:
+        return
+    for route in app.routes:
+        path = getattr(route, "path", None)
+        if path is None:
+            continue
+        if "{" in path:
+            _PREFIX_ROUTES.append((path[:path.index("{")], path))
+        else:
+            _STATIC_ROUTES.add(path)
+    app.add_middleware(MetricsMiddleware)
@@ -0,0 +1,170 @@
+import os
+import logging
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+NEIGHBORS_DIR = "neighbors"
+# Vizinhos guardados por item no treino
+NEIGHBOR_TABLE_K = int(os.getenv("NEIGHBOR_TABLE_K", 50))
+# Históricos com até este número de itens são respondidos pela tabela
+NEIGHBOR_TABLE_MAX_HISTORY = int(os.getenv("NEIGHBOR_TABLE_MAX_HISTORY", 2))
+# Limite de memória (em scores float32) de cada bloco de similaridades no treino
+BLOCK_SCORES = 2**25
+
+
+class NeighborTable:
+    """Top-K vizinhos pré-computados de cada item (linhas int32, scores float16)"""
+
+    def __init__(self, rows: np.ndarray, scores: np.ndarray):
+        self.rows = rows
+        self.scores = scores
+
+    @property
+    def k(self) -> int:
+        return self.rows.shape[1]
+
+    def recommend(self, item_vectors, history_rows: Sequence[int], k: int,
+                  allowed=None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Mescla as listas de vizinhos do histórico; None se não der para completar k
+
+        O score de um candidato é a soma das similaridades com os itens do
+        histórico dividida pela norma da soma dos vetores do histórico, ou seja,
+        o mesmo cosseno com o perfil médio que a busca vetorial calcularia
+        (exato para candidatos presentes em todas as listas). Com filtros
+        (`allowed`, uma RowSelection), candidatos fora deles são descartados.
+        """
+        history_rows = np.unique(np.asarray(history_rows, dtype=np.int64))
+        candidates = self.rows[history_rows].ravel()
+        similarities = self.scores[history_rows].ravel().astype(np.float32)
+
+        unique_rows, inverse = np.unique(candidates, return_inverse=True)
+        totals = np.bincount(inverse, weights=similarities).astype(np.float32)
+
+        keep = ~np.isin(unique_rows, history_rows)
+        if allowed is not None:
+            keep &= allowed.mask[unique_rows]
+        unique_rows, totals = unique_rows[keep], totals[keep]
+        if len(unique_rows) < k:
+            return None
+
+        if len(history_rows) > 1:
+            norm = np.linalg.norm(np.asarray(item_vectors[history_rows].sum(axis=0)).ravel())
+            totals /= max(norm, 1e-12)
+
+        best = np.argsort(-totals, kind="stable")[:k]
+        return unique_rows[best].astype(np.int64), totals[best]
+
+    def patch(self, item_vectors, old_to_new: np.ndarray, changed_rows: np.ndarray,
+              n_jobs: int = -1) -> "NeighborTable":
+        """Tabela para o catálogo atualizado sem recalcular N x N similaridades
+
+        `old_to_new` leva cada linha antiga à sua linha nova; `changed_rows`
+        são as linhas novas de itens adicionados ou alterados. Esses ganham
+        listas calculadas do zero. Os demais mantêm as listas antigas, sem os
+        itens alterados, mescladas com as similaridades aos itens alterados.
+        O custo é O(N x alterados).
+        """
+        num_items, k = item_vectors.shape[0], self.k
+        changed_rows = np.unique(np.asarray(changed_rows, dtype=np.int64))
+        is_changed = np.zeros(num_items, dtype=bool)
+        is_changed[changed_rows] = True
+        old_to_new = np.asarray(old_to_new, dtype=np.int64)
+        kept_old = np.flatnonzero(~is_changed[old_to_new])
+
+        rows = np.empty((num_items, k), dtype=np.int32)
+        scores = np.empty((num_items, k), dtype=np.float16)
+        rows[changed_rows], scores[changed_rows] = _parallel_neighbors(item_vectors, changed_rows, k, n_jobs)
+
+        changed_t = item_vectors[changed_rows].T.tocsr()
+        block = max(1, BLOCK_SCORES // max(1, len(changed_rows) + k))
+        for start in range(0, len(kept_old), block):
+            old_block = kept_old[start:start + block]
+            new_block = old_to_new[old_block]
+            old_neighbors = old_to_new[np.asarray(self.rows[old_block], dtype=np.int64)]
+            old_scores = np.asarray(self.scores[old_block], dtype=np.float32)
+            # Scores antigos de itens alterados estão desatualizados
+            old_scores[is_changed[old_neighbors]] = -np.inf
+
+            fresh = (item_vectors[new_block] @ changed_t).toarray()
+            candidates = np.concatenate([old_neighbors, np.broadcast_to(changed_rows, fresh.shape)], axis=1)
+            top, top_scores = _top_k_rows(np.concatenate([old_scores, fresh], axis=1), k)
+            rows[new_block] = np.take_along_axis(candidates, top, axis=1)
+            scores[new_block] = top_scores
+
+        logger.info(f"Tabela de vizinhos atualizada: {len(changed_rows)} itens recalculados, "
+                    f"{len(kept_old)} listas mescladas")
+        return NeighborTable(rows, scores)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "rows.npy"), self.rows)
+        np.save(os.path.join(path, "scores.npy"), self.scores)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> Optional["NeighborTable"]:
+        if not os.path.exists(os.path.join(path, "rows.npy")):
+            return None
+        return cls(
+            np.load(os.path.join(path, "rows.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, "scores.npy"), mmap_mode=mmap_mode),
+        )
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Colunas e valores dos k maiores scores de cada linha, em ordem decrescente"""
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def _neighbors_for_rows(item_vectors: sparse.csr_matrix, query_rows: np.ndarray,
+                        k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k vizinhos das linhas pedidas, em blocos que cabem em BLOCK_SCORES"""
+    num_items = item_vectors.shape[0]
+    block = max(1, BLOCK_SCORES // num_items)
+    items_t = item_vectors.T.tocsr()
+    rows = np.empty((len(query_rows), k), dtype=np.int32)
+    scores = np.empty((len(query_rows), k), dtype=np.float16)
+
+    for block_start in range(0, len(query_rows), block):
+        block_rows = query_rows[block_start:block_start + block]
+        similarities = (item_vectors[block_rows] @ items_t).toarray()
+        # O próprio item nunca é vizinho dele mesmo
+        similarities[np.arange(len(block_rows)), block_rows] = -np.inf
+
+        out = slice(block_start, block_start + len(block_rows))
+        rows[out], scores[out] = _top_k_rows(similarities, k)
+
+    return rows, scores
+
+
+def _parallel_neighbors(item_vectors: sparse.csr_matrix, query_rows: np.ndarray, k: int,
+                        n_jobs: int) -> Tuple[np.ndarray, np.ndarray]:
+    """_neighbors_for_rows repartido entre processos (joblib)"""
+    from joblib import Parallel, cpu_count, delayed
+
+    workers = cpu_count() if n_jobs == -1 else max(1, n_jobs)
+    # Mais partes que workers para equilibrar a carga entre os núcleos
+    parts = [part for part in np.array_split(query_rows, min(len(query_rows), workers * 4)) if part.size]
+    if not parts:
+        return np.empty((0, k), dtype=np.int32), np.empty((0, k), dtype=np.float16)
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_neighbors_for_rows)(item_vectors, part, k) for part in parts
+    )
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+def build_neighbor_table(item_vectors: sparse.csr_matrix, k: int = NEIGHBOR_TABLE_K,
+                         n_jobs: int = -1) -> NeighborTable:
+    """Calcula a tabela de vizinhos em blocos paralelos (um por núcleo via joblib)"""
+    num_items = item_vectors.shape[0]
+    k = max(1, min(k, num_items - 1))
+    rows, scores = _parallel_neighbors(item_vectors, np.arange(num_items), k, n_jobs)
+    logger.info(f"Tabela de vizinhos: {rows.shape} ({(rows.nbytes + scores.nbytes) / 2**20:.1f} MB)")
+    return NeighborTable(rows, scores)
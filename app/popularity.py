@@ -0,0 +1,186 @@
+import os
+import json
+import logging
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_DIR = "popularity"
+# Peso do prior (em número de avaliações) da média bayesiana; 0 = mediana das contagens
+POPULARITY_PRIOR_WEIGHT = float(os.getenv("POPULARITY_PRIOR_WEIGHT", 0))
+# Linhas do ranking examinadas por vez ao aplicar um filtro
+FILTER_SCAN_ROWS = 4096
+
+
+class PopularityRanking:
+    """Ranking de popularidade pré-computado: linhas ordenadas por score, global e por gênero
+
+    Servir é só fatiar arrays: top(k) custa O(k), sem DataFrame nem ordenação.
+    Os rankings por gênero ficam concatenados em `genre_rows`, delimitados por
+    `genre_offsets` (como um CSR). `counts`/`sums` (avaliações por linha) são
+    guardados para refazer o ranking no treino incremental sem reler ratings.csv.
+    """
+
+    def __init__(self, rows: np.ndarray, scores: np.ndarray, genre_rows: np.ndarray,
+                 genre_offsets: np.ndarray, genres: Sequence[str],
+                 counts: Optional[np.ndarray] = None, sums: Optional[np.ndarray] = None):
+        self.rows = rows
+        self.scores = scores
+        self.genre_rows = genre_rows
+        self.genre_offsets = genre_offsets
+        self.genres = list(genres)
+        self.counts = counts
+        self.sums = sums
+        self._genre_index: Dict[str, int] = {genre: i for i, genre in enumerate(self.genres)}
+        # Score por linha, para devolver o score dos rankings por gênero
+        self._score_of_row = np.empty(len(rows), dtype=np.float32)
+        self._score_of_row[rows] = scores
+
+    def top(self, k: int, genre: Optional[str] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(linhas, scores) dos k itens mais bem ranqueados; None se o gênero não existe"""
+        if genre is None:
+            return self.rows[:k], self.scores[:k]
+        position = self._genre_index.get(genre)
+        if position is None:
+            return None
+        start, end = self.genre_offsets[position], self.genre_offsets[position + 1]
+        rows = self.genre_rows[start:min(end, start + k)]
+        return rows, self._score_of_row[rows]
+
+    def top_allowed(self, k: int, allowed) -> Tuple[np.ndarray, np.ndarray]:
+        """k primeiros do ranking global dentro de um filtro (RowSelection)
+
+        O ranking é percorrido em blocos com a máscara do filtro: filtros
+        amplos param no primeiro bloco; os seletivos percorrem mais.
+        """
+        found = []
+        remaining = k
+        for start in range(0, len(self.rows), FILTER_SCAN_ROWS):
+            rows = self.rows[start:start + FILTER_SCAN_ROWS]
+            rows = rows[allowed.mask[rows]][:remaining]
+            found.append(rows)
+            remaining -= len(rows)
+            if remaining <= 0:
+                break
+        rows = np.concatenate(found) if found else np.empty(0, dtype=np.int32)
+        return rows, self._score_of_row[rows]
+
+    def patch(self, old_to_new: np.ndarray, genres: Sequence[str],
+              prior_weight: float = POPULARITY_PRIOR_WEIGHT) -> Optional["PopularityRanking"]:
+        """Ranking para o catálogo atualizado; itens novos entram sem avaliações
+
+        None quando o bundle não guardou as contagens (treinado antes delas).
+        """
+        if self.counts is None or self.sums is None:
+            logger.warning("Popularidade sem contagens por item; retreine o bundle completo para atualizá-la")
+            return None
+        counts = np.zeros(len(genres), dtype=np.int64)
+        sums = np.zeros(len(genres), dtype=np.float64)
+        counts[old_to_new] = self.counts
+        sums[old_to_new] = self.sums
+        return ranking_from_stats(counts, sums, genres, prior_weight)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "rows.npy"), self.rows)
+        np.save(os.path.join(path, "scores.npy"), self.scores)
+        np.save(os.path.join(path, "genre_rows.npy"), self.genre_rows)
+        np.save(os.path.join(path, "genre_offsets.npy"), self.genre_offsets)
+        if self.counts is not None and self.sums is not None:
+            np.save(os.path.join(path, "counts.npy"), self.counts)
+            np.save(os.path.join(path, "sums.npy"), self.sums)
+        with open(os.path.join(path, "genres.json"), "w") as f:
+            json.dump(self.genres, f)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> Optional["PopularityRanking"]:
+        if not os.path.exists(os.path.join(path, "rows.npy")):
+            return None
+        with open(os.path.join(path, "genres.json")) as f:
+            genres = json.load(f)
+        has_stats = os.path.exists(os.path.join(path, "counts.npy"))
+        return cls(
+            np.load(os.path.join(path, "rows.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, "scores.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, "genre_rows.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, "genre_offsets.npy"), mmap_mode=mmap_mode),
+            genres,
+            np.load(os.path.join(path, "counts.npy"), mmap_mode=mmap_mode) if has_stats else None,
+            np.load(os.path.join(path, "sums.npy"), mmap_mode=mmap_mode) if has_stats else None,
+        )
+
+
+def bayesian_scores(counts: np.ndarray, sums: np.ndarray,
+                    prior_weight: float = POPULARITY_PRIOR_WEIGHT) -> np.ndarray:
+    """Média bayesiana por item: (soma + m * C) / (contagem + m)
+
+    C é a média global e m o peso do prior: itens com poucas avaliações são
+    puxados para C, e itens sem avaliação ficam exatamente em C.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    sums = np.asarray(sums, dtype=np.float64)
+    total = counts.sum()
+    global_mean = float(sums.sum() / total) if total else 0.0
+    if prior_weight <= 0:
+        rated = counts[counts > 0]
+        prior_weight = float(np.median(rated)) if rated.size else 1.0
+    return ((sums + prior_weight * global_mean) / (counts + prior_weight)).astype(np.float32)
+
+
+def aggregate_ratings(ratings_df):
+    """Contagem e soma das notas por movieId (DataFrame indexado por movieId)
+
+    É o que a popularidade precisa: ratings.csv pode ser lido em pedaços e os
+    agregados somados, sem manter as avaliações em memória.
+    """
+    return ratings_df.groupby("movieId")["rating"].agg(["count", "sum"])
+
+
+def ranking_from_stats(counts: np.ndarray, sums: np.ndarray, genres: Sequence[str],
+                       prior_weight: float = POPULARITY_PRIOR_WEIGHT) -> PopularityRanking:
+    """Ranking global e por gênero a partir das avaliações agregadas por linha"""
+    scores = bayesian_scores(counts, sums, prior_weight)
+    # lexsort: a última chave é a principal; empates desfeitos pelo número de avaliações
+    order = np.lexsort((-counts, -scores)).astype(np.int32)
+
+    # Gêneros por linha, percorridos na ordem do ranking global: cada lista já sai ordenada
+    genre_lists: Dict[str, list] = {}
+    for row in order.tolist():
+        for genre in genres[row].split("|"):
+            if genre and genre != "(no genres listed)":
+                genre_lists.setdefault(genre, []).append(row)
+    names = sorted(genre_lists)
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum([len(genre_lists[name]) for name in names], out=offsets[1:])
+    genre_rows = (np.concatenate([np.asarray(genre_lists[name], dtype=np.int32) for name in names])
+                  if names else np.empty(0, dtype=np.int32))
+
+    return PopularityRanking(order, scores[order], genre_rows, offsets, names, counts, sums)
+
+
+def build_popularity(item_ids: np.ndarray, genres: Sequence[str], ratings_df,
+                     prior_weight: float = POPULARITY_PRIOR_WEIGHT) -> PopularityRanking:
+    """Ranking a partir de ratings.csv, global e segmentado por gênero
+
+    `ratings_df` são as avaliações (movieId, rating) ou já agregadas por
+    aggregate_ratings. `item_ids` está ordenado (linhas do bundle);
+    avaliações de ids fora do catálogo são descartadas.
+    """
+    if "rating" in ratings_df.columns:
+        ratings_df = aggregate_ratings(ratings_df)
+    movie_ids = ratings_df.index.to_numpy(dtype=np.int64)
+    rows = np.searchsorted(item_ids, movie_ids)
+    known = rows < len(item_ids)
+    known[known] = item_ids[rows[known]] == movie_ids[known]
+
+    counts = np.zeros(len(item_ids), dtype=np.int64)
+    sums = np.zeros(len(item_ids), dtype=np.float64)
+    counts[rows[known]] = ratings_df["count"].to_numpy(dtype=np.int64)[known]
+    sums[rows[known]] = ratings_df["sum"].to_numpy(dtype=np.float64)[known]
+
+    ranking = ranking_from_stats(counts, sums, genres, prior_weight)
+    logger.info(f"Popularidade: {int(counts.sum())} avaliações, {int((counts > 0).sum())} itens avaliados, "
+                f"{len(ranking.genres)} gêneros")
+    return ranking
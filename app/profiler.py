@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Profiler ligado desde o startup (normalmente ligado sob demanda via /admin/profiler)
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+# Intervalo padrão entre amostras (ms) e profundidade máxima das pilhas guardadas
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", 10))
+PROFILER_MAX_DEPTH = 64
+
+
+class SamplingProfiler:
+    """Profiler por amostragem, ligado e desligado em tempo de execução
+
+    Uma thread daemon lê sys._current_frames() a cada intervalo e conta as
+    pilhas de todas as outras threads (event loop e pool de scoring). Desligado
+    não custa nada; ligado, o custo é proporcional à frequência de amostragem,
+    não ao tráfego. O resultado sai no formato "collapsed" (uma pilha por
+    linha, frames separados por ';'), aceito por flamegraph.pl e speedscope.
+    """
+
+    def __init__(self):
+        self.interval = PROFILER_INTERVAL_MS / 1000
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self._stacks: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: Optional[float] = None, reset: bool = True):
+        if self.running:
+            self.stop()
+        if interval_ms is not None:
+            self.interval = max(interval_ms, 1) / 1000
+        if reset:
+            with self._lock:
+                self._stacks.clear()
+                self.samples = 0
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Profiler por amostragem ligado ({self.interval * 1000:.1f} ms)")
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            logger.info(f"Profiler por amostragem desligado ({self.samples} amostras)")
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            sample = Counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                sample[self._collapse(names.get(ident, str(ident)), frame)] += 1
+            with self._lock:
+                self._stacks.update(sample)
+                self.samples += 1
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        frames = []
+        while frame is not None and len(frames) < PROFILER_MAX_DEPTH:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        # Threads do pool têm nome numerado (scoring_0, scoring_1): agrupadas pelo prefixo
+        frames.append(thread_name.rsplit("_", 1)[0])
+        return ";".join(reversed(frames))
+
+    def collapsed(self, limit: Optional[int] = None) -> str:
+        with self._lock:
+            stacks = self._stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": self.samples,
+            "stacks": len(self._stacks),
+            "started_at": self.started_at,
+        }
+
+
+sampling_profiler = SamplingProfiler()
@@ -0,0 +1,449 @@
+import os
+import struct
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+# "auto" usa o Redis quando disponível (estado compartilhado entre workers)
+PROFILE_STORE = os.getenv("PROFILE_STORE", "auto")
+PROFILE_TTL = int(os.getenv("PROFILE_TTL", 30 * 24 * 3600))
+PROFILE_MEMORY_MAX_USERS = int(os.getenv("PROFILE_MEMORY_MAX_USERS", 100000))
+
+# Até este número de itens novos a soma é feita linha a linha
+INCREMENTAL_MAX_ROWS = 32
+
+PROFILE_FORMAT_VERSION = 3
+# formato, dimensão, itens somados, nnz da soma, ids na lista de itens, bytes da versão do modelo
+_HEADER = struct.Struct("<BIIIIH")
+
+
+class ProfileState:
+    """Estado incremental do perfil: soma dos vetores do histórico + linhas vistas
+
+    Adicionar um item custa O(D); o perfil normalizado não depende do tamanho
+    do histórico. No Redis a soma é guardada esparsa (índices + valores).
+    `pending` são as linhas somadas desde a última gravação no store (None:
+    o store não tem este estado): a próxima gravação só acrescenta os ids
+    delas.
+    """
+
+    __slots__ = ("total", "count", "rows", "pending")
+
+    def __init__(self, total: np.ndarray, count: int, rows: np.ndarray, pending: Optional[np.ndarray] = None):
+        self.total = total
+        self.count = count
+        self.rows = rows
+        self.pending = pending
+
+    @classmethod
+    def empty(cls, dim: int) -> "ProfileState":
+        return cls(np.zeros(dim, dtype=np.float32), 0, np.empty(0, dtype=np.int32))
+
+    def copy(self) -> "ProfileState":
+        return ProfileState(self.total.copy(), self.count, self.rows, self.pending)
+
+    def add(self, item_vectors, new_rows: np.ndarray, rows: Optional[np.ndarray] = None):
+        """Soma os vetores de itens novos (linhas ainda não vistas) ao estado
+
+        `rows` é a união já ordenada, quando o chamador a conhece.
+        """
+        if new_rows.size == 0:
+            return
+        _accumulate(self.total, item_vectors, new_rows)
+        self.count += int(new_rows.size)
+        if self.pending is not None:
+            self.pending = np.concatenate([self.pending, new_rows]).astype(np.int32, copy=False)
+        self.rows = rows if rows is not None else unique_rows(np.concatenate([self.rows, new_rows]))
+
+    def profile(self) -> np.ndarray:
+        """Perfil médio L2-normalizado (zeros se o histórico não tem features)"""
+        norm = np.linalg.norm(self.total)
+        if norm == 0:
+            return np.zeros_like(self.total)
+        return self.total / norm
+
+
+def _accumulate(total: np.ndarray, item_vectors, rows: np.ndarray, subtract: bool = False):
+    """Soma (ou subtrai) os vetores das linhas em `total`"""
+    if rows.size <= INCREMENTAL_MAX_ROWS:
+        # Poucos itens: soma direto das fatias do CSR, sem o overhead do scipy
+        indptr, indices, data = item_vectors.indptr, item_vectors.indices, item_vectors.data
+        for row in rows:
+            start, end = indptr[row], indptr[row + 1]
+            if subtract:
+                total[indices[start:end]] -= data[start:end]
+            else:
+                total[indices[start:end]] += data[start:end]
+    elif subtract:
+        total -= np.asarray(item_vectors[rows].sum(axis=0), dtype=np.float32).ravel()
+    else:
+        total += np.asarray(item_vectors[rows].sum(axis=0), dtype=np.float32).ravel()
+
+
+def encode_profile(state: ProfileState, version: str) -> bytes:
+    """Serializa a soma do estado com a versão do modelo
+
+    Os ids dos itens (estáveis entre bundles) ficam fora, em uma lista que
+    só recebe os novos a cada gravação (RedisProfileStore); o cabeçalho
+    registra quantos ela deve ter.
+    """
+    indices = np.flatnonzero(state.total).astype(np.int32)
+    values = state.total[indices].astype(np.float32)
+    version = version.encode()
+    header = _HEADER.pack(PROFILE_FORMAT_VERSION, state.total.shape[0], state.count,
+                          indices.size, state.rows.size, len(version))
+    return b"".join([header, version, indices.tobytes(), values.tobytes()])
+
+
+def decode_profile(data: bytes, items: Optional[bytes]) -> Tuple[str, np.ndarray, Optional[np.ndarray], int]:
+    """(versão do modelo, ids dos itens, soma densa, itens somados) de um estado serializado
+
+    `items` é a lista de ids (int64) gravada à parte. A soma vem None quando
+    não corresponde à lista (gravações concorrentes acrescentaram ids que a
+    soma gravada não tem) ou o estado é do formato anterior, com os ids
+    embutidos: o estado é então refeito pelos ids.
+    """
+    fmt, dim, count, nnz, num_items, version_size = _HEADER.unpack_from(data)
+    if fmt not in (2, PROFILE_FORMAT_VERSION):
+        raise ValueError(f"Versão de perfil incompatível: {fmt}")
+    offset = _HEADER.size
+    version = bytes(data[offset:offset + version_size]).decode()
+    offset += version_size
+    indices = np.frombuffer(data, dtype=np.int32, count=nnz, offset=offset)
+    offset += 4 * nnz
+    values = np.frombuffer(data, dtype=np.float32, count=nnz, offset=offset)
+    offset += 4 * nnz
+    if fmt == 2:
+        return version, np.frombuffer(data, dtype=np.int64, count=num_items, offset=offset), None, count
+
+    item_ids = sorted_unique(np.frombuffer(items or b"", dtype=np.int64))
+    if item_ids.size != num_items:
+        return version, item_ids, None, count
+    total = np.zeros(dim, dtype=np.float32)
+    total[indices] = values
+    return version, item_ids, total, count
+
+
+class ProfileCatalog:
+    """Versão do modelo a que os estados se referem: linhas <-> ids e vetores dos itens
+
+    Linhas e features mudam a cada treino, os ids dos itens não: um perfil
+    gravado por outra versão é refeito a partir dos ids na primeira leitura.
+    """
+
+    __slots__ = ("version", "item_ids", "item_vectors")
+
+    def __init__(self, version: str, item_ids: np.ndarray, item_vectors):
+        self.version = version
+        self.item_ids = item_ids
+        self.item_vectors = item_vectors
+
+    @classmethod
+    def of(cls, bundle) -> "ProfileCatalog":
+        return cls(bundle.version, bundle.catalog.item_ids, bundle.item_vectors)
+
+    def ids_of(self, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(self.item_ids[rows], dtype=np.int64)
+
+    def rows_of(self, item_ids: np.ndarray) -> np.ndarray:
+        """Linhas (ordenadas) dos ids ordenados ainda presentes no catálogo"""
+        if not len(self.item_ids) or not item_ids.size:
+            return np.empty(0, dtype=np.int32)
+        positions = np.minimum(np.searchsorted(self.item_ids, item_ids), len(self.item_ids) - 1)
+        return positions[np.asarray(self.item_ids[positions]) == item_ids].astype(np.int32)
+
+    def restore(self, version: str, item_ids: np.ndarray, total: Optional[np.ndarray], count: int) -> ProfileState:
+        """Estado nesta versão; o de outra versão (ou sem soma) é refeito somando os vetores dos mesmos itens
+
+        Só o estado restaurado como está conta como gravado (`pending`
+        vazio): o refeito é regravado por inteiro.
+        """
+        rows = self.rows_of(item_ids)
+        if total is not None and version == self.version and total.shape[0] == self.item_vectors.shape[1]:
+            return ProfileState(total, count, rows, pending=np.empty(0, dtype=np.int32))
+        state = ProfileState.empty(self.item_vectors.shape[1])
+        state.add(self.item_vectors, rows, rows)
+        return state
+
+
+def sorted_unique(values: np.ndarray) -> np.ndarray:
+    """Valores ordenados e sem repetição: ordenação + máscara de vizinhos
+
+    O np.unique do numpy 2 usa hash e custa ~20x mais que ordenar arrays de
+    inteiros do tamanho de um histórico.
+    """
+    if values.size < 2:
+        return values
+    # Caso comum na leitura dos perfis: a lista gravada já está em ordem
+    if (values[1:] > values[:-1]).all():
+        return values
+    values = np.sort(values)
+    keep = np.empty(values.size, dtype=bool)
+    keep[0] = True
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    return values[keep] if not keep.all() else values
+
+
+def unique_rows(rows: Sequence[int]) -> np.ndarray:
+    """Linhas ordenadas e sem repetição (int32): a forma de ProfileState.rows e das chaves de cache"""
+    return sorted_unique(np.asarray(rows, dtype=np.int32))
+
+
+def _known_rows(state_rows: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Máscara de `rows` já presentes no estado (ambos ordenados: uma busca binária)"""
+    positions = np.minimum(np.searchsorted(state_rows, rows), state_rows.size - 1)
+    return state_rows[positions] == rows
+
+
+def contains_rows(state: Optional[ProfileState], rows: Sequence[int]) -> bool:
+    """Se todas as `rows` já estão somadas no estado (nada a acrescentar)"""
+    rows = unique_rows(rows)
+    if not rows.size:
+        return True
+    if state is None or not state.rows.size:
+        return False
+    return bool(_known_rows(state.rows, rows).all())
+
+
+def sync_profile_state(state: Optional[ProfileState], item_vectors,
+                       history_rows: Sequence[int]) -> Tuple[ProfileState, bool]:
+    """Atualiza o estado para refletir o histórico; devolve (estado, mudou?)
+
+    Itens novos são somados de forma incremental. Se o estado tem itens fora
+    do histórico (vindos de /events ou removidos dele), eles são subtraídos
+    da soma, enquanto isso custar menos que reconstruí-la do zero.
+    """
+    rows = unique_rows(history_rows)
+
+    if state is not None and state.total.shape[0] == item_vectors.shape[1] and state.rows.size:
+        known = _known_rows(state.rows, rows)
+        if np.count_nonzero(known) == state.rows.size:
+            if known.all():
+                return state, False
+            # Cópia: o estado original pode estar sendo lido por outra requisição
+            state = state.copy()
+            state.add(item_vectors, rows[~known], rows)
+            return state, True
+
+        extra = state.rows[~_known_rows(rows, state.rows)] if rows.size else state.rows
+        new_rows = rows[~known]
+        if extra.size + new_rows.size < rows.size:
+            state = state.copy()
+            _accumulate(state.total, item_vectors, extra, subtract=True)
+            state.count -= int(extra.size)
+            # Perdeu itens da lista gravada: se for salvo, é regravado por inteiro
+            state.pending = None
+            state.add(item_vectors, new_rows, rows)
+            state.rows = rows
+            return state, True
+
+    state = ProfileState.empty(item_vectors.shape[1])
+    state.add(item_vectors, rows, rows)
+    return state, True
+
+
+def merge_history_state(state: Optional[ProfileState], item_vectors,
+                        history_rows: Sequence[int]) -> Tuple[ProfileState, ProfileState, bool]:
+    """Estado do histórico enviado e estado a salvar; devolve (histórico, salvo, mudou?)
+
+    O perfil salvo também acumula os eventos de /events: o histórico de uma
+    requisição só acrescenta itens a ele, nunca o substitui. No caso comum
+    (o histórico contém o perfil salvo) os dois são o mesmo estado.
+    """
+    current, changed = sync_profile_state(state, item_vectors, history_rows)
+    if (not changed or state is None or state.total.shape[0] != item_vectors.shape[1] or not state.rows.size
+            or (current.rows.size and _known_rows(current.rows, state.rows).all())):
+        return current, current, changed
+    merged, changed = extend_profile_state(state, item_vectors, current.rows)
+    return current, merged, changed
+
+
+def extend_profile_state(state: Optional[ProfileState], item_vectors,
+                         rows: Sequence[int]) -> Tuple[ProfileState, bool]:
+    """Soma ao estado as linhas ainda não vistas (eventos só acrescentam itens)"""
+    rows = unique_rows(rows)
+    if state is None or state.total.shape[0] != item_vectors.shape[1] or not state.rows.size:
+        if rows.size == 0:
+            return state or ProfileState.empty(item_vectors.shape[1]), False
+        state = ProfileState.empty(item_vectors.shape[1])
+        state.add(item_vectors, rows, rows)
+        return state, True
+
+    new_rows = rows[~_known_rows(state.rows, rows)]
+    if new_rows.size == 0:
+        return state, False
+    state = state.copy()
+    state.add(item_vectors, new_rows, np.sort(np.concatenate([state.rows, new_rows])))
+    return state, True
+
+
+class MemoryProfileStore:
+    """Perfis no próprio processo (LRU por número de usuários)
+
+    Cada entrada guarda o catálogo da versão que a gravou: no reload o LRU
+    passa para o store da versão nova e o perfil é refeito na primeira leitura.
+    """
+
+    backend = "memory"
+
+    def __init__(self, catalog: ProfileCatalog, max_users: int = PROFILE_MEMORY_MAX_USERS,
+                 states: Optional[LocalCache] = None):
+        self.catalog = catalog
+        self.hits = self.misses = self.migrated = 0
+        self._states = states if states is not None else LocalCache(max_entries=max_users, ttl=float("inf"))
+
+    def _get(self, user_id: str) -> Optional[ProfileState]:
+        entry = self._states.get(user_id)
+        if entry is None:
+            return None
+        catalog, state = entry
+        if catalog.version != self.catalog.version:
+            state = self.catalog.restore(catalog.version, catalog.ids_of(state.rows), state.total, state.count)
+            self._states.set(user_id, (self.catalog, state))
+            self.migrated += 1
+        return state
+
+    async def get(self, user_id: str) -> Optional[ProfileState]:
+        return _count_lookups(self, [self._get(user_id)])[0]
+
+    async def put(self, user_id: str, state: ProfileState):
+        self._states.set(user_id, (self.catalog, state))
+
+    async def get_many(self, user_ids: List[str]) -> List[Optional[ProfileState]]:
+        return _count_lookups(self, [self._get(user_id) for user_id in user_ids])
+
+    async def put_many(self, entries: List[Tuple[str, ProfileState]]):
+        for user_id, state in entries:
+            self._states.set(user_id, (self.catalog, state))
+
+    def stats(self) -> dict:
+        return {**_lookup_stats(self), "size": len(self._states), "max_users": self._states.max_entries,
+                "evictions": self._states.evictions}
+
+
+class RedisProfileStore:
+    """Perfis no Redis, serializados de forma compacta com a versão do modelo e os ids dos itens
+
+    Duas chaves por usuário: a soma esparsa (regravada a cada atualização,
+    tamanho limitado pelas features) e a lista de ids dos itens, que só
+    recebe os novos por APPEND: gravar um item novo não custa o histórico
+    inteiro. A chave não leva a versão: um perfil gravado por outra versão
+    é refeito pelos ids na primeira leitura e regravado na versão em serviço.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client, catalog: ProfileCatalog, ttl: int = PROFILE_TTL):
+        self.client = client
+        self.catalog = catalog
+        self.ttl = ttl
+        self.hits = self.misses = self.migrated = 0
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"profile:{user_id}"
+
+    @staticmethod
+    def _items_key(user_id: str) -> str:
+        return f"profile:{user_id}:items"
+
+    def _write(self, pipeline, user_id: str, state: ProfileState):
+        """Comandos que gravam o estado: a soma e, da lista de ids, só os novos quando possível"""
+        items_key = self._items_key(user_id)
+        pipeline.setex(self._key(user_id), self.ttl, encode_profile(state, self.catalog.version))
+        if state.pending is None:
+            pipeline.setex(items_key, self.ttl, self.catalog.ids_of(state.rows).tobytes())
+        else:
+            if state.pending.size:
+                pipeline.append(items_key, self.catalog.ids_of(state.pending).tobytes())
+            pipeline.expire(items_key, self.ttl)
+
+    def _decode(self, data: bytes, items: Optional[bytes]) -> Tuple[ProfileState, bool]:
+        """(estado nesta versão, refeito de outra versão ou dos ids?)"""
+        version, item_ids, total, count = decode_profile(data, items)
+        stale = total is None or version != self.catalog.version
+        return self.catalog.restore(version, item_ids, total, count), stale
+
+    async def get(self, user_id: str) -> Optional[ProfileState]:
+        try:
+            data, items = await self.client.mget([self._key(user_id), self._items_key(user_id)])
+            state, stale = self._decode(data, items) if data else (None, False)
+        except Exception as e:
+            logger.warning(f"Erro ao ler perfil de {user_id}: {e}")
+            return None
+        if stale:
+            self.migrated += 1
+            await self.put(user_id, state)
+        return _count_lookups(self, [state])[0]
+
+    async def put(self, user_id: str, state: ProfileState):
+        await self.put_many([(user_id, state)])
+
+    async def get_many(self, user_ids: List[str]) -> List[Optional[ProfileState]]:
+        """Vários perfis com um único MGET; os de outra versão são regravados em pipeline"""
+        try:
+            values = await self.client.mget([key for user_id in user_ids
+                                             for key in (self._key(user_id), self._items_key(user_id))])
+            decoded = [self._decode(data, items) if data else (None, False)
+                       for data, items in zip(values[::2], values[1::2])]
+        except Exception as e:
+            logger.warning(f"Erro ao ler perfis em lote: {e}")
+            return [None] * len(user_ids)
+        migrated = [(user_id, state) for user_id, (state, stale) in zip(user_ids, decoded) if stale]
+        if migrated:
+            self.migrated += len(migrated)
+            await self.put_many(migrated)
+        return _count_lookups(self, [state for state, _ in decoded])
+
+    async def put_many(self, entries: List[Tuple[str, ProfileState]]):
+        """Vários perfis em pipeline (um round trip)"""
+        if not entries:
+            return
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for user_id, state in entries:
+                self._write(pipeline, user_id, state)
+            await pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Erro ao salvar perfis em lote: {e}")
+            return
+        for _, state in entries:
+            # A próxima gravação deste estado só acrescenta o que vier depois
+            state.pending = np.empty(0, dtype=np.int32)
+
+    def stats(self) -> dict:
+        return _lookup_stats(self)
+
+
+def _count_lookups(store, states: List[Optional[ProfileState]]) -> List[Optional[ProfileState]]:
+    """Contabiliza perfis encontrados/ausentes de uma leitura (expostos em /metrics)"""
+    found = sum(state is not None for state in states)
+    store.hits += found
+    store.misses += len(states) - found
+    return states
+
+
+def _lookup_stats(store) -> dict:
+    lookups = store.hits + store.misses
+    return {"hits": store.hits, "misses": store.misses, "migrated": store.migrated,
+            "hit_ratio": round(store.hits / lookups, 4) if lookups else None}
+
+
+def create_profile_store(redis_client, catalog: ProfileCatalog, previous=None, backend: str = PROFILE_STORE):
+    """Escolhe o backend de perfis conforme PROFILE_STORE e a disponibilidade do Redis
+
+    `previous` é o store da versão anterior (reload): em memória, os perfis
+    passam para o store novo em vez de se perderem.
+    """
+    if backend not in ("auto", "memory", "redis"):
+        raise ValueError(f"PROFILE_STORE inválido: {backend}")
+    if backend == "redis" and redis_client is None:
+        raise RuntimeError("PROFILE_STORE=redis, mas o Redis não está disponível")
+    if backend == "redis" or (backend == "auto" and redis_client is not None):
+        return RedisProfileStore(redis_client, catalog)
+    return MemoryProfileStore(catalog, states=previous._states if isinstance(previous, MemoryProfileStore) else None)
@@ -0,0 +1,44 @@
+import json
+import logging
+
+from fastapi import Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele, json da stdlib
+    orjson = None
+
+
+def dumps(value) -> bytes:
+    """JSON compacto em bytes (orjson quando instalado)"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class RawJSONResponse(Response):
+    """Resposta cujo corpo já é JSON em bytes: nada é validado nem re-serializado"""
+
+    media_type = "application/json"
+
+
+def recommendation_result(items_json: bytes, strategy: str) -> bytes:
+    """Resultado cacheável: {"recommendations": [...], "strategy": ...}
+
+    É o valor guardado no L1 e no Redis, sem o user_id (a chave é o histórico).
+    """
+    return b'{"recommendations":' + items_json + b',"strategy":' + dumps(strategy) + b"}"
+
+
+def recommendation_body(user_id: str, result: bytes, cached: bool) -> bytes:
+    """Corpo de /recommend: o resultado cacheado com user_id e cached emendados na frente"""
+    return (b'{"user_id":' + dumps(user_id)
+            + (b',"cached":true,' if cached else b',"cached":false,')
+            + result[1:])
+
+
+def batch_body(bodies) -> bytes:
+    """Corpo de /recommend/batch a partir dos corpos de cada usuário"""
+    return b'{"results":[' + b",".join(bodies) + b"]}"
@@ -0,0 +1,121 @@
+import logging
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from .collaborative import CF_CANDIDATES, CF_WEIGHT
+from .metrics import stage
+from .neighbors import NEIGHBOR_TABLE_MAX_HISTORY
+from .profiles import ProfileState
+from .responses import recommendation_result
+
+logger = logging.getLogger(__name__)
+
+# Estratégia de resultados degradados (shards do índice sem resposta)
+PARTIAL_SUFFIX = "_partial"
+# Estratégia de candidatos re-pontuados com a mistura conteúdo + colaborativo
+HYBRID_SUFFIX = "_hybrid"
+
+SEARCH = stage("search")
+SERIALIZE = stage("serialize")
+
+
+def recommend_states(serving, states: Sequence[ProfileState], num_recommendations: int,
+                     allowed=None) -> List[Tuple[bytes, str]]:
+    """Recomendações para vários estados de perfil: [(resultado JSON, estratégia)]
+
+    É o scoring de /recommend (um estado), de /recommend/batch e do job de
+    materialização: o resultado de um estado não depende dos outros do lote,
+    então a mesma chave de cache guarda o mesmo valor qualquer que seja o
+    caminho que a preencheu. Históricos curtos são respondidos pela tabela
+    de vizinhos; os demais perfis vão juntos para `index.search_many` (no
+    índice exato, um produto de matrizes por bloco de usuários).
+
+    O resultado já sai serializado (fragmentos pré-computados do catálogo).
+    `allowed` (RowSelection dos filtros de negócio) vale para todos os
+    estados e é aplicado como máscara em todos os caminhos, antes do top-k.
+    Com o modelo colaborativo no bundle, os candidatos da tabela de vizinhos
+    ou do índice são re-pontuados com a mistura dos dois scores (CF_WEIGHT)
+    e a estratégia ganha o sufixo "_hybrid": o colaborativo só pontua os
+    candidatos, nunca o catálogo inteiro. Se algum shard do índice não
+    respondeu, a estratégia ganha o sufixo "_partial" (resultado degradado,
+    que não vai para o cache).
+    """
+    bundle, index, neighbor_table = serving.bundle, serving.index, serving.neighbor_table
+    collaborative = bundle.collaborative if CF_WEIGHT > 0 else None
+    # Na mistura, a busca traz mais candidatos que os k finais
+    fetch = num_recommendations * CF_CANDIDATES if collaborative is not None else num_recommendations
+    candidates = [None] * len(states)
+    strategies = [None] * len(states)
+    partial = [False] * len(states)
+
+    with SEARCH.time():
+        searches, profiles = [], []
+        for i, state in enumerate(states):
+            # Históricos curtos: mesclar as listas pré-computadas de vizinhos
+            if (neighbor_table is not None
+                    and 0 < state.rows.size <= NEIGHBOR_TABLE_MAX_HISTORY
+                    and num_recommendations <= neighbor_table.k):
+                candidates[i] = neighbor_table.recommend(
+                    bundle.item_vectors, state.rows, min(fetch, neighbor_table.k), allowed
+                )
+                if candidates[i] is not None:
+                    strategies[i] = "neighbor_table"
+                    continue
+
+            # Perfil normalizado a partir da soma acumulada (custo O(D))
+            profile = state.profile()
+            if np.any(profile):
+                searches.append(i)
+                profiles.append(profile)
+            else:
+                logger.warning(f"Nenhum item válido encontrado no histórico ({state.rows.size} itens)")
+
+        if searches:
+            # Os já vistos de cada usuário são mascarados antes do top-k
+            found = index.search_many(np.stack(profiles), fetch, [states[i].rows for i in searches], allowed)
+            for i, result in zip(searches, found):
+                candidates[i] = result
+                strategies[i] = "vector_search"
+                # Índice em shards: os que não responderam a tempo ficaram de fora
+                partial[i] = bool(getattr(result, "missing", None))
+
+        for i, state in enumerate(states):
+            if candidates[i] is None:
+                continue
+            cf_profile = collaborative.profile(state.rows) if collaborative is not None else None
+            if cf_profile is not None:
+                candidates[i] = collaborative.blend(
+                    bundle.item_vectors, state.profile(), cf_profile, [candidates[i][0]], num_recommendations
+                )
+                strategies[i] += HYBRID_SUFFIX
+            elif len(candidates[i][0]) > num_recommendations:
+                candidates[i] = candidates[i][0][:num_recommendations], candidates[i][1][:num_recommendations]
+
+    results = []
+    popular = None
+    with SERIALIZE.time():
+        for i in range(len(states)):
+            if candidates[i] is None:
+                # Sem histórico válido: fatia do ranking de popularidade pré-computado
+                if popular is None:
+                    popular = recommendation_result(
+                        bundle.catalog.items_json(*bundle.popular(num_recommendations, allowed)), "popular"
+                    )
+                results.append((popular, "popular"))
+                continue
+            strategy = strategies[i] + PARTIAL_SUFFIX if partial[i] else strategies[i]
+            items = bundle.catalog.items_json(candidates[i][0].tolist(), candidates[i][1].tolist())
+            results.append((recommendation_result(items, strategy), strategy))
+    return results
+
+
+def recommend_from_state(serving, profile_state: ProfileState, num_recommendations: int,
+                         allowed=None) -> Tuple[bytes, str]:
+    """Recomendações a partir de um estado do perfil: (resultado JSON, estratégia)"""
+    return recommend_states(serving, [profile_state], num_recommendations, allowed)[0]
+
+
+def cacheable(strategy: str) -> bool:
+    """Resultados parciais (shards sem resposta) não são cacheados: a próxima requisição tenta de novo"""
+    return not strategy.endswith(PARTIAL_SUFFIX)
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+import multiprocessing as mp
+from multiprocessing.connection import wait
+from typing import Dict, Optional, Tuple
+
+# Importado no pai: os módulos do servidor também ficam compartilhados após o fork
+import uvicorn
+
+from .artifacts import DEFAULT_BUNDLE_PATH, manifest_version, read_manifest
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 8000))
+# Processos de serviço; 0 = um por núcleo
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 1))
+# Tempo máximo (s) para um worker terminar o startup e sinalizar que está pronto
+SERVER_READY_TIMEOUT = float(os.getenv("SERVER_READY_TIMEOUT", 120))
+# Tempo (s) para um worker terminar as requisições em andamento ao ser parado
+SERVER_STOP_TIMEOUT = float(os.getenv("SERVER_STOP_TIMEOUT", 30))
+SERVER_BACKLOG = 2048
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Socket de escuta aberto no pai e herdado pelos workers (o kernel distribui os accepts)"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # Herdado pelas conexões aceitas: sem Nagle, respostas pequenas em keep-alive não
+    # esperam o ACK atrasado do cliente (~40 ms por requisição)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.bind((host, port))
+    sock.listen(SERVER_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, ready, worker_id: int, num_workers: int):
+    """Corpo de um worker (processo filho): uvicorn no socket herdado
+
+    O startup da API (Redis, executor, consumidor de eventos) roda aqui, depois
+    do fork: conexões e threads não atravessam processos. O uvicorn só passa a
+    aceitar conexões depois do startup; só então o worker avisa o pai.
+    """
+    from . import main as api
+
+    # Os handlers do supervisor não valem no filho; o uvicorn instala os seus
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+    server = uvicorn.Server(uvicorn.Config(api.app, lifespan="on", access_log=False, log_config=None))
+
+    async def serve():
+        task = asyncio.ensure_future(server.serve(sockets=[sock]))
+        while not server.started and not task.done():
+            await asyncio.sleep(0.01)
+        if server.started:
+            ready.send(os.getpid())
+            ready.close()
+            if worker_id == 0 and num_workers > 1 and api.model.profile_store.backend == "memory":
+                logger.warning("Perfis em memória com vários workers: cada worker vê só os próprios "
+                               "eventos (use Redis para perfis compartilhados)")
+        await task
+
+    asyncio.run(serve())
+    sys.exit(0 if server.started else 1)
+
+
+class WorkerPool:
+    """Supervisor dos workers: pré-carga, fork, prontidão, reinício e troca gradual
+
+    O pai carrega e aquece o modelo, coleta o lixo e congela o heap
+    (gc.freeze) antes de cada fork: os objetos herdados vão para a geração
+    permanente e as coletas dos workers não reescrevem os cabeçalhos deles,
+    então as páginas continuam compartilhadas. Os arrays do bundle já são
+    mmap (page cache compartilhado); a pré-carga compartilha o resto (imports,
+    dict id -> linha, índices).
+    """
+
+    def __init__(self, num_workers: int, sock: socket.socket, path: str = DEFAULT_BUNDLE_PATH):
+        self.num_workers = num_workers
+        self.sock = sock
+        self.path = path
+        self.restarts = 0
+        self._context = mp.get_context("fork")
+        self._workers: Dict[int, mp.Process] = {}
+        self._version: Optional[str] = None
+        self._stopping = False
+        # Modelos pré-carregados antes do atual: workers antigos ainda podem usá-los (ex.: shards)
+        self._retired = []
+
+    def preload(self):
+        from . import main as api
+
+        # Objetos de uma versão anterior saem da geração permanente antes de recarregar
+        gc.unfreeze()
+        # Workers recarregam (watcher e /admin/reload) a partir do mesmo caminho
+        api.DEFAULT_BUNDLE_PATH = self.path
+        if api.model is not None:
+            self._retired.append(api.model)
+        api.preload_model(self.path)
+        self._version = api.model.version
+        gc.collect()
+        gc.freeze()
+        logger.info(f"Heap congelado para o fork: {gc.get_freeze_count()} objetos")
+
+    def _refresh(self):
+        """Pré-carrega de novo se outra versão foi publicada (workers novos nascem atualizados)"""
+        try:
+            if manifest_version(read_manifest(self.path)) != self._version:
+                self.preload()
+        except Exception as e:
+            logger.error(f"Falha ao pré-carregar a versão publicada, mantendo {self._version}: {e}")
+
+    def _spawn(self, worker_id: int) -> Tuple[mp.Process, object]:
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=run_worker, args=(self.sock, sender, worker_id, self.num_workers),
+            name=f"worker_{worker_id}", daemon=False,
+        )
+        process.start()
+        sender.close()
+        return process, receiver
+
+    def _wait_ready(self, process: mp.Process, receiver, timeout: float = SERVER_READY_TIMEOUT) -> bool:
+        """Bloqueia até o worker sinalizar prontidão; False se morreu ou estourou o prazo"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if receiver.poll(0.1):
+                try:
+                    receiver.recv()
+                    return True
+                except EOFError:
+                    return False
+            if not process.is_alive():
+                return False
+        return False
+
+    def _start(self, worker_id: int) -> bool:
+        process, receiver = self._spawn(worker_id)
+        ready = self._wait_ready(process, receiver)
+        receiver.close()
+        if not ready:
+            logger.error(f"Worker {worker_id} (pid {process.pid}) não ficou pronto")
+            self._stop_process(process)
+            return False
+        self._workers[worker_id] = process
+        logger.info(f"Worker {worker_id} pronto (pid {process.pid})")
+        return True
+
+    @staticmethod
+    def _stop_process(process: mp.Process):
+        if process.is_alive():
+            process.terminate()
+            process.join(SERVER_STOP_TIMEOUT)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    def start(self):
+        """Sobe todos os workers, um de cada vez (a prontidão de cada um é conferida)"""
+        for worker_id in range(self.num_workers):
+            if not self._start(worker_id):
+                self.stop()
+                raise RuntimeError(f"Worker {worker_id} falhou no startup")
+        logger.info(f"{self.num_workers} workers prontos em {self.sock.getsockname()[0]}:{self.sock.getsockname()[1]}")
+
+    def rolling_restart(self):
+        """Troca os workers um a um (SIGHUP): o novo fica pronto antes do antigo sair
+
+        Depois de reloads a quente cada worker tem a própria cópia das estruturas
+        em heap; a troca volta a compartilhá-las a partir da pré-carga nova.
+        """
+        self._refresh()
+        for worker_id, old in list(self._workers.items()):
+            if self._stopping:
+                break
+            if self._start(worker_id):
+                self._stop_process(old)
+        self._close_retired()
+
+    def _close_retired(self):
+        """Fecha os modelos pré-carregados antigos quando nenhum worker nasceu deles"""
+        while self._retired and not self._stopping:
+            self._retired.pop().close()
+
+    def supervise(self):
+        """Reinicia workers que morrem até receber SIGTERM/SIGINT"""
+        hangup = []
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "_stopping", True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "_stopping", True))
+        signal.signal(signal.SIGHUP, lambda *_: hangup.append(True))
+        while not self._stopping:
+            wait([process.sentinel for process in self._workers.values()], timeout=1.0)
+            if hangup:
+                hangup.clear()
+                self.rolling_restart()
+            for worker_id, process in list(self._workers.items()):
+                if not process.is_alive() and not self._stopping:
+                    logger.warning(f"Worker {worker_id} (pid {process.pid}) saiu com código "
+                                   f"{process.exitcode}; reiniciando")
+                    self.restarts += 1
+                    del self._workers[worker_id]
+                    self._refresh()
+                    self._start(worker_id)
+        self.stop()
+
+    def stop(self):
+        self._stopping = True
+        for process in self._workers.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._workers.values():
+            self._stop_process(process)
+        self._workers.clear()
+
+        from . import main as api
+
+        for model in self._retired + ([api.model] if api.model is not None else []):
+            model.close()
+        self._retired.clear()
+
+
+def serve(num_workers: int = SERVER_WORKERS, host: str = SERVER_HOST, port: int = SERVER_PORT,
+          path: str = DEFAULT_BUNDLE_PATH):
+    num_workers = num_workers or os.cpu_count() or 1
+    sock = bind_socket(host, port)
+    pool = WorkerPool(num_workers, sock, path)
+    pool.preload()
+    pool.start()
+    try:
+        pool.supervise()
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sobe a API com N workers compartilhando o modelo")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="0 = um por núcleo")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--bundle", default=DEFAULT_BUNDLE_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.workers, args.host, args.port, args.bundle)
@@ -0,0 +1,191 @@
+import asyncio
+import os
+import time
+import logging
+from typing import Callable, Optional
+
+import numpy as np
+
+from .artifacts import DEFAULT_BUNDLE_PATH, load_bundle, manifest_version, read_manifest
+from .index import INDEX_DIR, load_index
+from .neighbors import NEIGHBORS_DIR, NeighborTable
+from .profiles import ProfileState, sync_profile_state
+from .shards import SHARD_SERVING, SHARDS_DIR, ShardLayout, ShardedIndex
+
+logger = logging.getLogger(__name__)
+
+# Intervalo (s) entre verificações da versão publicada do bundle; 0 desliga o watcher
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 10))
+# Consultas de aquecimento antes de um modelo novo entrar em serviço
+MODEL_WARMUP_QUERIES = int(os.getenv("MODEL_WARMUP_QUERIES", 32))
+# Tempo (s) que um modelo substituído continua aberto para as requisições em andamento
+MODEL_CLOSE_DELAY = float(os.getenv("MODEL_CLOSE_DELAY", 30))
+PAGE_SIZE = 4096
+
+
+class ServingModel:
+    """Um modelo carregado e tudo o que depende dele, trocado inteiro no reload
+
+    Cada requisição lê a referência global uma única vez e usa só este objeto:
+    bundle, índice, vizinhos e perfis nunca se misturam entre versões.
+    """
+
+    def __init__(self, bundle, index, neighbor_table: Optional[NeighborTable] = None, profile_store=None):
+        self.bundle = bundle
+        self.index = index
+        self.neighbor_table = neighbor_table
+        self.profile_store = profile_store
+        self.loaded_at = time.time()
+
+    @property
+    def version(self) -> str:
+        return self.bundle.version
+
+    def close(self):
+        self.index.close()
+
+
+def load_serving_model(path: str = DEFAULT_BUNDLE_PATH) -> ServingModel:
+    """Abre bundle, índice e tabela de vizinhos da versão publicada em path
+
+    Com SHARD_SERVING=1 e shards no bundle, a busca vai para os processos
+    dos shards (ShardedIndex) em vez do índice único.
+    """
+    # Abrir o bundle com mmap: nada é desserializado, as páginas são
+    # carregadas sob demanda e compartilhadas pelo page cache
+    bundle = load_bundle(path, mmap_mode="r")
+    layout = ShardLayout.load(os.path.join(bundle.path, SHARDS_DIR)) if SHARD_SERVING else None
+    if layout is not None:
+        index = ShardedIndex(bundle.item_vectors, bundle.path, layout).start()
+    else:
+        if SHARD_SERVING:
+            logger.warning("SHARD_SERVING=1, mas o bundle não tem shards (treine com --shards): usando o índice único")
+        index = load_index(os.path.join(bundle.path, INDEX_DIR), bundle.item_vectors)
+    neighbor_table = NeighborTable.load(os.path.join(bundle.path, NEIGHBORS_DIR))
+    return ServingModel(bundle, index, neighbor_table)
+
+
+def touch_pages(*arrays):
+    """Lê um byte por página dos arrays (mmap): as primeiras requisições não pagam page faults"""
+    for array in arrays:
+        if array is None or not isinstance(array, np.ndarray) or array.size == 0:
+            continue
+        raw = np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+        int(raw[::PAGE_SIZE].sum())
+
+
+def warm_up(model: ServingModel, recommend: Callable[[ServingModel, ProfileState], object],
+            queries: int = MODEL_WARMUP_QUERIES):
+    """Aquece um modelo antes de servir: páginas, dict id -> linha e o caminho de scoring
+
+    `recommend` é o scoring real de /recommend; roda com históricos curtos
+    (tabela de vizinhos) e longos (busca no índice) montados dos itens populares.
+    """
+    bundle, index = model.bundle, model.index
+    vectors = bundle.item_vectors
+    touch_pages(vectors.data, vectors.indices, vectors.indptr, bundle.catalog.item_ids,
+                bundle.catalog.item_json.data, bundle.catalog.item_json.offsets,
+                *(getattr(index, name, None) for name in ("centroids", "list_rows", "list_offsets")))
+    if model.neighbor_table is not None:
+        touch_pages(model.neighbor_table.rows, model.neighbor_table.scores)
+    if bundle.popularity is not None:
+        touch_pages(bundle.popularity.rows, bundle.popularity.scores, bundle.popularity.genre_rows)
+    if bundle.collaborative is not None:
+        touch_pages(bundle.collaborative.item_factors)
+    if len(bundle):
+        bundle.catalog.row_of(str(bundle.catalog.item_ids[0]))
+
+    rows, _ = bundle.popular(queries + 5)
+    rows = list(rows)
+    for i in range(min(queries, len(rows))):
+        history = rows[i:i + 1] if i % 2 == 0 else rows[i:i + 5]
+        state, _ = sync_profile_state(None, vectors, history)
+        recommend(model, state)
+
+
+class ModelReloader:
+    """Recarrega o modelo em background e troca a referência servida de uma vez
+
+    `prepare` carrega e aquece a versão publicada (roda numa thread, fora do
+    event loop e fora do pool de scoring); `swap` instala o modelo pronto.
+    Requisições em andamento terminam com o modelo que já tinham em mãos.
+    Com MODEL_WATCH_INTERVAL > 0 um watcher confere a versão publicada
+    periodicamente (só lê o manifest.json) e recarrega quando ela muda.
+    """
+
+    def __init__(self, current: Callable[[], Optional[ServingModel]],
+                 prepare: Callable[[str], ServingModel], swap: Callable[[ServingModel], None],
+                 path: str = DEFAULT_BUNDLE_PATH, interval: float = MODEL_WATCH_INTERVAL):
+        self.current = current
+        self.prepare = prepare
+        self.swap = swap
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_reload_seconds: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def published_version(self) -> str:
+        return manifest_version(read_manifest(self.path))
+
+    async def reload(self, force: bool = False) -> dict:
+        """Carrega a versão publicada se ela mudou (ou sempre, com force)
+
+        Falhas não afetam o modelo em serviço: a exceção sobe para quem chamou.
+        """
+        async with self._lock:
+            current = self.current()
+            previous = current.version if current is not None else None
+            if not force and previous is not None and self.published_version() == previous:
+                return {"reloaded": False, "version": previous}
+
+            start = time.perf_counter()
+            try:
+                model = await asyncio.to_thread(self.prepare, self.path)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                logger.error(f"Falha ao recarregar o modelo (segue a versão {previous}): {e}")
+                raise
+            self.swap(model)
+            self.reloads += 1
+            self.last_error = None
+            self.last_reload_seconds = round(time.perf_counter() - start, 3)
+            logger.info(f"Modelo recarregado: {previous} -> {model.version} "
+                        f"({self.last_reload_seconds}s com aquecimento)")
+            return {"reloaded": True, "version": model.version, "previous_version": previous,
+                    "seconds": self.last_reload_seconds}
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                # Bundle sendo escrito ou inválido: tenta de novo no próximo ciclo
+                logger.warning(f"Watcher do modelo: {e}")
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "watch_interval": self.interval,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_reload_seconds": self.last_reload_seconds,
+        }
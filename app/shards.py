@@ -0,0 +1,315 @@
+import os
+import json
+import heapq
+import queue
+import logging
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import multiprocessing as mp
+from itertools import islice
+from multiprocessing.connection import Connection, Listener, wait
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .index import INDEX_DIR, VectorIndex, build_index, load_index
+from .metrics import SHARD_FAILURES
+from .vectors import RowSelection, load_item_vectors, row_slice
+
+logger = logging.getLogger(__name__)
+
+SHARDS_DIR = "shards"
+MANIFEST_FILE = "manifest.json"
+# Busca pelos shards do bundle em processos locais (scatter-gather) em vez do índice único
+SHARD_SERVING = os.getenv("SHARD_SERVING", "0") == "1"
+# Prazo de cada consulta: shards que não respondem a tempo ficam de fora (resultado parcial)
+SHARD_TIMEOUT_MS = float(os.getenv("SHARD_TIMEOUT_MS", 200))
+# Tempo máximo (s) para os processos dos shards aceitarem conexões no startup
+SHARD_STARTUP_TIMEOUT = float(os.getenv("SHARD_STARTUP_TIMEOUT", 60))
+# Onde fica o diretório privado (0700) com os sockets Unix dos shards
+SHARD_SOCKET_DIR = os.getenv("SHARD_SOCKET_DIR", tempfile.gettempdir())
+SHARD_BACKLOG = 128
+
+
+class ShardLayout:
+    """Catálogo particionado em faixas contíguas de linhas, cada uma com o próprio índice
+
+    Faixas contíguas dispensam tabelas de tradução: a linha global é o início
+    do shard somado à linha local, e os vetores de cada shard são uma fatia
+    do CSR do bundle (sem cópia em disco).
+    """
+
+    def __init__(self, bounds: Sequence[int], indexes: Optional[List[VectorIndex]] = None):
+        self.bounds = [int(bound) for bound in bounds]
+        self.indexes = indexes
+
+    def __len__(self) -> int:
+        return len(self.bounds) - 1
+
+    @property
+    def ranges(self) -> List[Tuple[int, int]]:
+        return list(zip(self.bounds[:-1], self.bounds[1:]))
+
+    @classmethod
+    def build(cls, item_vectors, num_shards: int, backend: str, **params) -> "ShardLayout":
+        """Divide as linhas em `num_shards` faixas de tamanho igual e indexa cada uma"""
+        num_shards = max(1, min(num_shards, item_vectors.shape[0]))
+        bounds = np.linspace(0, item_vectors.shape[0], num_shards + 1).astype(np.int64)
+        indexes = [build_index(backend, row_slice(item_vectors, start, end), **params)
+                   for start, end in zip(bounds[:-1], bounds[1:])]
+        logger.info(f"{num_shards} shards ({backend}) de até {int(np.diff(bounds).max())} itens")
+        return cls(bounds, indexes)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for shard, index in enumerate(self.indexes):
+            index.save(os.path.join(path, str(shard), INDEX_DIR))
+        with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+            json.dump({"bounds": self.bounds}, f)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["ShardLayout"]:
+        """Só as faixas: cada índice é aberto pelo processo do seu shard"""
+        if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            return None
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            return cls(json.load(f)["bounds"])
+
+
+def serve_shard(bundle_path: str, shard: int, address: str):
+    """Processo de um shard: abre só a sua fatia do bundle e responde buscas no socket
+
+    Cada conexão (uma por thread de scoring de cada processo da API) é
+    atendida por uma thread; as consultas chegam como (índices e valores do
+    perfil, dimensão, k, linhas excluídas locais, bitset do filtro). Sem
+    handshake de autenticação (um shard parado travaria o connect): o acesso
+    é restrito pelas permissões do diretório do socket.
+    """
+    logging.basicConfig(level=logging.INFO)
+    layout = ShardLayout.load(os.path.join(bundle_path, SHARDS_DIR))
+    start, end = layout.ranges[shard]
+    item_vectors = row_slice(load_item_vectors(os.path.join(bundle_path, "item_vectors"), mmap_mode="r"),
+                             start, end)
+    index = load_index(os.path.join(bundle_path, SHARDS_DIR, str(shard), INDEX_DIR), item_vectors, backend="auto")
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    indices, values, dim, k, exclude, allowed_bits = conn.recv()
+                except (EOFError, OSError):
+                    return
+                query = np.zeros(dim, dtype=np.float32)
+                query[indices] = values
+                allowed = None
+                if allowed_bits is not None:
+                    allowed = RowSelection(np.unpackbits(allowed_bits, count=end - start).view(bool))
+                rows, scores = index.search(query, k, exclude, allowed)
+                try:
+                    conn.send((np.asarray(rows, dtype=np.int32), np.asarray(scores, dtype=np.float32)))
+                except OSError:
+                    # O coordenador desistiu (timeout) e fechou a conexão
+                    return
+
+    with Listener(address, family="AF_UNIX", backlog=SHARD_BACKLOG) as listener:
+        logger.info(f"Shard {shard} pronto: linhas {start}-{end} ({index.backend}) em {address}")
+        while True:
+            threading.Thread(target=handle, args=(listener.accept(),), daemon=True).start()
+
+
+class ShardedResult(tuple):
+    """(linhas, scores) de uma busca espalhada; `missing` lista os shards que faltaram"""
+
+    def __new__(cls, rows: np.ndarray, scores: np.ndarray, missing: List[int]):
+        result = super().__new__(cls, (rows, scores))
+        result.missing = missing
+        return result
+
+
+class ShardedIndex(VectorIndex):
+    """Busca scatter-gather: o perfil vai para todos os shards em paralelo e os top-k parciais são mesclados
+
+    Cada shard roda em um processo local (iniciado por este objeto) e é
+    consultado por um socket Unix. A busca envia a consulta a todos, espera
+    as respostas até SHARD_TIMEOUT_MS e mescla os top-k parciais com um heap.
+    Shards que não respondem a tempo (ou caíram) ficam de fora: o resultado
+    sai parcial, marcado em `missing`, e o shard caído é reiniciado.
+    """
+
+    backend = "sharded"
+
+    def __init__(self, item_vectors, bundle_path: str, layout: ShardLayout, timeout_ms: float = SHARD_TIMEOUT_MS):
+        super().__init__(item_vectors)
+        self.bundle_path = bundle_path
+        self.layout = layout
+        self.timeout = timeout_ms / 1000
+        self.failures = [0] * len(layout)
+        self._socket_dir = tempfile.mkdtemp(prefix="shards-", dir=SHARD_SOCKET_DIR)
+        self._addresses = [os.path.join(self._socket_dir, f"{shard}.sock") for shard in range(len(layout))]
+        self._processes: List[Optional[mp.Process]] = [None] * len(layout)
+        self._owner = os.getpid()
+        # Conjuntos de conexões (uma por shard), um por thread em uso
+        self._pool: "queue.LifoQueue" = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def params(self) -> dict:
+        return {"shards": len(self.layout), "timeout_ms": self.timeout * 1000}
+
+    def start(self, timeout: float = SHARD_STARTUP_TIMEOUT) -> "ShardedIndex":
+        """Inicia um processo por shard e espera todos aceitarem conexões"""
+        for shard in range(len(self.layout)):
+            self._start_process(shard)
+        conns = [None] * len(self.layout)
+        deadline = time.monotonic() + timeout
+        for shard in range(len(self.layout)):
+            while conns[shard] is None:
+                conns[shard] = self._connect(shard)
+                if conns[shard] is None:
+                    if time.monotonic() > deadline or not self._processes[shard].is_alive():
+                        self.close()
+                        raise RuntimeError(f"Shard {shard} não ficou pronto")
+                    time.sleep(0.05)
+        self._pool.put(conns)
+        logger.info(f"{len(self.layout)} shards prontos (timeout {self.timeout * 1000:.0f} ms)")
+        return self
+
+    def _start_process(self, shard: int):
+        if os.path.exists(self._addresses[shard]):
+            os.unlink(self._addresses[shard])
+        # spawn: o processo da API já tem threads (fork não seria seguro)
+        process = mp.get_context("spawn").Process(
+            target=serve_shard, args=(self.bundle_path, shard, self._addresses[shard]),
+            name=f"shard_{shard}", daemon=True,
+        )
+        process.start()
+        self._processes[shard] = process
+
+    def _connect(self, shard: int, timeout: Optional[float] = None) -> Optional[Connection]:
+        """Conexão com o shard, ou None; o connect tem prazo (com o backlog cheio, um shard parado o travaria)"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout or self.timeout)
+            sock.connect(self._addresses[shard])
+            sock.setblocking(True)
+            return Connection(sock.detach())
+        except OSError:
+            sock.close()
+            self._revive(shard)
+            return None
+
+    def _revive(self, shard: int):
+        """Reinicia o processo do shard se ele caiu
+
+        Só o processo que iniciou os shards pode reiniciá-los (workers herdam a referência).
+        """
+        if os.getpid() != self._owner or self._processes[shard] is None:
+            return
+        with self._lock:
+            process = self._processes[shard]
+            if not process.is_alive():
+                logger.warning(f"Shard {shard} caiu (código {process.exitcode}); reiniciando")
+                self._start_process(shard)
+
+    def _checkout(self) -> list:
+        if os.getpid() != self._owner and getattr(self, "_pool_pid", None) != os.getpid():
+            # Processo filho (fork): as conexões herdadas são do pai
+            self._pool = queue.LifoQueue()
+            self._pool_pid = os.getpid()
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return [None] * len(self.layout)
+
+    def _fail(self, conns: list, shard: int, reason: str):
+        if conns[shard] is not None:
+            # Uma resposta atrasada ainda pode chegar: a conexão não é reaproveitada
+            conns[shard].close()
+            conns[shard] = None
+        self.failures[shard] += 1
+        SHARD_FAILURES.labels(str(shard), reason).inc()
+        if reason == "error":
+            self._revive(shard)
+
+    def search(self, query, k, exclude=None, allowed=None):
+        indices = np.flatnonzero(query).astype(np.int32)
+        message_base = (indices, query[indices].astype(np.float32), query.shape[0], k)
+        conns = self._checkout()
+        pending, missing, partials = {}, [], []
+        deadline = time.monotonic() + self.timeout
+
+        for shard, (start, end) in enumerate(self.layout.ranges):
+            local_exclude = None
+            if exclude is not None and len(exclude):
+                low, high = np.searchsorted(exclude, [start, end])
+                local_exclude = np.asarray(exclude[low:high], dtype=np.int64) - start
+            allowed_bits = np.packbits(allowed.mask[start:end]) if allowed is not None else None
+            if conns[shard] is None:
+                conns[shard] = self._connect(shard, max(deadline - time.monotonic(), 0.001))
+            if conns[shard] is None:
+                self._fail(conns, shard, "unavailable")
+                missing.append(shard)
+                continue
+            try:
+                conns[shard].send((*message_base, local_exclude, allowed_bits))
+                pending[conns[shard]] = shard
+            except (OSError, EOFError):
+                self._fail(conns, shard, "error")
+                missing.append(shard)
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for conn in wait(list(pending), timeout=remaining):
+                shard = pending.pop(conn)
+                try:
+                    rows, scores = conn.recv()
+                except (OSError, EOFError):
+                    self._fail(conns, shard, "error")
+                    missing.append(shard)
+                    continue
+                partials.append((rows.astype(np.int64) + self.layout.bounds[shard], scores))
+        for shard in pending.values():
+            self._fail(conns, shard, "timeout")
+            missing.append(shard)
+        self._pool.put(conns)
+
+        if missing:
+            logger.warning(f"Busca sem resposta dos shards {sorted(missing)}: resultado parcial")
+        # Listas parciais já vêm ordenadas por score: merge com heap, só até k
+        merged = list(islice(heapq.merge(
+            *(zip(scores.tolist(), rows.tolist()) for rows, scores in partials), key=lambda pair: -pair[0]
+        ), k))
+        rows = np.fromiter((row for _, row in merged), dtype=np.int64, count=len(merged))
+        scores = np.fromiter((score for score, _ in merged), dtype=np.float32, count=len(merged))
+        return ShardedResult(rows, scores, sorted(missing))
+
+    def stats(self) -> dict:
+        return {
+            "shards": len(self.layout),
+            "alive": [process is not None and process.is_alive() for process in self._processes]
+            if os.getpid() == self._owner else None,
+            "failures": list(self.failures),
+        }
+
+    def close(self):
+        """Encerra os processos dos shards (só no processo que os iniciou)"""
+        if os.getpid() != self._owner:
+            return
+        while True:
+            try:
+                conns = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            for conn in conns:
+                if conn is not None:
+                    conn.close()
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+                process.join(5)
+        shutil.rmtree(self._socket_dir, ignore_errors=True)
+
@@ -0,0 +1,201 @@
+import json
+import os
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# Layout em disco dos vetores de itens. Incrementar a versão sempre que
+# o formato mudar, para que artefatos antigos sejam rejeitados no load.
+ITEM_VECTORS_FORMAT = "csr-float32-l2"
+ITEM_VECTORS_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+CSR_ARRAYS = ("data", "indices", "indptr")
+# Filtros que aceitam menos de 1/SUBSET_SEARCH_RATIO do catálogo pontuam só as
+# linhas aceitas (fatiar o CSR) em vez de pontuar tudo e mascarar
+SUBSET_SEARCH_RATIO = 4
+# Limite de memória (em scores float32) da matriz itens x consultas por bloco
+BLOCK_SCORES = 2**25
+
+
+def to_item_vectors(matrix) -> sparse.csr_matrix:
+    """Converte uma matriz de features em CSR float32 com linhas L2-normalizadas"""
+    # Só no treino: o sklearn fica fora do import da API
+    from sklearn.preprocessing import normalize
+
+    item_vectors = sparse.csr_matrix(matrix, dtype=np.float32)
+    item_vectors = normalize(item_vectors, norm="l2", axis=1, copy=False)
+    item_vectors.sort_indices()
+    return item_vectors
+
+
+def save_item_vectors(item_vectors: sparse.csr_matrix, path: str):
+    """Salva os vetores de itens como arrays numpy brutos + manifesto versionado"""
+    os.makedirs(path, exist_ok=True)
+
+    for name in CSR_ARRAYS:
+        np.save(os.path.join(path, f"{name}.npy"), getattr(item_vectors, name))
+
+    manifest = {
+        "format": ITEM_VECTORS_FORMAT,
+        "version": ITEM_VECTORS_VERSION,
+        "shape": list(item_vectors.shape),
+        "nnz": int(item_vectors.nnz),
+        "dtype": str(item_vectors.dtype),
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_item_vectors(path: str, mmap_mode: Optional[str] = None) -> sparse.csr_matrix:
+    """Carrega os vetores de itens salvos por save_item_vectors"""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"Manifesto não encontrado: {manifest_path}")
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    if manifest.get("format") != ITEM_VECTORS_FORMAT or manifest.get("version") != ITEM_VECTORS_VERSION:
+        raise ValueError(
+            f"Formato de vetores incompatível: {manifest.get('format')} v{manifest.get('version')} "
+            f"(esperado {ITEM_VECTORS_FORMAT} v{ITEM_VECTORS_VERSION})"
+        )
+
+    data, indices, indptr = (
+        np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in CSR_ARRAYS
+    )
+    return sparse.csr_matrix((data, indices, indptr), shape=tuple(manifest["shape"]), copy=False)
+
+
+def row_slice(item_vectors: sparse.csr_matrix, start: int, end: int) -> sparse.csr_matrix:
+    """Linhas [start, end) como CSR sem copiar data/indices (continuam views do mmap)"""
+    indptr = item_vectors.indptr
+    low, high = int(indptr[start]), int(indptr[end])
+    return sparse.csr_matrix(
+        (item_vectors.data[low:high], item_vectors.indices[low:high], np.asarray(indptr[start:end + 1]) - low),
+        shape=(end - start, item_vectors.shape[1]), copy=False,
+    )
+
+
+def profile_vector(item_vectors: sparse.csr_matrix, rows: Sequence[int]) -> np.ndarray:
+    """Vetor de perfil: média dos vetores das linhas, L2-normalizada (denso, float32)"""
+    if len(rows) == 0:
+        return np.zeros(item_vectors.shape[1], dtype=np.float32)
+
+    profile = np.asarray(item_vectors[rows].mean(axis=0), dtype=np.float32).ravel()
+    norm = np.linalg.norm(profile)
+    if norm > 0:
+        profile /= norm
+    return profile
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Índices dos k maiores scores, em ordem decrescente"""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class RowSelection:
+    """Subconjunto de linhas aceitas por um filtro: máscara booleana + linhas (sob demanda)"""
+
+    __slots__ = ("mask", "count", "_rows")
+
+    def __init__(self, mask: np.ndarray):
+        self.mask = mask
+        self.count = int(np.count_nonzero(mask))
+        self._rows = None
+
+    @property
+    def rows(self) -> np.ndarray:
+        if self._rows is None:
+            self._rows = np.flatnonzero(self.mask)
+        return self._rows
+
+
+def excluded_mask(rows: np.ndarray, exclude: Optional[np.ndarray]) -> np.ndarray:
+    """Máscara das linhas presentes em `exclude` (ordenado): busca binária, O(len(rows) log len(exclude))"""
+    if exclude is None or len(exclude) == 0:
+        return np.zeros(len(rows), dtype=bool)
+    positions = np.minimum(np.searchsorted(exclude, rows), len(exclude) - 1)
+    return exclude[positions] == rows
+
+
+def top_k_masked(scores: np.ndarray, k: int) -> np.ndarray:
+    """top_k ignorando scores -inf (itens excluídos): pode devolver menos de k"""
+    best = top_k(scores, k)
+    return best[np.isfinite(scores[best])]
+
+
+def top_k_similar(item_vectors: sparse.csr_matrix, profile: np.ndarray, k: int,
+                  exclude: Optional[np.ndarray] = None,
+                  allowed: Optional[RowSelection] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Busca os k itens mais similares ao perfil (similaridade de cosseno)
+
+    Como as linhas já estão L2-normalizadas, o cosseno é só o produto escalar.
+    Linhas em `exclude` (ex.: itens já vistos) e fora de `allowed` (filtros)
+    recebem -inf antes do argpartition: o resultado tem k itens sempre que o
+    catálogo permite. Filtros seletivos pontuam só as linhas aceitas.
+    """
+    if allowed is not None and allowed.count * SUBSET_SEARCH_RATIO < item_vectors.shape[0]:
+        return top_k_in_rows(item_vectors, profile, k, allowed.rows, exclude)
+    scores = item_vectors @ profile
+    if allowed is not None:
+        scores = np.where(allowed.mask, scores, np.float32(-np.inf))
+    if exclude is not None and len(exclude):
+        scores[exclude] = -np.inf
+    rows = top_k_masked(scores, k)
+    return rows, scores[rows]
+
+
+def top_k_similar_many(item_vectors: sparse.csr_matrix, profiles: np.ndarray, k: int,
+                       excludes: Sequence[Optional[np.ndarray]],
+                       allowed: Optional[RowSelection] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """top_k_similar para vários perfis (B x D): uma passada pelos vetores de itens por bloco
+
+    Cada consulta recebe exatamente o resultado de top_k_similar com o seu
+    `exclude`: os scores de cada coluna do produto de matrizes são os do
+    produto matriz-vetor, e o mascaramento e o top-k são os mesmos.
+    """
+    subset = allowed is not None and allowed.count * SUBSET_SEARCH_RATIO < item_vectors.shape[0]
+    rows = allowed.rows if subset else None
+    matrix = item_vectors[rows] if subset else item_vectors
+    block = max(1, BLOCK_SCORES // max(1, matrix.shape[0]))
+    results = []
+
+    for start in range(0, profiles.shape[0], block):
+        # (N x D) @ (D x b), transposto para uma linha de scores por consulta
+        scores = np.ascontiguousarray(np.asarray(matrix @ profiles[start:start + block].T, dtype=np.float32).T)
+        for query_scores, exclude in zip(scores, excludes[start:start + block]):
+            if subset:
+                query_scores[excluded_mask(rows, exclude)] = -np.inf
+                best = top_k_masked(query_scores, k)
+                results.append((rows[best].astype(np.int64), query_scores[best]))
+                continue
+            if allowed is not None:
+                query_scores[~allowed.mask] = -np.inf
+            if exclude is not None and len(exclude):
+                query_scores[exclude] = -np.inf
+            best = top_k_masked(query_scores, k)
+            results.append((best, query_scores[best]))
+    return results
+
+
+def top_k_in_rows(item_vectors: sparse.csr_matrix, profile: np.ndarray, k: int, rows: np.ndarray,
+                  exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k exato restrito às linhas `rows` (custo proporcional a elas, não ao catálogo)"""
+    scores = np.asarray(item_vectors[rows] @ profile, dtype=np.float32)
+    scores[excluded_mask(rows, exclude)] = -np.inf
+    best = top_k_masked(scores, k)
+    return rows[best].astype(np.int64), scores[best]
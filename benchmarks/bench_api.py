@@ -0,0 +1,257 @@
+"""Suíte de carga da API: cenários reprodutíveis contra o app em processo
+
+Cada tamanho de catálogo roda em um processo separado (RSS isolado): o app
+é servido via ASGI (httpx.ASGITransport), sem rede nem uvicorn, com Redis
+substituído por um stub assíncrono (ou fakeredis, se instalado). Cenários:
+
+- recommend_cold: históricos inéditos, cache vazio (scoring em toda requisição)
+- recommend_warm: históricos repetidos, hits no L1
+- recommend_l2: os mesmos históricos com o L1 vazio, hits no Redis
+- batch: /recommend/batch com --batch-size usuários por chamada
+- cold_start: /recommend sem histórico válido (ranking de popularidade)
+- items_paging: GET /items com offsets aleatórios
+- items_popular: GET /items/popular por gênero
+
+A saída é uma linha JSON com p50/p95/p99, throughput e memória por cenário;
+com --output ela é acrescentada ao arquivo (JSON lines), para acompanhar
+regressões entre commits.
+
+Uso:
+    python -m benchmarks.bench_api --items 10000 100000 --concurrency 16 --requests 2000
+    python -m benchmarks.bench_api --items 1000000 --bundle-dir /tmp/bundles --output bench.jsonl
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+from benchmarks.common import emit, latency_summary, memory_breakdown, run_worker
+from benchmarks.synthetic import GENRES, make_histories, make_items_df, make_ratings
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("recommend_cold", "recommend_warm", "recommend_l2", "batch", "cold_start",
+             "items_paging", "items_popular")
+# Acima disso a tabela de vizinhos (N x N similaridades no treino) não é construída
+NEIGHBOR_TABLE_MAX_ITEMS = 200_000
+
+
+def build_bundle(num_items: int, path: str, num_shards: int = 0):
+    """Bundle sintético: vetores, IVF, popularidade, colaborativo, (catálogos menores) vizinhos e shards"""
+    from app.artifacts import new_version_path, publish_bundle, save_bundle
+    from app.collaborative import InteractionsBuilder, build_collaborative
+    from app.index import build_index
+    from app.neighbors import build_neighbor_table
+    from app.popularity import build_popularity
+    from app.shards import ShardLayout
+    from train_model import INDEX_BACKEND, build_item_vectors
+
+    items_df = make_items_df(num_items)
+    vectorizer, item_vectors = build_item_vectors(items_df)
+    index = build_index(INDEX_BACKEND, item_vectors)
+    neighbor_table = build_neighbor_table(item_vectors) if num_items <= NEIGHBOR_TABLE_MAX_ITEMS else None
+    ratings = make_ratings(num_items, num_items * 10)
+    popularity = build_popularity(items_df.index.to_numpy(), items_df["genres"].tolist(), ratings)
+    interactions = InteractionsBuilder()
+    interactions.add(ratings)
+    collaborative = build_collaborative(interactions.matrix(items_df.index.to_numpy()))
+    shards = ShardLayout.build(item_vectors, num_shards, INDEX_BACKEND) if num_shards > 0 else None
+    version_path = new_version_path(path)
+    save_bundle(version_path, items_df, item_vectors, vectorizer, index, neighbor_table, popularity,
+                collaborative, shards, version=os.path.basename(version_path))
+    publish_bundle(version_path, path)
+
+
+def make_redis(kind: str, latency_ms: float):
+    if kind == "none":
+        return None
+    if kind == "fakeredis":
+        from fakeredis import aioredis
+        return aioredis.FakeRedis()
+    from benchmarks.stub_redis import StubRedis
+    return StubRedis(latency=latency_ms / 1000)
+
+
+async def run_scenario(client, make_request, num_requests: int, concurrency: int) -> dict:
+    """Dispara num_requests requisições com `concurrency` clientes; latências e status"""
+    latencies = []
+    status = {}
+    cached = answered = 0
+    counter = iter(range(num_requests))
+
+    async def worker():
+        nonlocal cached, answered
+        for i in counter:
+            method, url, payload = make_request(i)
+            start = time.perf_counter()
+            response = await client.request(method, url, json=payload)
+            latencies.append(time.perf_counter() - start)
+            status[response.status_code] = status.get(response.status_code, 0) + 1
+            # Um "cached" por usuário (lotes têm vários); rotas de itens não têm
+            cached += response.content.count(b'"cached":true')
+            answered += response.content.count(b'"cached":')
+            # Hits no L1 não suspendem: sem ceder o loop, um cliente monopolizaria o worker
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": num_requests,
+        "throughput_rps": round(num_requests / elapsed, 1),
+        "latency": latency_summary(latencies),
+        "cached_ratio": round(cached / answered, 4) if answered else None,
+        "status_codes": {str(code): count for code, count in sorted(status.items())},
+    }
+
+
+async def run_suite(args) -> dict:
+    import httpx
+    import app.cache
+    from app import main as api
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+    redis_client = make_redis(args.redis, args.redis_latency_ms)
+    app.cache.redis_client = redis_client
+    api.DEFAULT_BUNDLE_PATH = args.dir
+
+    start = time.perf_counter()
+    await api.start_services()
+    startup_seconds = time.perf_counter() - start
+    memory_after_load = memory_breakdown()
+
+    num_items, k = args.items[0], args.k
+    rng = random.Random(0)
+    # Históricos inéditos para cada requisição fria; um conjunto fixo para as quentes
+    cold_histories = make_histories(num_items, args.requests, max_len=20, seed=1)
+    warm_histories = make_histories(num_items, args.warm_histories, max_len=20, seed=2)
+    batch_histories = make_histories(num_items, args.requests, max_len=20, seed=3)
+    genres = list(GENRES)
+
+    def recommend(history, user):
+        return "POST", "/recommend", {"user_id": user, "item_ids": history, "num_recommendations": k}
+
+    requests = {
+        "recommend_cold": lambda i: recommend(cold_histories[i % len(cold_histories)], f"cold_{i}"),
+        "recommend_warm": lambda i: recommend(warm_histories[i % len(warm_histories)], f"warm_{i}"),
+        "recommend_l2": lambda i: recommend(warm_histories[i % len(warm_histories)], f"l2_{i}"),
+        "batch": lambda i: ("POST", "/recommend/batch", {
+            "requests": [{"user_id": f"batch_{i}_{j}", "item_ids": rng.choice(batch_histories)}
+                         for j in range(args.batch_size)],
+            "num_recommendations": k,
+        }),
+        "cold_start": lambda i: recommend(["0"] if i % 2 else [], f"new_{i}"),
+        "items_paging": lambda i: ("GET", f"/items?limit=20&offset={rng.randrange(max(num_items - 20, 1))}", None),
+        "items_popular": lambda i: ("GET", f"/items/popular?limit={k}&genre={rng.choice(genres)}", None),
+    }
+
+    transport = httpx.ASGITransport(app=api.app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for name in args.scenarios:
+            if name in ("recommend_cold", "batch"):
+                app.cache.local_cache.clear()
+            elif name in ("recommend_warm", "recommend_l2"):
+                # Aquece o L1 e o Redis com os históricos fixos
+                for i in range(len(warm_histories)):
+                    method, url, payload = requests["recommend_warm"](i)
+                    await client.request(method, url, json=payload)
+                if name == "recommend_l2":
+                    app.cache.local_cache.clear()
+                    # Com L1 ativo só o primeiro acesso de cada chave iria ao Redis
+                    max_entries, app.cache.local_cache.max_entries = app.cache.local_cache.max_entries, 0
+            num_requests = args.requests // args.batch_size if name == "batch" else args.requests
+            results[name] = await run_scenario(client, requests[name], max(num_requests, 1), args.concurrency)
+            if name == "recommend_l2":
+                app.cache.local_cache.max_entries = max_entries
+            logger.info(f"{name}: {results[name]['throughput_rps']} req/s, "
+                        f"p99 {results[name]['latency'].get('p99_ms')} ms")
+
+    await api.stop_services()
+    return {
+        "items": num_items,
+        "startup_seconds": round(startup_seconds, 3),
+        "memory_after_load": memory_after_load,
+        "memory_after_run": memory_breakdown(),
+        "scenarios": results,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="Requisições por cenário")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--warm-histories", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10, help="num_recommendations")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--redis", choices=("stub", "fakeredis", "none"), default="stub")
+    parser.add_argument("--redis-latency-ms", type=float, default=0.5)
+    parser.add_argument("--bundle-dir", help="Reaproveita bundles já gerados (um por tamanho)")
+    parser.add_argument("--output", help="Acrescenta o resultado (JSON lines) a este arquivo")
+    parser.add_argument("--worker", action="store_true")
+    parser.add_argument("--dir")
+    args = parser.parse_args()
+
+    if args.worker:
+        emit(asyncio.run(run_suite(args)))
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        bundle_root = args.bundle_dir or tmp
+        results = []
+        for num_items in args.items:
+            path = os.path.join(bundle_root, f"items_{num_items}", "bundle")
+            if not os.path.exists(os.path.join(path, "manifest.json")):
+                logger.info(f"Gerando bundle com {num_items} itens...")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                build_bundle(num_items, path)
+
+            logger.info(f"Rodando cenários com {num_items} itens...")
+            results.append(run_worker("benchmarks.bench_api", [
+                "--worker", "--dir", path, "--items", str(num_items),
+                "--concurrency", str(args.concurrency), "--requests", str(args.requests),
+                "--batch-size", str(args.batch_size), "--warm-histories", str(args.warm_histories),
+                "-k", str(args.k), "--scenarios", *args.scenarios,
+                "--redis", args.redis, "--redis-latency-ms", str(args.redis_latency_ms),
+            ]))
+
+    result = {
+        "benchmark": "api",
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "batch_size": args.batch_size,
+        "k": args.k,
+        "redis": args.redis,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result, sort_keys=True) + "\n")
+    emit(result)
+
+
+if __name__ == "__main__":
+    main()
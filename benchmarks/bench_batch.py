@@ -0,0 +1,83 @@
+"""Benchmark: /recommend/batch vs um loop de chamadas a /recommend (usuários/s)
+
+Chama os handlers do FastAPI diretamente (sem HTTP, sem Redis) sobre um bundle
+sintético, para isolar o custo de scoring e montagem das respostas.
+
+Uso:
+    python -m benchmarks.bench_batch --items 50000 --users 500 --batch-size 100 500
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.common import emit
+from benchmarks.synthetic import make_histories, make_items_df, make_ratings
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[50, 200, 500])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        # build_bundle publica um symlink para a versão em tmp/versions
+        path = os.path.join(tmp, "bundle")
+        from train_model import build_bundle
+        build_bundle(make_items_df(args.items), path, make_ratings(args.items, args.items * 20))
+        os.environ["MODEL_BUNDLE_PATH"] = path
+
+        import app.cache
+        from app import main as api
+        app.cache.redis_client = None
+        api.DEFAULT_BUNDLE_PATH = path
+
+        requests = [
+            api.RecommendationRequest(user_id=f"user_{i}", item_ids=history, num_recommendations=args.k)
+            for i, history in enumerate(make_histories(args.items, args.users, max_len=20))
+        ]
+
+        async def single_loop():
+            for request in requests:
+                await api.recommend_items(request)
+
+        async def batched(size):
+            for start in range(0, len(requests), size):
+                await api.recommend_items_batch(api.BatchRecommendationRequest(
+                    requests=requests[start:start + size], num_recommendations=args.k
+                ))
+
+        async def run():
+            await api.start_services()
+            results = []
+            start = time.perf_counter()
+            await single_loop()
+            elapsed = time.perf_counter() - start
+            results.append({"mode": "single_loop", "users_per_sec": round(len(requests) / elapsed, 1)})
+
+            for size in args.batch_size:
+                # Sem cache entre modos: cada modo calcula todos os usuários
+                app.cache.local_cache.clear()
+                start = time.perf_counter()
+                await batched(size)
+                elapsed = time.perf_counter() - start
+                results.append({"mode": "batch", "batch_size": size,
+                                "users_per_sec": round(len(requests) / elapsed, 1)})
+            await api.stop_services()
+            return results
+
+        results = asyncio.run(run())
+
+    emit({"benchmark": "batch", "items": args.items, "users": args.users, "k": args.k, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark: overhead por requisição das consultas ao catálogo, pandas vs ItemCatalog
+
+Mede só a parte que não é matemática: resolver os ids do histórico em linhas,
+montar os dicts dos candidatos de /recommend e a página de /items. O caminho
+pandas reproduz a API antiga (index.get_loc por item, iloc duas vezes por
+candidato, iterrows); o catálogo lê arrays mapeados em memória do bundle.
+
+Uso:
+    python -m benchmarks.bench_catalog --items 50000 --history-len 20 --k 10
+"""
+import argparse
+import logging
+import tempfile
+
+import numpy as np
+
+from app.artifacts import load_bundle, save_bundle
+from benchmarks.common import emit, latency_summary, time_calls
+from benchmarks.synthetic import make_histories, make_items_df
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--history-len", type=int, default=20)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--page", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from train_model import build_item_vectors
+
+    items_df = make_items_df(args.items)
+    rng = np.random.default_rng(0)
+    histories = [history[:args.history_len] for history in make_histories(args.items, args.queries, args.history_len * 2)]
+    candidates = [rng.choice(args.items, size=args.k, replace=False) for _ in range(args.queries)]
+    scores = [rng.random(args.k) for _ in range(args.queries)]
+    offsets = rng.integers(0, args.items - args.page, size=args.queries).tolist()
+
+    with tempfile.TemporaryDirectory() as path:
+        _, item_vectors = build_item_vectors(items_df)
+        save_bundle(path, items_df, item_vectors)
+        catalog = load_bundle(path, mmap_mode="r").catalog
+
+        def pandas_history(item_ids):
+            return [items_df.index.get_loc(int(i)) for i in item_ids if int(i) in items_df.index]
+
+        def pandas_candidates(i):
+            recommendations = []
+            for idx, score in zip(candidates[i], scores[i]):
+                item_id = items_df.iloc[idx].name
+                item_data = items_df.iloc[idx]
+                recommendations.append({"item_id": str(item_id), "title": item_data.get("title", ""),
+                                        "genres": item_data.get("genres", ""), "score": float(score)})
+            return recommendations
+
+        def pandas_list(offset):
+            return [{"item_id": str(item_id), "title": row["title"], "genres": row["genres"]}
+                    for item_id, row in items_df.iloc[offset:offset + args.page].iterrows()]
+
+        def catalog_candidates(i):
+            return catalog.items(candidates[i].tolist(), scores[i].tolist())
+
+        def catalog_list(offset):
+            return catalog.items(range(offset, offset + args.page))
+
+        positions = list(range(args.queries))
+        operations = {
+            "history_lookup": ((pandas_history, catalog.rows_of), histories),
+            "candidate_items": ((pandas_candidates, catalog_candidates), positions),
+            "list_items": ((pandas_list, catalog_list), offsets),
+        }
+
+        results = []
+        for operation, ((before, after), calls) in operations.items():
+            assert before(calls[0]) == after(calls[0]), operation
+            for name, fn in (("pandas", before), ("catalog", after)):
+                results.append({"operation": operation, "path": name,
+                                "latency": latency_summary(time_calls(fn, calls))})
+
+    emit({"benchmark": "catalog", "items": args.items, "history_len": args.history_len,
+          "k": args.k, "page": args.page, "results": results})
+
+
+if __name__ == "__main__":
+    main()
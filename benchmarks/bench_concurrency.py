@@ -0,0 +1,133 @@
+"""Teste de carga com tráfego misto: latência de cauda com scoring inline vs em executor
+
+Dentro de um mesmo worker (um event loop), clientes "leves" fazem /recommend
+com cache quente e GET /items/{id}, enquanto clientes "pesados" mandam lotes
+grandes para /recommend/batch. Com SCORING_MODE=inline (comportamento antigo)
+o scoring pesado trava o event loop e a cauda dos leves explode; com
+SCORING_MODE=thread o loop continua livre. O Redis é um stub assíncrono com
+latência configurável.
+
+Uso:
+    python -m benchmarks.bench_concurrency --items 50000 --duration 10 --light 20 --heavy 2
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import emit, latency_summary, run_worker
+from benchmarks.synthetic import make_histories, make_items_df, make_ratings
+
+logger = logging.getLogger(__name__)
+
+
+async def run_load(args):
+    import httpx
+    import app.cache
+    from app import main as api
+    from benchmarks.stub_redis import StubRedis
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+    app.cache.redis_client = StubRedis(latency=args.redis_latency_ms / 1000)
+    api.DEFAULT_BUNDLE_PATH = args.dir
+    await api.start_services()
+
+    histories = make_histories(args.items, 2000, max_len=20)
+    warm = [{"user_id": f"warm_{i}", "item_ids": h, "num_recommendations": 10}
+            for i, h in enumerate(histories[:100])]
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for payload in warm:
+            await client.post("/recommend", json=payload)
+
+        latencies = {"light": [], "heavy": []}
+        status = {}
+        deadline = time.perf_counter() + args.duration
+        rng = random.Random(0)
+
+        async def light_client():
+            while time.perf_counter() < deadline:
+                # Hits no L1 nunca suspendem: sem ceder o loop, um cliente monopolizaria o worker
+                await asyncio.sleep(0)
+                if rng.random() < 0.5:
+                    request = client.post("/recommend", json=rng.choice(warm))
+                else:
+                    request = client.get(f"/items/{rng.randint(1, args.items)}")
+                start = time.perf_counter()
+                response = await request
+                latencies["light"].append(time.perf_counter() - start)
+                status[response.status_code] = status.get(response.status_code, 0) + 1
+
+        async def heavy_client(worker):
+            batch = 0
+            while time.perf_counter() < deadline:
+                payload = {"requests": [
+                    {"user_id": f"heavy_{worker}_{batch}_{i}", "item_ids": rng.choice(histories)}
+                    for i in range(args.batch_size)
+                ], "num_recommendations": 10}
+                batch += 1
+                start = time.perf_counter()
+                response = await client.post("/recommend/batch", json=payload)
+                latencies["heavy"].append(time.perf_counter() - start)
+                status[response.status_code] = status.get(response.status_code, 0) + 1
+
+        await asyncio.gather(
+            *(light_client() for _ in range(args.light)),
+            *(heavy_client(i) for i in range(args.heavy)),
+        )
+
+    await api.stop_services()
+    return {
+        "mode": os.environ.get("SCORING_MODE", "thread"),
+        "light": latency_summary(latencies["light"]),
+        "heavy": latency_summary(latencies["heavy"]),
+        "status_codes": {str(code): count for code, count in sorted(status.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--light", type=int, default=20)
+    parser.add_argument("--heavy", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--redis-latency-ms", type=float, default=1.0)
+    parser.add_argument("--modes", nargs="+", default=["inline", "thread"])
+    parser.add_argument("--worker", action="store_true")
+    parser.add_argument("--dir")
+    args = parser.parse_args()
+
+    if args.worker:
+        emit(asyncio.run(run_load(args)))
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        # build_bundle publica um symlink para a versão em tmp/versions
+        path = os.path.join(tmp, "bundle")
+        from train_model import build_bundle
+        logger.info(f"Gerando bundle com {args.items} itens...")
+        build_bundle(make_items_df(args.items), path, make_ratings(args.items, args.items * 20))
+
+        results = []
+        for mode in args.modes:
+            logger.info(f"Carga mista com SCORING_MODE={mode}...")
+            os.environ["SCORING_MODE"] = mode
+            results.append(run_worker("benchmarks.bench_concurrency", [
+                "--worker", "--dir", path, "--items", str(args.items),
+                "--duration", str(args.duration), "--light", str(args.light),
+                "--heavy", str(args.heavy), "--batch-size", str(args.batch_size),
+                "--redis-latency-ms", str(args.redis_latency_ms),
+            ]))
+
+    emit({"benchmark": "concurrency", "items": args.items, "light_clients": args.light,
+          "heavy_clients": args.heavy, "batch_size": args.batch_size, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark: ingestão de eventos via /events e /recommend só com user_id
+
+Envia interações em NDJSON (vários POSTs concorrentes, cada um com um bloco
+de linhas) e mede eventos/s aceitos pelo endpoint e aplicados nos perfis,
+além do lag de frescor (recebimento -> perfil atualizado) do consumidor.
+Depois compara /recommend reenviando o histórico inteiro com /recommend só
+com user_id, para históricos longos. O Redis é um stub assíncrono.
+
+Uso:
+    python -m benchmarks.bench_events --items 20000 --users 2000 --events 200000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import emit, latency_summary
+
+logger = logging.getLogger(__name__)
+
+
+async def run(args, path):
+    import httpx
+    import app.cache
+    from app import main as api
+    from benchmarks.stub_redis import StubRedis
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+    app.cache.redis_client = StubRedis(latency=args.redis_latency_ms / 1000) if args.redis else None
+    api.DEFAULT_BUNDLE_PATH = path
+    await api.start_services()
+
+    rng = np.random.default_rng(0)
+    users = rng.integers(0, args.users, size=args.events)
+    items = rng.integers(1, args.items + 1, size=args.events)
+    lines = [json.dumps({"user_id": f"user_{u}", "item_id": str(i)}).encode() for u, i in zip(users, items)]
+    bodies = [b"\n".join(lines[start:start + args.lines_per_post])
+              for start in range(0, len(lines), args.lines_per_post)]
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        pending = list(bodies)
+
+        async def sender():
+            while pending:
+                await client.post("/events", content=pending.pop(),
+                                  headers={"content-type": "application/x-ndjson"})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+        accepted_at = time.perf_counter() - start
+        await api.event_consumer.wait_idle()
+        applied_at = time.perf_counter() - start
+        event_stats = api.event_consumer.stats()
+
+        # Histórico longo: reenviar os ids vs só o user_id (perfil já armazenado)
+        long_history = [str(i) for i in rng.choice(np.arange(1, args.items + 1), args.history_len, replace=False)]
+        await client.post("/events", content=b"\n".join(
+            json.dumps({"user_id": "long", "item_id": item_id}).encode() for item_id in long_history
+        ))
+        await api.event_consumer.wait_idle()
+
+        recommend = {"full_history": [], "user_only": []}
+        for k in range(5, 5 + args.queries):
+            for mode, payload in (("full_history", {"user_id": "long", "item_ids": long_history}),
+                                  ("user_only", {"user_id": "long"})):
+                # k distinto a cada iteração: sempre miss de cache, mede o scoring
+                payload = {**payload, "num_recommendations": k % 50 + 1}
+                app.cache.local_cache.clear()
+                begin = time.perf_counter()
+                await client.post("/recommend", json=payload)
+                recommend[mode].append(time.perf_counter() - begin)
+
+    await api.stop_services()
+    return {
+        "accepted_events_per_sec": round(args.events / accepted_at, 1),
+        "applied_events_per_sec": round(args.events / applied_at, 1),
+        "consumer": event_stats,
+        "recommend_history_len": args.history_len,
+        "recommend": {mode: latency_summary(values) for mode, values in recommend.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--lines-per-post", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--history-len", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--redis", action="store_true", help="perfis no stub de Redis em vez da memória")
+    parser.add_argument("--redis-latency-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        # build_bundle publica um symlink para a versão em tmp/versions
+        path = os.path.join(tmp, "bundle")
+        from train_model import build_bundle
+        from benchmarks.synthetic import make_items_df, make_ratings
+        build_bundle(make_items_df(args.items), path, make_ratings(args.items, args.items * 20))
+        result = asyncio.run(run(args, path))
+
+    emit({"benchmark": "events", "items": args.items, "users": args.users, "events": args.events,
+          "profile_store": "redis" if args.redis else "memory", **result})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Benchmark: scorer híbrido (conteúdo + colaborativo) vs só conteúdo
+
+Mede o treino do SVD truncado, o custo de pontuar o catálogo com os
+embeddings colaborativos (N x F denso, float32) contra os vetores TF-IDF
+(CSR com 5000 colunas) e a latência da recomendação híbrida (candidatos do
+índice re-pontuados com a mistura). A fidelidade da mistura por candidatos
+é o recall@k contra a mistura exata sobre o catálogo inteiro.
+
+Com --data (diretório do MovieLens, ex.: data/ml-latest-small), avalia
+também a qualidade: para cada usuário, a última avaliação positiva fica de
+fora e conta acerto se ela aparece no top-k (hit rate@k) de cada scorer.
+
+Uso:
+    python -m benchmarks.bench_hybrid --items 100000 --queries 200
+    python -m benchmarks.bench_hybrid --data data/ml-latest-small
+"""
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from app.collaborative import CF_CANDIDATES, CF_FACTORS, InteractionsBuilder, build_collaborative
+from app.index import ExactIndex, IVFIndex
+from app.vectors import profile_vector, top_k_similar
+from benchmarks.common import emit, latency_summary, time_calls
+from benchmarks.synthetic import make_histories, make_items_df, make_ratings
+
+logger = logging.getLogger(__name__)
+
+
+def hybrid_search(index, item_vectors, collaborative, rows, k, weight):
+    """Caminho da API: candidatos do índice re-pontuados com a mistura"""
+    profile = profile_vector(item_vectors, rows)
+    cf_profile = collaborative.profile(rows)
+    content = index.search(profile, k * CF_CANDIDATES, exclude=rows)[0]
+    if cf_profile is None:
+        return content[:k]
+    return collaborative.blend(item_vectors, profile, cf_profile, [content], k, weight)[0]
+
+
+def exact_blend(item_vectors, collaborative, rows, k, weight):
+    """Mistura exata: os dois scores para todas as linhas do catálogo"""
+    scores = (1 - weight) * (item_vectors @ profile_vector(item_vectors, rows))
+    cf_profile = collaborative.profile(rows)
+    if cf_profile is not None:
+        scores += weight * (collaborative.item_factors @ cf_profile)
+    scores[rows] = -np.inf
+    best = np.argpartition(-scores, k)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def hit_rate(data_dir, k, weights):
+    """Hit rate@k deixando de fora a última avaliação >= 4 de cada usuário"""
+    import pandas as pd
+    from train_model import build_item_vectors, read_movies
+
+    items_df = read_movies(os.path.join(data_dir, "movies.csv"))
+    item_ids = items_df.index.to_numpy(dtype=np.int64)
+    ratings = pd.read_csv(os.path.join(data_dir, "ratings.csv"))
+    ratings = ratings[ratings["movieId"].isin(item_ids)].sort_values(["userId", "timestamp"])
+    positive = ratings[ratings["rating"] >= 4]
+    held_out = positive.groupby("userId").tail(1)
+    train = ratings.drop(held_out.index)
+
+    _, item_vectors = build_item_vectors(items_df)
+    interactions = InteractionsBuilder()
+    interactions.add(train)
+    collaborative = build_collaborative(interactions.matrix(item_ids))
+    index = ExactIndex(item_vectors)
+    histories = {user: np.unique(np.searchsorted(item_ids, group["movieId"].to_numpy()))
+                 for user, group in train[train["rating"] >= 4].groupby("userId")}
+
+    results = {}
+    for weight in weights:
+        hits = total = 0
+        for user, movie_id in zip(held_out["userId"], held_out["movieId"]):
+            rows = histories.get(user)
+            if rows is None or rows.size == 0:
+                continue
+            target = np.searchsorted(item_ids, movie_id)
+            if weight == 0:
+                found = index.search(profile_vector(item_vectors, rows), k, exclude=rows)[0]
+            else:
+                found = hybrid_search(index, item_vectors, collaborative, rows, k, weight)
+            hits += int(target in found)
+            total += 1
+        results[f"cf_weight_{weight}"] = round(hits / max(total, 1), 4)
+    return {"users": total, "hit_rate": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--ratings-per-item", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--factors", type=int, default=CF_FACTORS)
+    parser.add_argument("--weight", type=float, default=0.5)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--data", help="Diretório do MovieLens para medir hit rate@k")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from train_model import build_item_vectors
+
+    items_df = make_items_df(args.items)
+    item_ids = items_df.index.to_numpy(dtype=np.int64)
+    _, item_vectors = build_item_vectors(items_df)
+    interactions = InteractionsBuilder()
+    interactions.add(make_ratings(args.items, args.items * args.ratings_per_item))
+
+    start = time.perf_counter()
+    matrix = interactions.matrix(item_ids)
+    collaborative = build_collaborative(matrix, args.factors)
+    train_seconds = time.perf_counter() - start
+
+    histories = [np.unique(np.asarray(history, dtype=np.int64) - 1)
+                 for history in make_histories(args.items, args.queries, max_len=20)]
+    profiles = [profile_vector(item_vectors, rows) for rows in histories]
+    cf_profiles = [collaborative.profile(rows) for rows in histories]
+    queries = [i for i in range(args.queries) if cf_profiles[i] is not None]
+    index = IVFIndex.build(item_vectors)
+    k = args.k
+
+    scoring = {
+        "content_exact": latency_summary(time_calls(
+            lambda i: top_k_similar(item_vectors, profiles[i], k, histories[i]), queries)),
+        "content_ivf": latency_summary(time_calls(
+            lambda i: index.search(profiles[i], k, exclude=histories[i]), queries)),
+        "cf_exact": latency_summary(time_calls(
+            lambda i: collaborative.search(cf_profiles[i], k, exclude=histories[i]), queries)),
+        "hybrid_ivf": latency_summary(time_calls(
+            lambda i: hybrid_search(index, item_vectors, collaborative, histories[i], k, args.weight), queries)),
+        "hybrid_exact_blend": latency_summary(time_calls(
+            lambda i: exact_blend(item_vectors, collaborative, histories[i], k, args.weight), queries)),
+    }
+    recall = np.mean([
+        len(np.intersect1d(hybrid_search(index, item_vectors, collaborative, histories[i], k, args.weight),
+                           exact_blend(item_vectors, collaborative, histories[i], k, args.weight))) / k
+        for i in queries
+    ])
+
+    vector_bytes = item_vectors.data.nbytes + item_vectors.indices.nbytes + item_vectors.indptr.nbytes
+    result = {
+        "benchmark": "hybrid", "items": args.items, "ratings": int(matrix.nnz), "k": k,
+        "factors": collaborative.factors, "weight": args.weight,
+        "cf_train_s": round(train_seconds, 3),
+        "content_vectors_mb": round(vector_bytes / 2**20, 2),
+        "cf_factors_mb": round(collaborative.item_factors.nbytes / 2**20, 2),
+        "scoring": scoring,
+        "hybrid_recall_vs_exact_blend": round(float(recall), 4),
+    }
+    if args.data:
+        result["quality"] = hit_rate(args.data, k, [0.0, 0.3, args.weight, 0.8])
+    emit(result)
+
+
+if __name__ == "__main__":
+    main()
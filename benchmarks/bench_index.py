@@ -0,0 +1,99 @@
+"""Benchmark de índices: recall@k x QPS do IVF contra a busca exata (força bruta)
+
+A verdade de referência é o ExactIndex; o NearestNeighbors(brute) do sklearn,
+usado pela API antes, entra como baseline de QPS.
+
+Uso:
+    python -m benchmarks.bench_index --items 200000 --nlist 1024 --nprobe 4 8 16 32 64
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from app.index import ExactIndex, IVFIndex
+from app.vectors import profile_vector
+from benchmarks.common import emit, latency_summary
+from benchmarks.synthetic import make_histories, make_items_df
+
+logger = logging.getLogger(__name__)
+
+
+def measure(search, queries, k):
+    """Roda todas as consultas e devolve (resultados, latências)"""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = search(query, k)
+        latencies.append(time.perf_counter() - start)
+        results.append(rows)
+    return results, latencies
+
+
+def recall_at_k(results, truth) -> float:
+    hits = sum(len(np.intersect1d(r, t)) for r, t in zip(results, truth))
+    return hits / max(1, sum(len(t) for t in truth))
+
+
+def report(name, latencies, recall=None, **extra):
+    total = sum(latencies)
+    return {
+        "index": name,
+        "qps": round(len(latencies) / total, 1) if total else None,
+        "recall_at_k": round(recall, 4) if recall is not None else None,
+        "latency": latency_summary(latencies),
+        **extra,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[2, 4, 8, 16, 32, 64])
+    parser.add_argument("--skip-sklearn", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from train_model import build_item_vectors
+
+    logger.info(f"Gerando catálogo sintético com {args.items} itens...")
+    _, item_vectors = build_item_vectors(make_items_df(args.items))
+    queries = [
+        profile_vector(item_vectors, [int(i) - 1 for i in history])
+        for history in make_histories(args.items, args.queries)
+    ]
+
+    results = []
+    exact = ExactIndex(item_vectors)
+    truth, latencies = measure(exact.search, queries, args.k)
+    results.append(report("exact", latencies, 1.0))
+
+    if not args.skip_sklearn:
+        from sklearn.neighbors import NearestNeighbors
+        nn_model = NearestNeighbors(metric="cosine", algorithm="brute").fit(item_vectors)
+        _, latencies = measure(
+            lambda q, k: nn_model.kneighbors([q], n_neighbors=k)[::-1], queries, args.k
+        )
+        results.append(report("sklearn_brute", latencies))
+
+    logger.info("Treinando IVF...")
+    start = time.perf_counter()
+    ivf = IVFIndex.build(item_vectors, nlist=args.nlist)
+    build_seconds = round(time.perf_counter() - start, 2)
+
+    for nprobe in args.nprobe:
+        found, latencies = measure(lambda q, k: ivf.search(q, k, nprobe=nprobe), queries, args.k)
+        results.append(report(
+            "ivf", latencies, recall_at_k(found, truth),
+            nlist=ivf.nlist, nprobe=nprobe, build_seconds=build_seconds,
+        ))
+
+    emit({"benchmark": "index", "items": args.items, "k": args.k, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Benchmark: formato denso legado (item_vectors.pkl + NearestNeighbors) vs CSR float32
+
+Cada formato é carregado em um processo separado, simulando um worker do
+uvicorn, para medir a memória por worker e a latência p50/p99 do caminho
+de /recommend (perfil do usuário + busca por similaridade).
+
+Uso:
+    python -m benchmarks.bench_item_vectors --items 20000 --queries 500
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+from app.vectors import load_item_vectors, profile_vector, save_item_vectors, top_k_similar
+from benchmarks.common import emit, latency_summary, rss_bytes, run_worker, time_calls
+from benchmarks.synthetic import make_histories, make_items_df
+
+logger = logging.getLogger(__name__)
+
+NUM_RECOMMENDATIONS = 5
+
+
+def build_artifacts(num_items: int, path: str):
+    """Gera os dois formatos a partir do mesmo catálogo sintético"""
+    from sklearn.neighbors import NearestNeighbors
+    from train_model import build_item_vectors
+
+    items_df = make_items_df(num_items)
+    _, item_vectors = build_item_vectors(items_df)
+
+    # Formato legado, exatamente como train_model salvava antes
+    legacy_vectors = item_vectors.astype(np.float64)
+    nn_model = NearestNeighbors(n_neighbors=min(50, num_items), metric="cosine", algorithm="brute")
+    nn_model.fit(legacy_vectors)
+    joblib.dump(nn_model, os.path.join(path, "nearest_neighbors.pkl"))
+    joblib.dump(legacy_vectors.toarray(), os.path.join(path, "item_vectors.pkl"))
+
+    save_item_vectors(item_vectors, os.path.join(path, "item_vectors"))
+
+
+def legacy_worker(path: str):
+    nn_model = joblib.load(os.path.join(path, "nearest_neighbors.pkl"))
+    item_vectors = joblib.load(os.path.join(path, "item_vectors.pkl"))
+    num_items = item_vectors.shape[0]
+
+    def recommend(rows):
+        profile = np.mean(item_vectors[rows], axis=0)
+        return nn_model.kneighbors([profile], n_neighbors=min(NUM_RECOMMENDATIONS * 3, num_items))
+
+    return recommend
+
+
+def csr_worker(path: str):
+    item_vectors = load_item_vectors(os.path.join(path, "item_vectors"))
+    num_items = item_vectors.shape[0]
+
+    def recommend(rows):
+        profile = profile_vector(item_vectors, rows)
+        return top_k_similar(item_vectors, profile, min(NUM_RECOMMENDATIONS * 3, num_items))
+
+    return recommend
+
+
+WORKERS = {"legacy": legacy_worker, "csr": csr_worker}
+
+
+def run_format(fmt: str, path: str, num_items: int, num_queries: int):
+    """Executado dentro do processo filho: carrega um formato e mede"""
+    histories = make_histories(num_items, num_queries)
+    # Ids sintéticos são 1..N, então a linha é id - 1
+    rows_list = [[int(i) - 1 for i in history] for history in histories]
+
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    recommend = WORKERS[fmt](path)
+    load_seconds = time.perf_counter() - start
+    rss_after = rss_bytes()
+
+    latencies = time_calls(recommend, rows_list)
+    emit({
+        "format": fmt,
+        "items": num_items,
+        "load_seconds": round(load_seconds, 4),
+        "worker_rss_mb": round((rss_after - rss_before) / 2**20, 2),
+        "latency": latency_summary(latencies),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--worker", choices=sorted(WORKERS))
+    parser.add_argument("--dir")
+    args = parser.parse_args()
+
+    if args.worker:
+        run_format(args.worker, args.dir, args.items, args.queries)
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as path:
+        logger.info(f"Gerando artefatos para {args.items} itens...")
+        build_artifacts(args.items, path)
+
+        results = []
+        for fmt in WORKERS:
+            logger.info(f"Medindo formato {fmt}...")
+            results.append(run_worker("benchmarks.bench_item_vectors", [
+                "--worker", fmt, "--dir", path,
+                "--items", str(args.items), "--queries", str(args.queries),
+            ]))
+
+    emit({"benchmark": "item_vectors", "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark: job de materialização (materialize.py) em usuários/s
+
+Gera um bundle e um ratings.csv sintéticos e roda o job completo (leitura dos
+históricos, scoring em lote de /recommend no pool de processos e gravação em pipeline) para
+cada número de processos e tamanho de pipeline. O Redis é o stub síncrono com
+latência de rede configurável (--redis real usa REDIS_HOST/REDIS_PORT): com
+pipeline 1 cada SET paga um round trip, que é o que limita a gravação.
+
+Uso:
+    python -m benchmarks.bench_materialize --items 50000 --users 20000 --jobs 1 2 4 --pipeline 1 1000
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+from benchmarks.common import emit
+from benchmarks.stub_redis import SyncStubRedis
+from benchmarks.synthetic import make_ratings
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--ratings-per-user", type=int, default=20)
+    parser.add_argument("-k", type=int, nargs="+", default=[5])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pipeline", type=int, nargs="+", default=[1, 1000])
+    parser.add_argument("--chunk-users", type=int, default=2000)
+    parser.add_argument("--redis", choices=("stub", "real"), default="stub")
+    parser.add_argument("--redis-latency-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from benchmarks.bench_api import build_bundle
+    from materialize import materialize
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bundle")
+        build_bundle(args.items, path)
+        ratings_path = os.path.join(tmp, "ratings.csv")
+        make_ratings(args.items, args.users * args.ratings_per_user, num_users=args.users).to_csv(
+            ratings_path, index=False)
+
+        for jobs in args.jobs:
+            for pipeline in args.pipeline:
+                client = SyncStubRedis(args.redis_latency_ms / 1000) if args.redis == "stub" else None
+                stats = materialize(ratings_path, path, args.k, client=client, n_jobs=jobs,
+                                    chunk_users=args.chunk_users, pipeline=pipeline, resume=False)
+                results.append({
+                    "jobs": jobs, "pipeline": pipeline, "users": stats["users"], "keys": stats["keys"],
+                    "seconds": stats["seconds"], "users_per_second": stats["users_per_second"],
+                    "write_seconds": stats["write_seconds"],
+                    "round_trips": client.calls if client is not None else None,
+                })
+                logger.info(f"{jobs} processos, pipeline {pipeline}: {stats['users_per_second']} usuários/s")
+
+    emit({"benchmark": "materialize", "items": args.items, "users": args.users, "k": args.k,
+          "cpu_count": os.cpu_count(), "redis": args.redis, "redis_latency_ms": args.redis_latency_ms,
+          "results": results})
+
+
+if __name__ == "__main__":
+    main()
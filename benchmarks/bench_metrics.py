@@ -0,0 +1,95 @@
+"""Custo da instrumentação: métricas desligadas x ligadas x ligadas com profiler
+
+Micro: custo por chamada de observe() e do context manager de etapa, e o
+tempo de renderizar /metrics. Ponta a ponta: os cenários de bench_api rodam
+em processos separados com METRICS_ENABLED=0, METRICS_ENABLED=1 e
+METRICS_ENABLED=1 + PROFILER_ENABLED=1 (amostragem a cada 10 ms).
+
+Uso:
+    python -m benchmarks.bench_metrics --items 20000 --requests 2000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.common import emit, run_worker
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    "metrics_off": {"METRICS_ENABLED": "0", "PROFILER_ENABLED": "0"},
+    "metrics_on": {"METRICS_ENABLED": "1", "PROFILER_ENABLED": "0"},
+    "metrics_profiler": {"METRICS_ENABLED": "1", "PROFILER_ENABLED": "1"},
+}
+
+
+def micro(calls: int) -> dict:
+    from app.metrics import Histogram, registry, stage
+
+    series = Histogram("bench_seconds", "Série de benchmark", ["stage"]).labels("bench")
+    values = [i * 1e-6 for i in range(calls)]
+
+    start = time.perf_counter()
+    for value in values:
+        series.observe(value)
+    observe_ns = (time.perf_counter() - start) / calls * 1e9
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        with series.time():
+            pass
+    timer_ns = (time.perf_counter() - start) / calls * 1e9
+
+    for name in ("cache_get", "cache_set", "profile_load", "search", "serialize"):
+        stage(name).observe(0.001)
+    start = time.perf_counter()
+    body = registry.render()
+    render_ms = (time.perf_counter() - start) * 1000
+
+    return {"observe_ns": round(observe_ns, 1), "stage_timer_ns": round(timer_ns, 1),
+            "render_ms": round(render_ms, 3), "render_bytes": len(body)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--calls", type=int, default=200_000, help="Chamadas no micro-benchmark")
+    parser.add_argument("--scenarios", nargs="+", default=["recommend_cold", "recommend_warm"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    results = {"micro": micro(args.calls)}
+    with tempfile.TemporaryDirectory() as tmp:
+        from benchmarks.bench_api import build_bundle
+        path = os.path.join(tmp, "bundle")
+        logger.info(f"Gerando bundle com {args.items} itens...")
+        build_bundle(args.items, path)
+
+        environ = dict(os.environ)
+        for name, env in VARIANTS.items():
+            logger.info(f"Rodando {name}...")
+            os.environ.update(env)
+            try:
+                run = run_worker("benchmarks.bench_api", [
+                    "--worker", "--dir", path, "--items", str(args.items),
+                    "--concurrency", str(args.concurrency), "--requests", str(args.requests),
+                    "--scenarios", *args.scenarios,
+                ])
+            finally:
+                os.environ.clear()
+                os.environ.update(environ)
+            results[name] = {
+                scenario: {"throughput_rps": data["throughput_rps"],
+                           "p50_ms": data["latency"].get("p50_ms"), "p99_ms": data["latency"].get("p99_ms")}
+                for scenario, data in run["scenarios"].items()
+            }
+
+    emit({"benchmark": "metrics", "items": args.items, "requests": args.requests, **results})
+
+
+if __name__ == "__main__":
+    main()
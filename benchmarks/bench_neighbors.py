@@ -0,0 +1,82 @@
+"""Benchmark: tabela de vizinhos pré-computada vs busca vetorial para históricos curtos
+
+Para históricos de 1 e 2 itens, compara a latência da mescla das listas de
+vizinhos com a busca pelo perfil (índice exato e IVF) e mede a concordância
+(recall@k) da tabela com a busca exata. Reporta também o tempo de construção
+da tabela com 1 núcleo e com todos.
+
+Uso:
+    python -m benchmarks.bench_neighbors --items 100000 --k 10
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from app.index import ExactIndex, IVFIndex
+from app.neighbors import NEIGHBOR_TABLE_K, build_neighbor_table
+from app.vectors import profile_vector
+from benchmarks.common import emit, latency_summary, time_calls
+from benchmarks.synthetic import make_histories, make_items_df
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--table-k", type=int, default=NEIGHBOR_TABLE_K)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from train_model import build_item_vectors
+
+    _, item_vectors = build_item_vectors(make_items_df(args.items))
+
+    build = {}
+    for n_jobs in (1, -1):
+        start = time.perf_counter()
+        table = build_neighbor_table(item_vectors, args.table_k, n_jobs=n_jobs)
+        build[f"n_jobs={n_jobs}"] = round(time.perf_counter() - start, 2)
+
+    indexes = {"exact": ExactIndex(item_vectors), "ivf": IVFIndex.build(item_vectors)}
+
+    results = []
+    for history_len in (1, 2):
+        histories = [
+            [int(i) - 1 for i in history[:history_len]]
+            for history in make_histories(args.items, args.queries, max_len=10)
+            if len(history) >= history_len
+        ]
+
+        def table_path(rows):
+            return table.recommend(item_vectors, rows, args.k)
+
+        def search_path(index):
+            def run(rows):
+                found, scores = index.search(profile_vector(item_vectors, rows), args.k + len(rows))
+                return found[~np.isin(found, rows)][:args.k]
+            return run
+
+        results.append({"path": "neighbor_table", "history_len": history_len,
+                        "latency": latency_summary(time_calls(table_path, histories))})
+
+        truth = [search_path(indexes["exact"])(rows) for rows in histories]
+        answered = [table_path(rows) for rows in histories]
+        hits = sum(len(np.intersect1d(a[0], t)) for a, t in zip(answered, truth) if a is not None)
+        results[-1]["recall_at_k_vs_exact"] = round(hits / max(1, sum(len(t) for t in truth)), 4)
+        results[-1]["fallback_rate"] = round(sum(a is None for a in answered) / len(answered), 4)
+
+        for name, index in indexes.items():
+            results.append({"path": f"vector_search_{name}", "history_len": history_len,
+                            "latency": latency_summary(time_calls(search_path(index), histories))})
+
+    emit({"benchmark": "neighbors", "items": args.items, "k": args.k,
+          "table_k": args.table_k, "build_seconds": build, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark: cold start (usuário sem histórico válido) com ranking pré-computado
+
+Compara o caminho antigo (items_df.head + iterrows, scores inventados), um
+ranking calculado por requisição com pandas a partir de ratings.csv, e a
+fatia O(k) do ranking bayesiano salvo no bundle (global e por gênero).
+Reporta também o tempo de construção do ranking no treino.
+
+Uso:
+    python -m benchmarks.bench_popularity --items 50000 --ratings 1000000 --k 10
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+from app.artifacts import load_bundle, save_bundle
+from app.popularity import build_popularity
+from benchmarks.common import emit, latency_summary, time_calls
+from benchmarks.synthetic import make_items_df, make_ratings
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--ratings", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from train_model import build_item_vectors
+
+    items_df = make_items_df(args.items)
+    ratings = make_ratings(args.items, args.ratings)
+    item_ids = items_df.index.to_numpy()
+
+    start = time.perf_counter()
+    popularity = build_popularity(item_ids, items_df["genres"].tolist(), ratings)
+    build_seconds = round(time.perf_counter() - start, 3)
+
+    with tempfile.TemporaryDirectory() as path:
+        _, item_vectors = build_item_vectors(items_df)
+        save_bundle(path, items_df, item_vectors, popularity=popularity)
+        bundle = load_bundle(path, mmap_mode="r")
+        genre = bundle.popularity.genres[0]
+        ks = [args.k] * args.queries
+
+        def head_iterrows(k):
+            return [
+                {"item_id": str(item_id), "title": data.get("title", ""),
+                 "genres": data.get("genres", ""), "score": 1.0 - idx * 0.1}
+                for idx, (item_id, data) in enumerate(items_df.head(k).iterrows())
+            ]
+
+        def pandas_per_request(k):
+            stats = ratings.groupby("movieId")["rating"].agg(["mean", "count"])
+            top = stats.sort_values(["mean", "count"], ascending=False).head(k)
+            return [{"item_id": str(item_id), "title": items_df.at[item_id, "title"], "score": score}
+                    for item_id, score in top["mean"].items()]
+
+        paths = {
+            "head_iterrows": (head_iterrows, ks),
+            "pandas_per_request": (pandas_per_request, ks[:max(10, args.queries // 50)]),
+            "precomputed": (lambda k: bundle.catalog.items_json(*bundle.popular(k)), ks),
+            "precomputed_genre": (lambda k: bundle.catalog.items_json(
+                *(column.tolist() for column in bundle.popularity.top(k, genre))), ks),
+        }
+        results = [
+            {"path": name, "latency": latency_summary(time_calls(fn, calls, warmup=2))}
+            for name, (fn, calls) in paths.items()
+        ]
+
+    emit({"benchmark": "popularity", "items": args.items, "ratings": args.ratings, "k": args.k,
+          "genres": len(popularity.genres), "build_seconds": build_seconds, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark: perfil recalculado do zero vs estado incremental, por tamanho de histórico
+
+Simula um usuário que volta com um item novo no histórico. O caminho antigo
+recalcula a média de todos os vetores do histórico; o incremental soma só o
+vetor do item novo ao estado salvo (e, no caso Redis, inclui desserializar o
+estado e serializar a soma e o id novo). `with_events` parte de um perfil
+salvo que também tem itens vindos de /events, fora do histórico enviado:
+eles são subtraídos em vez de o perfil ser refeito. Reporta também o tamanho
+serializado do estado e o que cada gravação envia ao Redis.
+
+Uso:
+    python -m benchmarks.bench_profiles --items 50000 --lengths 10 100 1000 5000
+"""
+import argparse
+import logging
+
+import numpy as np
+
+from app.profiles import ProfileCatalog, decode_profile, encode_profile, sync_profile_state
+from app.vectors import profile_vector
+from benchmarks.common import emit, latency_summary, time_calls
+from benchmarks.synthetic import make_items_df
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from train_model import build_item_vectors
+
+    _, item_vectors = build_item_vectors(make_items_df(args.items))
+    rng = np.random.default_rng(0)
+    catalog = ProfileCatalog("bench", np.arange(args.items, dtype=np.int64), item_vectors)
+
+    results = []
+    for length in args.lengths:
+        histories = [rng.choice(args.items, size=length + 6, replace=False) for _ in range(args.users)]
+        # Os 5 últimos são eventos: estão no perfil salvo, não no histórico enviado
+        events = [rows[-5:] for rows in histories]
+        histories = [rows[:-5] for rows in histories]
+        states = [sync_profile_state(None, item_vectors, rows[:-1])[0] for rows in histories]
+        blobs = [(encode_profile(state, catalog.version), catalog.ids_of(state.rows).tobytes()) for state in states]
+        with_events = [sync_profile_state(None, item_vectors, np.concatenate([rows[:-1], extra]))[0]
+                       for rows, extra in zip(histories, events)]
+
+        def full(i):
+            return profile_vector(item_vectors, histories[i])
+
+        def incremental(i):
+            state, _ = sync_profile_state(states[i], item_vectors, histories[i])
+            return state.profile()
+
+        def incremental_serialized(i):
+            state, _ = sync_profile_state(catalog.restore(*decode_profile(*blobs[i])), item_vectors, histories[i])
+            return encode_profile(state, catalog.version), catalog.ids_of(state.pending)
+
+        def incremental_with_events(i):
+            state, _ = sync_profile_state(with_events[i], item_vectors, histories[i])
+            return state.profile()
+
+        users = list(range(args.users))
+        drift = max(float(np.abs(full(i) - incremental(i)).max()) for i in users[:20])
+        events_drift = max(float(np.abs(full(i) - incremental_with_events(i)).max()) for i in users[:20])
+        writes = [incremental_serialized(i) for i in users]
+        results.append({
+            "history_len": length,
+            "full_recompute": latency_summary(time_calls(full, users)),
+            "incremental": latency_summary(time_calls(incremental, users)),
+            "incremental_serialized": latency_summary(time_calls(incremental_serialized, users)),
+            "incremental_with_events": latency_summary(time_calls(incremental_with_events, users)),
+            "state_bytes_mean": int(np.mean([len(total) + len(ids) for total, ids in blobs])),
+            "write_bytes_mean": int(np.mean([len(total) + ids.nbytes for total, ids in writes])),
+            "max_abs_diff": drift,
+            "max_abs_diff_with_events": events_drift,
+        })
+
+    emit({"benchmark": "profiles", "items": args.items, "features": item_vectors.shape[1], "results": results})
+
+
+if __name__ == "__main__":
+    main()
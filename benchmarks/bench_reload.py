@@ -0,0 +1,132 @@
+"""Teste de carga durante um reload a quente: nenhuma requisição falha nem fica lenta
+
+Clientes concorrentes fazem /recommend (histórico e só user_id) e
+GET /items/{id} contra a API em processo. No meio da carga uma versão nova do
+bundle é publicada (troca do symlink) e POST /admin/reload a carrega, aquece
+e troca. As latências são separadas em antes, durante (do pedido de reload
+até a troca) e depois, junto com os status HTTP. Perfis alimentados por
+/events antes da troca são lidos de novo na versão nova (refeitos pelos ids).
+
+Uso:
+    python -m benchmarks.bench_reload --items 50000 --duration 10 --clients 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import emit, latency_summary
+from benchmarks.synthetic import make_histories, make_items_df, make_ratings
+
+logger = logging.getLogger(__name__)
+
+
+async def run_load(args, path: str, next_version: str):
+    import httpx
+    import app.cache
+    from app import main as api
+    from app.artifacts import publish_bundle
+    from benchmarks.stub_redis import StubRedis
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+    app.cache.redis_client = StubRedis(latency=args.redis_latency_ms / 1000)
+    api.DEFAULT_BUNDLE_PATH = path
+    # Cada cliente tem no máximo uma requisição em voo: sem load shedding,
+    # qualquer status diferente de 200 vem da troca de modelo
+    api.scoring_executor.queue_depth = max(api.scoring_executor.queue_depth, args.clients)
+    await api.start_services()
+    version_before = api.model.version
+
+    histories = make_histories(args.items, 2000, max_len=20)
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        profile_users = [f"events_{i}" for i in range(args.clients)]
+        await client.post("/events", content="\n".join(
+            json.dumps({"user_id": user, "item_id": item})
+            for user, history in zip(profile_users, histories) for item in history
+        ))
+        await api.event_consumer.wait_idle()
+        
+        samples = []  # (início, latência, status)
+        swap = {}
+        start_at = time.perf_counter()
+        deadline = start_at + args.duration
+        rng = random.Random(0)
+
+        async def client_loop(worker):
+            while time.perf_counter() < deadline:
+                await asyncio.sleep(0)
+                choice = rng.random()
+                if choice < 0.5:
+                    request = client.post("/recommend", json={
+                        "user_id": f"user_{worker}", "item_ids": rng.choice(histories), "num_recommendations": 10,
+                    })
+                elif choice < 0.7:
+                    request = client.post("/recommend", json={"user_id": f"user_{worker}"})
+                else:
+                    request = client.get(f"/items/{rng.randint(1, args.items)}")
+                started = time.perf_counter()
+                response = await request
+                samples.append((started, time.perf_counter() - started, response.status_code))
+
+        async def reloader():
+            await asyncio.sleep(args.duration / 3)
+            publish_bundle(next_version, path)
+            swap["start"] = time.perf_counter()
+            response = await client.post("/admin/reload")
+            swap["end"] = time.perf_counter()
+            swap["response"] = response.json()
+
+        await asyncio.gather(reloader(), *(client_loop(i) for i in range(args.clients)))
+        kept = sum(state is not None for state in await api.model.profile_store.get_many(profile_users))
+        profiles = {"users": len(profile_users), "kept": kept, "migrated": api.model.profile_store.stats()["migrated"]}
+
+    version_after = api.model.version
+    await api.stop_services()
+
+    windows = {"before": [], "during": [], "after": []}
+    status = {}
+    for started, latency, code in samples:
+        window = "before" if started < swap["start"] else "during" if started < swap["end"] else "after"
+        windows[window].append(latency)
+        status[code] = status.get(code, 0) + 1
+
+    return {
+        "version_before": version_before,
+        "version_after": version_after,
+        "reload": swap["response"],
+        "latency": {name: latency_summary(values) for name, values in windows.items()},
+        "status_codes": {str(code): count for code, count in sorted(status.items())},
+        "failed": sum(count for code, count in status.items() if code != 200),
+        "profiles": profiles,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--redis-latency-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        from train_model import build_bundle
+        path = os.path.join(tmp, "bundle")
+        staging = os.path.join(tmp, "next", "bundle")
+        logger.info(f"Gerando duas versões do bundle com {args.items} itens...")
+        build_bundle(make_items_df(args.items), path, make_ratings(args.items, args.items * 20))
+        # Segunda versão treinada à parte; publicada no meio da carga
+        build_bundle(make_items_df(args.items, seed=43), staging, make_ratings(args.items, args.items * 20, seed=12))
+        result = asyncio.run(run_load(args, path, os.path.realpath(staging)))
+
+    emit({"benchmark": "reload", "items": args.items, "clients": args.clients, **result})
+
+
+if __name__ == "__main__":
+    main()
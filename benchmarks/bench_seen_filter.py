@@ -0,0 +1,76 @@
+"""Benchmark: itens já vistos filtrados depois da busca vs mascarados antes do top-k
+
+O caminho antigo pede `k * 3` candidatos e descarta os vistos em Python:
+históricos longos devolvem listas curtas. O novo passa as linhas vistas
+para o índice, que as mascara antes do argpartition (exato) ou antes do
+top-k das listas sondadas, ampliando a sondagem quando faltam itens (IVF).
+
+Os históricos são "coerentes" (vizinhos de um item semente), como os de
+usuários reais: os itens vistos são justamente os mais similares ao perfil.
+Reporta latência e a fração de respostas com menos de k itens.
+
+Uso:
+    python -m benchmarks.bench_seen_filter --items 100000 --lengths 5 50 500 2000
+"""
+import argparse
+import logging
+
+import numpy as np
+
+from app.index import ExactIndex, IVFIndex
+from app.vectors import profile_vector
+from benchmarks.common import emit, latency_summary, time_calls
+from benchmarks.synthetic import make_items_df
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_search(index, query, k, seen):
+    """Caminho antigo: k * 3 candidatos, filtro em Python"""
+    rows, scores = index.search(query, k * 3)
+    seen_rows = set(seen.tolist())
+    keep = [i for i, row in enumerate(rows.tolist()) if row not in seen_rows][:k]
+    return rows[keep], scores[keep]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[5, 50, 500, 2000])
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from train_model import build_item_vectors
+
+    _, item_vectors = build_item_vectors(make_items_df(args.items))
+    indexes = {"exact": ExactIndex(item_vectors), "ivf": IVFIndex.build(item_vectors)}
+    rng = np.random.default_rng(0)
+    k = args.k
+
+    results = []
+    for length in args.lengths:
+        seeds = rng.choice(args.items, size=args.users, replace=False)
+        histories = [
+            np.sort(indexes["exact"].search(item_vectors[seed].toarray().ravel(), length)[0]).astype(np.int32)
+            for seed in seeds
+        ]
+        queries = [profile_vector(item_vectors, rows) for rows in histories]
+        users = list(range(args.users))
+
+        row = {"history_len": length}
+        for name, index in indexes.items():
+            for mode, search in (("legacy", lambda i: legacy_search(index, queries[i], k, histories[i])),
+                                 ("masked", lambda i: index.search(queries[i], k, exclude=histories[i]))):
+                short = sum(len(search(i)[0]) < k for i in users)
+                row[f"{name}_{mode}"] = {**latency_summary(time_calls(search, users)),
+                                         "short_ratio": round(short / args.users, 4)}
+        results.append(row)
+        logger.info(f"Histórico {length}: {row}")
+
+    emit({"benchmark": "seen_filter", "items": args.items, "k": k, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark: custo de serialização por requisição, pydantic/JSONResponse vs bytes pré-montados
+
+Para /recommend (miss e hit de cache) e para uma página de /items, compara o
+caminho antigo (dicts -> modelo pydantic -> JSONResponse; no hit, json.loads
+do valor do Redis antes disso) com o atual: fragmentos JSON de cada item
+gravados no bundle, emendados em bytes, e o valor do cache usado como está.
+Só serialização: o scoring fica de fora.
+
+Uso:
+    python -m benchmarks.bench_serialization --items 50000 --k 10 50
+"""
+import argparse
+import json
+import logging
+import tempfile
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.artifacts import load_bundle, save_bundle
+from app.main import RecommendationResponse
+from app.responses import orjson, recommendation_body, recommendation_result
+from benchmarks.common import emit, latency_summary, time_calls
+from benchmarks.synthetic import make_items_df
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--page", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from train_model import build_item_vectors
+
+    items_df = make_items_df(args.items)
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as path:
+        _, item_vectors = build_item_vectors(items_df)
+        save_bundle(path, items_df, item_vectors)
+        catalog = load_bundle(path, mmap_mode="r").catalog
+
+        results = []
+        for k in args.k:
+            candidates = [(rng.choice(args.items, size=k, replace=False).tolist(), rng.random(k).tolist())
+                          for _ in range(args.queries)]
+            old_cached = [json.dumps({"recommendations": catalog.items(rows, scores), "strategy": "vector_search"})
+                          .encode() for rows, scores in candidates]
+            new_cached = [recommendation_result(catalog.items_json(rows, scores), "vector_search")
+                          for rows, scores in candidates]
+            positions = list(range(args.queries))
+
+            def pydantic_miss(i):
+                result = {"recommendations": catalog.items(*candidates[i]), "strategy": "vector_search"}
+                cached_value = json.dumps(result)
+                response = RecommendationResponse(user_id="user", **result, cached=False)
+                return JSONResponse(jsonable_encoder(response)).body, cached_value
+
+            def pydantic_hit(i):
+                response = RecommendationResponse(user_id="user", **json.loads(old_cached[i]), cached=True)
+                return JSONResponse(jsonable_encoder(response)).body
+
+            def raw_miss(i):
+                result = recommendation_result(catalog.items_json(*candidates[i]), "vector_search")
+                return recommendation_body("user", result, cached=False), result
+
+            def raw_hit(i):
+                return recommendation_body("user", new_cached[i], cached=True)
+
+            assert json.loads(pydantic_hit(0)) == json.loads(raw_hit(0))
+            for name, fn in (("pydantic_miss", pydantic_miss), ("raw_miss", raw_miss),
+                             ("pydantic_hit", pydantic_hit), ("raw_hit", raw_hit)):
+                results.append({"endpoint": "recommend", "k": k, "path": name,
+                                "latency": latency_summary(time_calls(fn, positions))})
+
+        offsets = rng.integers(0, args.items - args.page, size=args.queries).tolist()
+
+        def items_dicts(offset):
+            rows = range(offset, offset + args.page)
+            return JSONResponse({"items": catalog.items(rows), "total": len(catalog),
+                                 "offset": offset, "limit": args.page}).body
+
+        def items_raw(offset):
+            rows = range(offset, offset + args.page)
+            return (b'{"items":' + catalog.items_json(rows)
+                    + b',"total":%d,"offset":%d,"limit":%d}' % (len(catalog), offset, args.page))
+
+        assert json.loads(items_dicts(offsets[0])) == json.loads(items_raw(offsets[0]))
+        for name, fn in (("dicts_json_response", items_dicts), ("raw", items_raw)):
+            results.append({"endpoint": "items", "k": args.page, "path": name,
+                            "latency": latency_summary(time_calls(fn, offsets))})
+
+    emit({"benchmark": "serialization", "items": args.items, "encoder": "orjson" if orjson else "json",
+          "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Benchmark: índice em shards (scatter-gather entre processos) vs índice único
+
+Para cada número de shards divide o catálogo em faixas de linhas, sobe um
+processo por shard (ShardedIndex) e mede a latência da busca (perfil enviado
+a todos os shards, top-k parciais mesclados com heap), o recall@k contra a
+busca exata (o do índice único também é reportado) e a memória de cada
+processo de shard (privada e PSS, via /proc/<pid>/smaps_rollup). Os vetores
+são o mmap do bundle: cada shard só toca as páginas da sua faixa; a maior
+parte da memória privada de um shard é o interpretador e os imports.
+
+Com --degraded, um shard é pausado (SIGSTOP) e mede-se a latência do
+resultado parcial (limitada por SHARD_TIMEOUT_MS) e o recall que sobra.
+
+Em máquinas com poucos núcleos os shards disputam CPU entre si: o ganho de
+latência por paralelismo só aparece até o número de núcleos livres; o
+custo fixo por consulta (serialização + IPC) aparece sempre.
+
+Uso:
+    python -m benchmarks.bench_shards --items 200000 --shards 1 2 4 8 --queries 300
+    python -m benchmarks.bench_shards --items 100000 --shards 4 --degraded --timeout-ms 50
+"""
+import argparse
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import time
+
+import numpy as np
+
+from app.artifacts import load_bundle
+from app.index import INDEX_DIR, ExactIndex, load_index
+from app.shards import SHARDS_DIR, ShardLayout, ShardedIndex
+from app.vectors import profile_vector
+from benchmarks.common import emit, latency_summary, memory_breakdown, time_calls
+from benchmarks.synthetic import make_histories
+
+logger = logging.getLogger(__name__)
+
+
+def recall(index, reference, queries, k) -> float:
+    return float(np.mean([
+        len(np.intersect1d(index.search(profile, k, exclude=rows)[0],
+                           reference.search(profile, k, exclude=rows)[0])) / k
+        for profile, rows in queries
+    ]))
+
+
+def measure(bundle, num_shards: int, backend: str, queries, exact, args) -> dict:
+    start = time.perf_counter()
+    layout = ShardLayout.build(bundle.item_vectors, num_shards, backend)
+    path = os.path.join(bundle.path, SHARDS_DIR)
+    shutil.rmtree(path, ignore_errors=True)
+    layout.save(path)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = ShardedIndex(bundle.item_vectors, bundle.path, ShardLayout.load(path), args.timeout_ms).start()
+    try:
+        startup_seconds = time.perf_counter() - start
+        k = args.k
+        latencies = time_calls(lambda query: index.search(query[0], k, exclude=query[1]), queries)
+        memory = [memory_breakdown(process.pid) for process in index._processes]
+        result = {
+            "shards": num_shards,
+            "build_s": round(build_seconds, 3),
+            "startup_s": round(startup_seconds, 3),
+            "search": latency_summary(latencies),
+            "recall_vs_exact": round(recall(index, exact, queries, k), 4),
+            "shard_private_mb": [m.get("private_mb") for m in memory],
+            "shard_pss_mb": [m.get("pss_mb") for m in memory],
+            "total_shard_private_mb": round(sum(m.get("private_mb", 0) for m in memory), 2),
+        }
+        if args.degraded and num_shards > 1:
+            # Shard pausado: a busca espera até o timeout e devolve o que os outros mandaram
+            paused = index._processes[0].pid
+            os.kill(paused, signal.SIGSTOP)
+            try:
+                subset = queries[:max(args.queries // 10, 10)]
+                degraded = time_calls(lambda query: index.search(query[0], k, exclude=query[1]), subset, warmup=0)
+                result["degraded"] = {
+                    "search": latency_summary(degraded),
+                    "recall_vs_exact": round(recall(index, exact, subset, k), 4),
+                    "failures": index.stats()["failures"],
+                }
+            finally:
+                os.kill(paused, signal.SIGCONT)
+        return result
+    finally:
+        index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--timeout-ms", type=float, default=200)
+    parser.add_argument("--degraded", action="store_true", help="Mede também com um shard pausado")
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        from benchmarks.bench_api import build_bundle
+        path = os.path.join(tmp, "bundle")
+        logger.info(f"Gerando bundle com {args.items} itens...")
+        build_bundle(args.items, path)
+        bundle = load_bundle(path, mmap_mode="r")
+        reference = load_index(os.path.join(bundle.path, INDEX_DIR), bundle.item_vectors)
+
+        histories = [np.unique(np.asarray(history, dtype=np.int64) - 1)
+                     for history in make_histories(args.items, args.queries, max_len=20)]
+        queries = [(profile_vector(bundle.item_vectors, rows), rows) for rows in histories]
+        exact = ExactIndex(bundle.item_vectors)
+        single = {
+            "search": latency_summary(time_calls(
+                lambda query: reference.search(query[0], args.k, exclude=query[1]), queries)),
+            "recall_vs_exact": round(recall(reference, exact, queries, args.k), 4),
+        }
+
+        results = []
+        for num_shards in args.shards:
+            logger.info(f"{num_shards} shards...")
+            results.append(measure(bundle, num_shards, reference.backend, queries, exact, args))
+            logger.info(f"p50 {results[-1]['search'].get('p50_ms')} ms, "
+                        f"{results[-1]['total_shard_private_mb']} MB privados nos shards")
+
+    emit({"benchmark": "shards", "items": args.items, "queries": args.queries, "k": args.k,
+          "cpu_count": os.cpu_count(), "backend": reference.backend, "timeout_ms": args.timeout_ms,
+          "coordinator": memory_breakdown(), "single_index": single, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Benchmark de cold start: pickles legados vs bundle mapeado em memória
+
+Sobe N workers simultâneos para cada formato. Cada worker importa o que a API
+importa, carrega os artefatos, roda algumas consultas (tocando as páginas dos
+vetores) e, com todos os workers vivos, mede RSS/PSS/memória privada.
+
+Com --api mede o startup da API de verdade (HTTP em localhost) em cada modo:
+tempo do `import app.main` (e quais módulos pesados ele arrasta), tempo até
+/health/live e até /health/ready e a latência das primeiras requisições de
+/recommend contra o p50 em regime. Modos: `foreground` (uvicorn, modelo
+carregado e aquecido no startup), `background` (MODEL_LOAD_BACKGROUND=1:
+vivo na hora, pronto depois do aquecimento) e `preload` (`python -m app.server`).
+
+Uso:
+    python -m benchmarks.bench_startup --items 50000 --workers 4
+    python -m benchmarks.bench_startup --api --items 50000 --requests 500
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import collect_worker, emit, latency_summary, memory_breakdown, start_worker, wait_ready
+
+logger = logging.getLogger(__name__)
+
+NUM_QUERIES = 200
+# Requisições iniciais comparadas com o regime
+FIRST_REQUESTS = 5
+# Só o treino precisa deles; se o import da API os trouxer de volta, o startup regrediu
+HEAVY_MODULES = ("sklearn", "pandas", "joblib", "scipy.sparse.linalg")
+API_MODES = {
+    "foreground": {},
+    "background": {"MODEL_LOAD_BACKGROUND": "1"},
+    "preload": {},
+}
+
+
+def build_artifacts(num_items: int, path: str):
+    """Gera os pickles legados e o bundle a partir do mesmo catálogo"""
+    import joblib
+    import numpy as np
+    from sklearn.neighbors import NearestNeighbors
+    from app.artifacts import save_bundle
+    from benchmarks.synthetic import make_items_df
+    from train_model import build_item_vectors
+
+    items_df = make_items_df(num_items)
+    vectorizer, item_vectors = build_item_vectors(items_df)
+
+    legacy_dir = os.path.join(path, "legacy")
+    os.makedirs(legacy_dir)
+    legacy_vectors = item_vectors.astype(np.float64)
+    nn_model = NearestNeighbors(n_neighbors=min(50, num_items), metric="cosine", algorithm="brute")
+    nn_model.fit(legacy_vectors)
+    joblib.dump(vectorizer, os.path.join(legacy_dir, "tfidf_vectorizer.pkl"))
+    joblib.dump(nn_model, os.path.join(legacy_dir, "nearest_neighbors.pkl"))
+    joblib.dump(legacy_vectors.toarray(), os.path.join(legacy_dir, "item_vectors.pkl"))
+    items_df.to_pickle(os.path.join(legacy_dir, "items_df.pkl"))
+
+    save_bundle(os.path.join(path, "bundle"), items_df, item_vectors, vectorizer)
+
+
+def load_legacy(path: str):
+    """Reproduz o load_models antigo: quatro pickles desserializados por worker"""
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from sklearn.feature_extraction.text import TfidfVectorizer  # noqa: F401
+    from sklearn.neighbors import NearestNeighbors  # noqa: F401
+
+    legacy_dir = os.path.join(path, "legacy")
+    joblib.load(os.path.join(legacy_dir, "tfidf_vectorizer.pkl"))
+    nn_model = joblib.load(os.path.join(legacy_dir, "nearest_neighbors.pkl"))
+    items_df = pd.read_pickle(os.path.join(legacy_dir, "items_df.pkl"))
+    item_vectors = joblib.load(os.path.join(legacy_dir, "item_vectors.pkl"))
+
+    def recommend(item_ids):
+        rows = [items_df.index.get_loc(i) for i in item_ids if i in items_df.index]
+        profile = np.mean(item_vectors[rows], axis=0)
+        return nn_model.kneighbors([profile], n_neighbors=15)
+
+    return recommend
+
+
+def load_mmap(path: str):
+    """Caminho atual da API: bundle aberto com mmap_mode='r'"""
+    from app.artifacts import load_bundle
+    from app.vectors import profile_vector, top_k_similar
+
+    bundle = load_bundle(os.path.join(path, "bundle"), mmap_mode="r")
+
+    def recommend(item_ids):
+        rows = [row for row in map(bundle.catalog.row_of, item_ids) if row is not None]
+        profile = profile_vector(bundle.item_vectors, rows)
+        return top_k_similar(bundle.item_vectors, profile, 15)
+
+    return recommend
+
+
+FORMATS = {"legacy": load_legacy, "mmap": load_mmap}
+
+
+def run_worker(fmt: str, path: str, num_items: int, spawned_at: float):
+    """Executado em cada processo filho"""
+    start = time.perf_counter()
+    recommend = FORMATS[fmt](path)
+    load_seconds = time.perf_counter() - start
+    cold_start_seconds = time.time() - spawned_at
+
+    from benchmarks.synthetic import make_histories
+    for history in make_histories(num_items, NUM_QUERIES):
+        recommend([int(i) for i in history])
+
+    print("ready", flush=True)
+    sys.stdin.readline()
+    emit({
+        "format": fmt,
+        "load_seconds": round(load_seconds, 4),
+        "cold_start_seconds": round(cold_start_seconds, 4),
+        "memory": memory_breakdown(),
+    })
+
+
+def measure_import() -> dict:
+    """`import app.main` num interpretador novo: segundos e módulos pesados carregados"""
+    code = ("import json, sys, time; start = time.perf_counter(); import app.main; "
+            "print(json.dumps({'seconds': time.perf_counter() - start, "
+            f"'heavy_modules': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            env={**os.environ, "MODEL_BUNDLE_PATH": os.devnull})
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    return {"seconds": round(result["seconds"], 3), "heavy_modules": result["heavy_modules"]}
+
+
+def measure_api(mode: str, path: str, bodies: list) -> dict:
+    """Sobe a API em um modo e mede tempo até vivo/pronto e as primeiras requisições"""
+    import httpx
+    from benchmarks.bench_workers import free_port
+
+    port = free_port()
+    env = {**os.environ, "MODEL_BUNDLE_PATH": path, "MODEL_WATCH_INTERVAL": "0", "PROFILE_STORE": "memory",
+           **API_MODES[mode]}
+    if mode == "preload":
+        command = [sys.executable, "-m", "app.server", "--workers", "1", "--bundle", path]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--no-access-log"]
+    started = time.perf_counter()
+    server = subprocess.Popen(command + ["--host", "127.0.0.1", "--port", str(port)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    live_seconds = ready_seconds = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            while ready_seconds is None and time.perf_counter() - started < 120:
+                try:
+                    if live_seconds is None:
+                        client.get("/health/live").raise_for_status()
+                        live_seconds = time.perf_counter() - started
+                    if client.get("/health/ready").status_code == 200:
+                        ready_seconds = time.perf_counter() - started
+                except httpx.HTTPError:
+                    time.sleep(0.01)
+            if ready_seconds is None:
+                raise RuntimeError(f"API ({mode}) não ficou pronta")
+
+            latencies = []
+            for body in bodies:
+                start = time.perf_counter()
+                client.post("/recommend", json=body).raise_for_status()
+                latencies.append(time.perf_counter() - start)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    steady = latency_summary(latencies[FIRST_REQUESTS:])
+    return {
+        "mode": mode,
+        "live_seconds": round(live_seconds, 3),
+        "ready_seconds": round(ready_seconds, 3),
+        "first_requests_ms": [round(value * 1000, 2) for value in latencies[:FIRST_REQUESTS]],
+        "steady": steady,
+        "first_vs_steady_p50": round(latencies[0] * 1000 / steady["p50_ms"], 2) if steady.get("p50_ms") else None,
+    }
+
+
+def run_api(args):
+    from benchmarks.bench_api import build_bundle
+    from benchmarks.synthetic import make_histories
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bundle")
+        logger.info(f"Gerando bundle com {args.items} itens...")
+        build_bundle(args.items, path)
+        # Históricos distintos: nenhuma requisição sai do cache
+        bodies = [{"user_id": f"user{i}", "item_ids": history, "num_recommendations": 10}
+                  for i, history in enumerate(make_histories(args.items, args.requests, max_len=20))]
+        for mode in API_MODES:
+            logger.info(f"Subindo a API ({mode})...")
+            results.append(measure_api(mode, path, bodies))
+            logger.info(f"vivo em {results[-1]['live_seconds']}s, pronto em {results[-1]['ready_seconds']}s, "
+                        f"primeira requisição {results[-1]['first_requests_ms'][0]} ms")
+
+    emit({"benchmark": "startup_api", "items": args.items, "requests": args.requests,
+          "cpu_count": os.cpu_count(), "import": measure_import(), "results": results})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--api", action="store_true", help="Mede o startup da API (vivo, pronto, primeiras requisições)")
+    parser.add_argument("--requests", type=int, default=500, help="Requisições de /recommend por modo (--api)")
+    parser.add_argument("--worker", choices=sorted(FORMATS))
+    parser.add_argument("--dir")
+    parser.add_argument("--spawned-at", type=float)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.dir, args.items, args.spawned_at)
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.api:
+        run_api(args)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as path:
+        logger.info(f"Gerando artefatos para {args.items} itens...")
+        build_artifacts(args.items, path)
+
+        for fmt in FORMATS:
+            logger.info(f"Subindo {args.workers} workers ({fmt})...")
+            processes = [
+                start_worker("benchmarks.bench_startup", [
+                    "--worker", fmt, "--dir", path, "--items", str(args.items),
+                    "--spawned-at", str(time.time()),
+                ])
+                for _ in range(args.workers)
+            ]
+            for process in processes:
+                wait_ready(process)
+            workers = [collect_worker(process) for process in processes]
+
+            results[fmt] = {
+                "workers": workers,
+                "max_cold_start_seconds": max(w["cold_start_seconds"] for w in workers),
+                "total_private_mb": round(sum(w["memory"].get("private_mb", 0) for w in workers), 2),
+                "total_pss_mb": round(sum(w["memory"].get("pss_mb", 0) for w in workers), 2),
+            }
+
+    emit({"benchmark": "startup", "items": args.items, "num_workers": args.workers, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Benchmark: treino completo (CSVs inteiros x em pedaços/paralelo) vs atualização incremental
+
+Gera movies.csv/ratings.csv sintéticos e mede, cada modo em um processo
+separado, o tempo de parede e o pico de memória (RSS do processo principal):
+
+- legacy: CSVs lidos inteiros e TF-IDF treinado sequencialmente (como antes)
+- full: train_model.prepare_data + build_bundle (pedaços + processos)
+- incremental: train_model.update_bundle adicionando --new-items itens a um
+  bundle com os demais (TF-IDF congelado, índice/vizinhos/popularidade atualizados)
+
+Uso:
+    python -m benchmarks.bench_training --items 50000 --new-items 500
+"""
+import argparse
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import emit, run_worker
+from benchmarks.synthetic import make_movies, make_ratings
+
+logger = logging.getLogger(__name__)
+
+MODES = ("legacy", "full", "incremental")
+
+
+def write_data(num_items: int, num_new: int, path: str):
+    """movies.csv e ratings.csv completos, base.csv (sem os novos) e new.csv (só os novos)"""
+    movies = make_movies(num_items)
+    movies.to_csv(os.path.join(path, "movies.csv"), index=False)
+    movies.iloc[:num_items - num_new].to_csv(os.path.join(path, "base.csv"), index=False)
+    movies.iloc[num_items - num_new:].to_csv(os.path.join(path, "new.csv"), index=False)
+    make_ratings(num_items, num_items * 20).to_csv(os.path.join(path, "ratings.csv"), index=False)
+
+
+def train_legacy(path: str, n_jobs: int):
+    import numpy as np
+    import pandas as pd
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    import train_model
+    from app.artifacts import save_bundle
+    from app.index import build_index
+    from app.popularity import build_popularity
+    from app.neighbors import build_neighbor_table
+    from app.vectors import to_item_vectors
+
+    movies = pd.read_csv(os.path.join(path, "movies.csv"))
+    ratings = pd.read_csv(os.path.join(path, "ratings.csv"))
+    items_df = train_model.clean_movies(movies).sort_index()
+    vectorizer = TfidfVectorizer(**train_model.TFIDF_PARAMS)
+    item_vectors = to_item_vectors(vectorizer.fit_transform(items_df["description"]))
+    index = build_index(train_model.INDEX_BACKEND, item_vectors)
+    neighbor_table = build_neighbor_table(item_vectors, n_jobs=n_jobs)
+    popularity = build_popularity(items_df.index.to_numpy(dtype=np.int64), items_df["genres"].tolist(),
+                                  ratings[["movieId", "rating"]])
+    save_bundle(os.path.join(path, "bundle"), items_df, item_vectors, vectorizer, index, neighbor_table,
+                popularity)
+
+
+def train_full(path: str, n_jobs: int):
+    import train_model
+
+    items_df, ratings, interactions = train_model.prepare_data(path)
+    train_model.build_bundle(items_df, os.path.join(path, "bundle"), ratings, n_jobs, interactions)
+
+
+def train_incremental(path: str, n_jobs: int):
+    import train_model
+
+    train_model.update_bundle(os.path.join(path, "bundle"),
+                              train_model.read_movies(os.path.join(path, "new.csv")), n_jobs)
+
+
+def run_mode(mode: str, data_dir: str, n_jobs: int):
+    """Executado dentro do processo filho, sobre uma cópia dos dados"""
+    import train_model
+
+    # Os dados já existem: nada de baixar o MovieLens
+    train_model.download_movielens_data = lambda: None
+    start = time.perf_counter()
+    {"legacy": train_legacy, "full": train_full, "incremental": train_incremental}[mode](data_dir, n_jobs)
+    emit({
+        "mode": mode,
+        "n_jobs": n_jobs,
+        "seconds": round(time.perf_counter() - start, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--new-items", type=int, default=500)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--worker", choices=MODES)
+    parser.add_argument("--dir")
+    args = parser.parse_args()
+
+    if args.worker:
+        run_mode(args.worker, args.dir, args.n_jobs)
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as path:
+        logger.info(f"Gerando CSVs para {args.items} itens...")
+        write_data(args.items, args.new_items, path)
+
+        # Bundle base (sem os itens novos) para o modo incremental
+        base_dir = os.path.join(path, "base")
+        os.makedirs(base_dir)
+        shutil.copy(os.path.join(path, "base.csv"), os.path.join(base_dir, "movies.csv"))
+        shutil.copy(os.path.join(path, "ratings.csv"), base_dir)
+        shutil.copy(os.path.join(path, "new.csv"), base_dir)
+        run_worker("benchmarks.bench_training", ["--worker", "full", "--dir", base_dir,
+                                                 "--n-jobs", str(args.n_jobs)])
+
+        results = []
+        for mode, n_jobs in (("legacy", 1), ("full", 1), ("full", args.n_jobs), ("incremental", args.n_jobs)):
+            logger.info(f"Medindo {mode} (n_jobs={n_jobs})...")
+            data_dir = base_dir if mode == "incremental" else path
+            results.append(run_worker("benchmarks.bench_training", [
+                "--worker", mode, "--dir", data_dir, "--n-jobs", str(n_jobs),
+            ]))
+
+    emit({"benchmark": "training", "items": args.items, "new_items": args.new_items, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Benchmark: serviço multi-processo com pré-carga + fork vs `uvicorn --workers`
+
+Para cada número de workers sobe a API de verdade (HTTP em localhost) em dois
+modos e mede throughput de /recommend e a memória de cada worker:
+
+- preload: `python -m app.server` (modelo carregado e aquecido no pai,
+  gc.freeze e fork; os workers herdam as páginas copy-on-write)
+- naive: `uvicorn app.main:app --workers N` (cada worker é um processo novo,
+  que importa tudo e carrega o modelo sozinho)
+
+A carga vem de --clients processos separados (httpx assíncrono), para que o
+cliente não seja o gargalo. Em máquinas com poucos núcleos, cliente e
+servidor disputam CPU: o ganho de throughput só aparece até o número de
+núcleos livres. A memória privada (USS) é o custo de cada worker a mais; o
+PSS soma as páginas compartilhadas uma única vez.
+
+Uso:
+    python -m benchmarks.bench_workers --items 50000 --workers 1 2 4 --requests 4000
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import emit, latency_summary, memory_breakdown
+from benchmarks.synthetic import make_histories
+
+logger = logging.getLogger(__name__)
+
+MODES = ("preload", "naive")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode: str, workers: int, port: int, path: str) -> subprocess.Popen:
+    env = {**os.environ, "MODEL_BUNDLE_PATH": path, "MODEL_WATCH_INTERVAL": "0", "PROFILE_STORE": "memory"}
+    if mode == "preload":
+        command = [sys.executable, "-m", "app.server", "--workers", str(workers), "--host", "127.0.0.1",
+                   "--port", str(port), "--bundle", path]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers),
+                   "--host", "127.0.0.1", "--port", str(port), "--no-access-log"]
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def worker_pids(url: str, workers: int, timeout: float = 120) -> set:
+    """Espera a API responder e descobre os pids dos workers pelo /health
+
+    Cada consulta abre uma conexão nova: com keep-alive só um worker responderia.
+    """
+    import httpx
+
+    pids = set()
+    deadline = time.monotonic() + timeout
+    with httpx.Client(base_url=url, timeout=5, headers={"Connection": "close"}) as client:
+        while len(pids) < workers and time.monotonic() < deadline:
+            try:
+                pids.add(client.get("/health").json()["pid"])
+            except httpx.HTTPError:
+                time.sleep(0.2)
+    if len(pids) < workers:
+        raise RuntimeError(f"Só {len(pids)} de {workers} workers responderam")
+    return pids
+
+
+def client_load(url: str, bodies: list, concurrency: int, queue):
+    """Processo cliente: envia os corpos com `concurrency` requisições em voo"""
+    import httpx
+
+    async def run():
+        latencies, statuses = [], {}
+        pending = iter(bodies)
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=30, limits=limits) as client:
+            async def loop():
+                for body in pending:
+                    start = time.perf_counter()
+                    response = await client.post("/recommend", json=body)
+                    latencies.append(time.perf_counter() - start)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            await asyncio.gather(*(loop() for _ in range(concurrency)))
+        return latencies, statuses
+
+    queue.put(asyncio.run(run()))
+
+
+def run_load(url: str, bodies: list, clients: int, concurrency: int) -> dict:
+    context = mp.get_context("spawn")
+    queue = context.Queue()
+    parts = [bodies[i::clients] for i in range(clients)]
+    processes = [context.Process(target=client_load, args=(url, part, concurrency, queue)) for part in parts]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    latencies = [value for part, _ in results for value in part]
+    # 429 = load shedding do executor de scoring (fila cheia), não falha
+    statuses = {}
+    for _, part in results:
+        for status, count in part.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {
+        "throughput_rps": round(statuses.get("200", 0) / elapsed, 1),
+        "statuses": statuses,
+        "latency": latency_summary(latencies),
+    }
+
+
+def measure(mode: str, workers: int, path: str, bodies: list, args) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = start_server(mode, workers, port, path)
+    try:
+        started = time.perf_counter()
+        pids = worker_pids(url, workers)
+        ready_seconds = time.perf_counter() - started
+        # Aquecimento (páginas, L1 desligado por históricos únicos)
+        run_load(url, bodies[:200], 1, args.concurrency)
+        load = run_load(url, bodies, args.clients, args.concurrency)
+        memory = [memory_breakdown(pid) for pid in sorted(pids)]
+        return {
+            "mode": mode, "workers": workers, "ready_seconds": round(ready_seconds, 2), **load,
+            "worker_private_mb": [m.get("private_mb") for m in memory],
+            "total_private_mb": round(sum(m.get("private_mb", 0) for m in memory), 2),
+            "total_pss_mb": round(sum(m.get("pss_mb", 0) for m in memory), 2),
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--clients", type=int, default=2, help="Processos gerando carga")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requisições em voo por cliente")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        from benchmarks.bench_api import build_bundle
+        path = os.path.join(tmp, "bundle")
+        logger.info(f"Gerando bundle com {args.items} itens...")
+        build_bundle(args.items, path)
+        # Históricos distintos: cada requisição faz scoring de verdade
+        bodies = [{"user_id": f"user{i}", "item_ids": history, "num_recommendations": 10}
+                  for i, history in enumerate(make_histories(args.items, args.requests, max_len=20))]
+
+        for workers in args.workers:
+            for mode in args.modes:
+                logger.info(f"{mode} com {workers} workers...")
+                results.append(measure(mode, workers, path, bodies, args))
+                logger.info(f"{results[-1]['throughput_rps']} req/s, "
+                            f"{results[-1]['total_private_mb']} MB privados")
+
+    emit({"benchmark": "workers", "items": args.items, "requests": args.requests,
+          "cpu_count": os.cpu_count(), "results": results})
+
+
+if __name__ == "__main__":
+    main()
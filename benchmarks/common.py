@@ -0,0 +1,119 @@
+"""Utilitários compartilhados pelos benchmarks"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+
+def rss_bytes() -> int:
+    """RSS atual do processo (Linux /proc; fallback para o pico via getrusage)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def memory_breakdown(pid: str = "self") -> Dict[str, float]:
+    """RSS, PSS e memória privada (USS) em MB via /proc/<pid>/smaps_rollup
+
+    Páginas mapeadas de arquivo e compartilhadas entre workers contam no RSS
+    de todos eles, mas só uma vez no PSS somado; a memória privada é o custo
+    real de cada worker adicional.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) * 1024
+    except OSError:
+        return {"rss_mb": round(rss_bytes() / 2**20, 2)}
+
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 2**20, 2),
+        "pss_mb": round(fields.get("Pss", 0) / 2**20, 2),
+        "private_mb": round(private / 2**20, 2),
+    }
+
+
+def latency_summary(latencies: Iterable[float]) -> Dict[str, float]:
+    """p50/p95/p99/média em milissegundos a partir de latências em segundos"""
+    values = np.asarray(list(latencies), dtype=np.float64) * 1000
+    if values.size == 0:
+        return {"count": 0}
+    return {
+        "count": int(values.size),
+        "mean_ms": round(float(values.mean()), 4),
+        "p50_ms": round(float(np.percentile(values, 50)), 4),
+        "p95_ms": round(float(np.percentile(values, 95)), 4),
+        "p99_ms": round(float(np.percentile(values, 99)), 4),
+    }
+
+
+def time_calls(fn: Callable, args_list: List, warmup: int = 10) -> List[float]:
+    """Executa fn para cada item de args_list e devolve as latências em segundos"""
+    for args in args_list[:warmup]:
+        fn(args)
+
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_worker(module: str, args: List[str]) -> dict:
+    """Roda um benchmark em um processo novo (memória isolada) e lê o JSON do stdout"""
+    result = subprocess.run(
+        [sys.executable, "-m", module, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def start_worker(module: str, args: List[str]) -> subprocess.Popen:
+    """Como run_worker, mas sem esperar: para medir vários workers simultâneos
+
+    O worker sinaliza "ready" no stdout e espera uma linha no stdin antes de
+    medir, para que todos estejam vivos (e compartilhando páginas) ao mesmo tempo.
+    """
+    return subprocess.Popen(
+        [sys.executable, "-m", module, *args],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+
+def wait_ready(process: subprocess.Popen):
+    line = process.stdout.readline()
+    if line.strip() != "ready":
+        raise RuntimeError(f"Worker não ficou pronto: {line!r}")
+
+
+def collect_worker(process: subprocess.Popen) -> dict:
+    stdout, _ = process.communicate(input="\n")
+    if process.returncode != 0:
+        raise RuntimeError(f"Worker falhou com código {process.returncode}")
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def emit(result: dict):
+    """Imprime o resultado como uma linha JSON (consumida por run_worker/CI)"""
+    print(json.dumps(result, sort_keys=True))
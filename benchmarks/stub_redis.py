@@ -0,0 +1,125 @@
+"""Stubs do Redis em memória, com latência de rede configurável
+
+Implementam só os comandos que a API (assíncrono) e o job de materialização
+(síncrono) usam. Dispensam um Redis real nos benchmarks e permitem simular
+um Redis lento.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class StubPipeline:
+    def __init__(self, client: "StubRedis"):
+        self.client = client
+        self.commands: List[Tuple[str, tuple]] = []
+
+    def setex(self, key, ttl, value):
+        self.commands.append(("setex", (key, ttl, value)))
+        return self
+
+    def append(self, key, value):
+        self.commands.append(("append", (key, value)))
+        return self
+
+    def expire(self, key, ttl):
+        self.commands.append(("expire", (key, ttl)))
+        return self
+
+    async def execute(self):
+        await self.client._round_trip()
+        return [getattr(self.client, f"_{name}")(*args) for name, args in self.commands]
+
+
+class StubRedis:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data: Dict[str, Tuple[object, Optional[float]]] = {}
+        self.calls = 0
+
+    async def _round_trip(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at < time.monotonic():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    def _setex(self, key, ttl, value):
+        self.data[key] = (value, time.monotonic() + ttl)
+        return True
+
+    def _append(self, key, value):
+        current = self._get(key)
+        _, expires_at = self.data.get(key, (None, None))
+        self.data[key] = ((current or b"") + value, expires_at)
+        return len(self.data[key][0])
+
+    def _expire(self, key, ttl):
+        if self._get(key) is None:
+            return False
+        self.data[key] = (self.data[key][0], time.monotonic() + ttl)
+        return True
+
+    async def ping(self):
+        await self._round_trip()
+        return True
+
+    async def get(self, key):
+        await self._round_trip()
+        return self._get(key)
+
+    async def mget(self, keys):
+        await self._round_trip()
+        return [self._get(key) for key in keys]
+
+    async def setex(self, key, ttl, value):
+        await self._round_trip()
+        return self._setex(key, ttl, value)
+
+    def pipeline(self, transaction: bool = True):
+        return StubPipeline(self)
+
+    async def close(self):
+        pass
+
+
+class SyncStubPipeline:
+    def __init__(self, client: "SyncStubRedis"):
+        self.client = client
+        self.commands: List[Tuple[str, object, Optional[int]]] = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value, ex))
+        return self
+
+    def execute(self):
+        self.client._round_trip()
+        for key, value, ex in self.commands:
+            self.client.data[key] = (value, time.monotonic() + ex if ex else None)
+        return [True] * len(self.commands)
+
+
+class SyncStubRedis:
+    """Versão síncrona (redis.Redis) para o job de materialização: um round trip por pipeline"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data: Dict[str, Tuple[object, Optional[float]]] = {}
+        self.calls = 0
+
+    def _round_trip(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def ping(self):
+        self._round_trip()
+        return True
+
+    def pipeline(self, transaction: bool = True):
+        return SyncStubPipeline(self)
@@ -0,0 +1,88 @@
+"""Gerador de catálogos sintéticos no formato do MovieLens, para benchmarks"""
+import numpy as np
+import pandas as pd
+
+GENRES = [
+    "Action", "Adventure", "Animation", "Children", "Comedy", "Crime",
+    "Documentary", "Drama", "Fantasy", "Film-Noir", "Horror", "IMAX",
+    "Musical", "Mystery", "Romance", "Sci-Fi", "Thriller", "War", "Western",
+]
+
+
+def _vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    """Palavras pseudo-aleatórias para compor os títulos"""
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    lengths = rng.integers(3, 9, size=size)
+    return np.array(["".join(rng.choice(letters, n)).capitalize() for n in lengths])
+
+
+def make_movies(num_items: int, seed: int = 42) -> pd.DataFrame:
+    """DataFrame com as colunas de movies.csv (movieId, title, genres)"""
+    rng = np.random.default_rng(seed)
+    vocabulary = _vocabulary(max(2000, num_items // 20), rng)
+
+    # Distribuição de Zipf nas palavras, como em títulos reais
+    word_weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    word_weights /= word_weights.sum()
+
+    title_lengths = rng.integers(1, 5, size=num_items)
+    words = rng.choice(vocabulary, size=int(title_lengths.sum()), p=word_weights)
+    years = rng.integers(1920, 2024, size=num_items)
+
+    titles = []
+    genres = []
+    offset = 0
+    for i, length in enumerate(title_lengths):
+        titles.append(f"{' '.join(words[offset:offset + length])} ({years[i]})")
+        offset += length
+        num_genres = rng.integers(1, 4)
+        genres.append("|".join(rng.choice(GENRES, num_genres, replace=False)))
+
+    return pd.DataFrame({
+        "movieId": np.arange(1, num_items + 1),
+        "title": titles,
+        "genres": genres,
+    })
+
+
+def make_items_df(num_items: int, seed: int = 42) -> pd.DataFrame:
+    """items_df no mesmo formato de train_model.prepare_data"""
+    movies = make_movies(num_items, seed)
+    movies["description"] = movies["title"] + " " + movies["genres"]
+    return movies.set_index("movieId")[["title", "genres", "description"]]
+
+
+def make_histories(num_items: int, num_users: int, max_len: int = 10, seed: int = 7):
+    """Históricos de usuários (listas de ids em string), com viés de popularidade"""
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, num_items + 1) ** 0.8
+    cdf = np.cumsum(popularity)
+    cdf /= cdf[-1]
+
+    histories = []
+    for length in rng.integers(1, max_len + 1, size=num_users):
+        ids = np.minimum(np.searchsorted(cdf, rng.random(length)), num_items - 1) + 1
+        histories.append([str(i) for i in dict.fromkeys(ids.tolist())])
+    return histories
+
+
+def make_ratings(num_items: int, num_ratings: int, num_users: int = 1000, seed: int = 11) -> pd.DataFrame:
+    """DataFrame com as colunas de ratings.csv (userId, movieId, rating)
+
+    Contagens com cauda longa (Zipf) e qualidade própria de cada item, para que
+    popularidade e nota média não coincidam.
+    """
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, num_items + 1) ** 0.9
+    popularity = rng.permutation(popularity / popularity.sum())
+    movie_ids = rng.choice(num_items, size=num_ratings, p=popularity) + 1
+
+    quality = rng.normal(3.5, 0.6, size=num_items)
+    raw = quality[movie_ids - 1] + rng.normal(0, 0.8, size=num_ratings)
+    ratings = np.clip(np.round(raw * 2) / 2, 0.5, 5.0)
+
+    return pd.DataFrame({
+        "userId": rng.integers(1, num_users + 1, size=num_ratings),
+        "movieId": movie_ids,
+        "rating": ratings,
+    })
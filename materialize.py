@@ -0,0 +1,243 @@
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import redis
+
+from app.artifacts import DEFAULT_BUNDLE_PATH, load_bundle
+from app.batch import recommend_batch
+from app.cache import recommendation_key
+from app.profiles import sync_profile_state
+from app.scoring import cacheable
+from app.serving import load_serving_model
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Linhas por pedaço na leitura de ratings.csv
+MATERIALIZE_READ_ROWS = int(os.getenv("MATERIALIZE_READ_ROWS", 500_000))
+# Usuários por tarefa do pool (um checkpoint por tarefa)
+MATERIALIZE_CHUNK_USERS = int(os.getenv("MATERIALIZE_CHUNK_USERS", 2000))
+# Processos de scoring; -1 = um por núcleo
+MATERIALIZE_JOBS = int(os.getenv("MATERIALIZE_JOBS", -1))
+# Comandos SET por round trip do pipeline
+MATERIALIZE_PIPELINE = int(os.getenv("MATERIALIZE_PIPELINE", 1000))
+# Validade (s) das entradas: cobre o intervalo entre duas execuções, com folga
+MATERIALIZE_TTL = int(os.getenv("MATERIALIZE_TTL", 2 * 86400))
+# Intervalo (s) entre os logs de progresso
+MATERIALIZE_LOG_INTERVAL = float(os.getenv("MATERIALIZE_LOG_INTERVAL", 10))
+
+
+def read_histories(path, min_rating=0.0, chunksize=MATERIALIZE_READ_ROWS):
+    """Históricos por usuário a partir de ratings.csv: (ids dos usuários, offsets, filmes)
+
+    Lido em pedaços (só userId, movieId e rating); os filmes de cada usuário
+    ficam contíguos e sem repetição: filmes[offsets[i]:offsets[i + 1]].
+    """
+    users, movies = [], []
+    for chunk in pd.read_csv(path, usecols=['userId', 'movieId', 'rating'], chunksize=chunksize):
+        if min_rating > 0:
+            chunk = chunk[chunk['rating'] >= min_rating]
+        users.append(chunk['userId'].to_numpy(dtype=np.int64))
+        movies.append(chunk['movieId'].to_numpy(dtype=np.int64))
+    if not users:
+        return np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    pairs = np.unique(np.stack([np.concatenate(users), np.concatenate(movies)], axis=1), axis=0)
+    user_ids, counts = np.unique(pairs[:, 0], return_counts=True)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return user_ids, offsets, pairs[:, 1]
+
+
+_model = None
+
+
+def _init_worker(bundle_path):
+    """Cada processo do pool abre o modelo uma vez (bundle em mmap: páginas compartilhadas pelo page cache)"""
+    global _model
+    _model = load_serving_model(bundle_path)
+
+
+def score_chunk(task):
+    """Recomendações de um pedaço de usuários: (índice, [(chave, valor)], usuários, estratégias)
+
+    Os usuários do pedaço são pontuados juntos por `recommend_batch`, o
+    scoring de /recommend e /recommend/batch (tabela de vizinhos, índice,
+    mistura com o colaborativo), então cada valor é o que a rota calcularia
+    para a mesma chave. A chave de cada usuário são as linhas do histórico:
+    serve /recommend com item_ids e só com user_id (quando o perfil
+    armazenado tem o mesmo histórico).
+    """
+    index, histories, ks = task
+    model = _model
+    bundle = model.bundle
+    item_ids = np.asarray(bundle.catalog.item_ids)
+    states = []
+    for movies in histories:
+        rows = np.searchsorted(item_ids, movies)
+        known = rows < len(item_ids)
+        known[known] = item_ids[rows[known]] == movies[known]
+        if not known.any():
+            continue
+        states.append(sync_profile_state(None, bundle.item_vectors, rows[known])[0])
+
+    entries, strategies = [], {}
+    for k in ks:
+        for state, (result, strategy) in zip(states, recommend_batch(model, states, k)):
+            strategies[strategy] = strategies.get(strategy, 0) + 1
+            if not cacheable(strategy):
+                # Resultado degradado (shards sem resposta): a API também não o guarda
+                continue
+            entries.append((recommendation_key(state.rows, k, bundle.version), result))
+    return index, entries, len(states), strategies
+
+
+class Checkpoint:
+    """Pedaços já gravados no Redis, para retomar uma execução interrompida
+
+    Arquivo texto: a primeira linha são os parâmetros da execução (versão do
+    modelo, k, tamanho dos pedaços...) e cada linha seguinte o índice de um
+    pedaço concluído. Parâmetros diferentes invalidam o arquivo.
+    """
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.done = set()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return self
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        if not lines or json.loads(lines[0]) != self.params:
+            logger.warning(f"Checkpoint {self.path} é de outra execução (modelo ou parâmetros): recomeçando")
+            return self
+        self.done = {int(line) for line in lines[1:] if line}
+        return self
+
+    def start(self):
+        if self.path and not self.done:
+            with open(self.path, "w") as f:
+                f.write(json.dumps(self.params) + "\n")
+
+    def mark(self, index):
+        self.done.add(index)
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(f"{index}\n")
+
+
+def write_entries(client, entries, ttl=MATERIALIZE_TTL, batch=MATERIALIZE_PIPELINE):
+    """SETs com validade em pipeline, `batch` comandos por round trip"""
+    for start in range(0, len(entries), batch):
+        pipeline = client.pipeline(transaction=False)
+        for key, value in entries[start:start + batch]:
+            pipeline.set(key, value, ex=ttl)
+        pipeline.execute()
+
+
+def materialize(ratings_path, bundle_path=DEFAULT_BUNDLE_PATH, ks=(5,), client=None, n_jobs=MATERIALIZE_JOBS,
+                chunk_users=MATERIALIZE_CHUNK_USERS, min_rating=0.0, checkpoint_path=None, ttl=MATERIALIZE_TTL,
+                pipeline=MATERIALIZE_PIPELINE, resume=True):
+    """Pré-calcula as recomendações de todos os usuários de ratings.csv e grava no Redis
+
+    O scoring é o de /recommend, repartido entre `n_jobs` processos; o processo principal grava
+    cada pedaço no Redis assim que ele chega e registra no checkpoint, então
+    uma execução interrompida retoma dos pedaços que faltam. As chaves levam
+    a versão do modelo: a API as lê enquanto servir essa versão.
+    """
+    bundle = load_bundle(bundle_path, mmap_mode="r")
+    client = client or redis.Redis(host=os.getenv('REDIS_HOST', 'localhost'),
+                                   port=int(os.getenv('REDIS_PORT', 6379)))
+    client.ping()
+
+    started = time.perf_counter()
+    user_ids, offsets, movies = read_histories(ratings_path, min_rating)
+    logger.info(f"{len(user_ids)} usuários lidos em {time.perf_counter() - started:.1f}s "
+                f"(modelo {bundle.version}, k={list(ks)})")
+
+    num_chunks = (len(user_ids) + chunk_users - 1) // chunk_users
+    checkpoint = Checkpoint(checkpoint_path, {
+        "model_version": bundle.version, "ratings": os.path.abspath(ratings_path), "users": int(len(user_ids)),
+        "k": list(ks), "chunk_users": chunk_users, "min_rating": min_rating,
+    })
+    if resume:
+        checkpoint.load()
+    checkpoint.start()
+    done = set(checkpoint.done)
+    if done:
+        logger.info(f"Retomando: {len(done)} de {num_chunks} pedaços já gravados")
+
+    def tasks():
+        for index in range(num_chunks):
+            if index in done:
+                continue
+            first, last = index * chunk_users, min((index + 1) * chunk_users, len(user_ids))
+            yield index, [movies[offsets[user]:offsets[user + 1]] for user in range(first, last)], list(ks)
+
+    pending_users = sum(min(chunk_users, len(user_ids) - index * chunk_users)
+                        for index in range(num_chunks) if index not in done)
+    stats = {"users": 0, "skipped": 0, "keys": 0, "write_seconds": 0.0, "strategies": {}}
+    n_jobs = n_jobs if n_jobs > 0 else os.cpu_count() or 1
+    started = last_log = time.perf_counter()
+    with mp.get_context("spawn").Pool(n_jobs, initializer=_init_worker, initargs=(bundle.path,)) as pool:
+        # Ordem de chegada: o Redis recebe um pedaço enquanto os outros são pontuados
+        for index, entries, scored, strategies in pool.imap_unordered(score_chunk, tasks()):
+            write_started = time.perf_counter()
+            write_entries(client, entries, ttl, pipeline)
+            stats["write_seconds"] += time.perf_counter() - write_started
+            checkpoint.mark(index)
+
+            chunk_size = min(chunk_users, len(user_ids) - index * chunk_users)
+            stats["users"] += chunk_size
+            stats["skipped"] += chunk_size - scored
+            stats["keys"] += len(entries)
+            for strategy, count in strategies.items():
+                stats["strategies"][strategy] = stats["strategies"].get(strategy, 0) + count
+
+            now = time.perf_counter()
+            if now - last_log >= MATERIALIZE_LOG_INTERVAL or stats["users"] == pending_users:
+                last_log = now
+                rate = stats["users"] / (now - started)
+                eta = (pending_users - stats["users"]) / rate if rate > 0 else 0
+                logger.info(f"{stats['users']}/{pending_users} usuários ({100 * stats['users'] / pending_users:.1f}%), "
+                            f"{rate:.0f} usuários/s, {stats['keys']} chaves, ETA {eta:.0f}s")
+
+    elapsed = time.perf_counter() - started
+    stats.update(
+        model_version=bundle.version,
+        total_users=int(len(user_ids)),
+        resumed_chunks=len(done),
+        seconds=round(elapsed, 2),
+        users_per_second=round(stats["users"] / elapsed, 1) if elapsed > 0 else None,
+        write_seconds=round(stats["write_seconds"], 2),
+    )
+    logger.info(f"Materialização concluída: {json.dumps(stats)}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pré-calcula as recomendações dos usuários conhecidos no Redis")
+    parser.add_argument("--ratings", default="data/ml-latest-small/ratings.csv",
+                        help="CSV no formato de ratings.csv (userId, movieId, rating)")
+    parser.add_argument("--bundle", default=DEFAULT_BUNDLE_PATH)
+    parser.add_argument("-k", type=int, nargs="+", default=[5], help="num_recommendations materializados")
+    parser.add_argument("--min-rating", type=float, default=0.0, help="Só avaliações >= este valor entram no histórico")
+    parser.add_argument("--n-jobs", type=int, default=MATERIALIZE_JOBS)
+    parser.add_argument("--chunk-users", type=int, default=MATERIALIZE_CHUNK_USERS)
+    parser.add_argument("--ttl", type=int, default=MATERIALIZE_TTL)
+    parser.add_argument("--pipeline", type=int, default=MATERIALIZE_PIPELINE, help="SETs por round trip")
+    parser.add_argument("--checkpoint", default="models/materialize.checkpoint",
+                        help="Arquivo de progresso para retomar execuções interrompidas")
+    parser.add_argument("--restart", action="store_true", help="Ignora o checkpoint e recomeça do zero")
+    args = parser.parse_args()
+
+    materialize(args.ratings, args.bundle, args.k, n_jobs=args.n_jobs, chunk_users=args.chunk_users,
+                min_rating=args.min_rating, checkpoint_path=args.checkpoint, ttl=args.ttl,
+                pipeline=args.pipeline, resume=not args.restart)
@@ -35,10 +35,10 @@ def main():
     
     # 3. Verificar se modelos foram criados
     model_files = [
-        "models/tfidf_vectorizer.pkl",
-        "models/nearest_neighbors.pkl",
-        "models/item_vectors.pkl",
-        "models/items_df.pkl"
+        "models/bundle/manifest.json",
+        "models/bundle/item_ids.npy",
+        "models/bundle/item_vectors/manifest.json",
+        "models/bundle/tfidf_vectorizer.pkl"
     ]
     
     print("\n📁 Verificando arquivos de modelo:")
@@ -97,8 +97,12 @@ def test_recommendations():
             data2 = response2.json()
             logger.info(f"✓ Segunda chamada ({second_call_time:.3f}s): Cache usado: {data2.get('cached', False)}")
             
-            if second_call_time < first_call_time:
-                logger.info("✓ Cache funcionando - segunda chamada mais rápida!")
+            # O flag da resposta é a prova; tempos de uma chamada só variam demais
+            # (latência e throughput: python -m benchmarks.bench_api)
+            if data2.get('cached'):
+                logger.info("✓ Cache funcionando - segunda chamada servida do cache!")
+            else:
+                logger.error("✗ Segunda chamada não veio do cache")
         
     else:
         logger.error(f"✗ Erro nas recomendações: {response.status_code}")
@@ -130,6 +134,35 @@ def test_different_users():
         else:
             logger.error(f"✗ Erro para usuário {payload['user_id']}")
 
+def test_filtered_recommendations():
+    """Testar recomendações com filtros de gênero e ano"""
+    logger.info("=== Testando Recomendações com Filtros ===")
+    
+    payload = {
+        "user_id": "filter_user",
+        "item_ids": ["1", "2", "3"],
+        "num_recommendations": 5,
+        "filters": {"genres": ["Comedy"], "year_min": 1990}
+    }
+    response = requests.post(f"{BASE_URL}/recommend", json=payload)
+    if response.status_code == 200:
+        recommendations = response.json()['recommendations']
+        ok = all("Comedy" in rec['genres'] and int(rec['title'].rstrip()[-5:-1]) >= 1990
+                 for rec in recommendations)
+        if ok:
+            logger.info(f"✓ {len(recommendations)} recomendações, todas Comedy a partir de 1990")
+        else:
+            logger.error("✗ Recomendação fora do filtro")
+    else:
+        logger.error(f"✗ Erro nas recomendações filtradas: {response.status_code}")
+    
+    response = requests.get(f"{BASE_URL}/items?genre=Comedy&limit=3&facets=true")
+    if response.status_code == 200:
+        data = response.json()
+        logger.info(f"✓ {data['total']} itens Comedy; facetas: {len(data['facets']['genres'])} gêneros")
+    else:
+        logger.error(f"✗ Erro ao listar itens filtrados: {response.status_code}")
+
 def run_all_tests():
     """Executar todos os testes"""
     logger.info("🚀 Iniciando testes da API de Recomendação")
@@ -148,6 +181,7 @@ def run_all_tests():
         
         test_recommendations()
         test_different_users()
+        test_filtered_recommendations()
         
         logger.info("✅ Todos os testes concluídos!")
         
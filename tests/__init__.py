@@ -0,0 +1 @@
+# Arquivo vazio para tornar tests um pacote Python
@@ -0,0 +1,113 @@
+"""Fixtures da suíte: um bundle sintético pequeno e a API em processo (ASGI, sem socket)
+
+Os testes assíncronos usam o plugin do anyio (dependência do FastAPI) e
+falam com o app por httpx.ASGITransport: startup, rotas, executor de
+scoring e consumidor de /events são os de produção.
+"""
+import re
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+import train_model
+from app import cache
+from app import main as api
+from app.index import ExactIndex
+from benchmarks.stub_redis import StubRedis
+from benchmarks.synthetic import make_items_df, make_ratings
+
+NUM_ITEMS = 400
+NUM_SHARDS = 2
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def items_df():
+    return make_items_df(NUM_ITEMS)
+
+
+@pytest.fixture(scope="session")
+def ratings():
+    return make_ratings(NUM_ITEMS, 6000, num_users=300)
+
+
+@pytest.fixture(scope="session")
+def bundle_path(tmp_path_factory, items_df, ratings):
+    """Bundle publicado com índice IVF, shards, vizinhos, popularidade e colaborativo"""
+    path = str(tmp_path_factory.mktemp("models") / "bundle")
+    train_model.build_bundle(items_df, path, ratings, n_jobs=1, num_shards=NUM_SHARDS)
+    return path
+
+
+@pytest.fixture
+def redis(request):
+    """Sem parâmetro, sem Redis (cache só em L1, perfis em memória); "stub" usa o StubRedis dos benchmarks"""
+    if getattr(request, "param", None) == "stub":
+        return StubRedis(latency=0)
+    return None
+
+
+@pytest.fixture
+def serve(monkeypatch, redis):
+    """Sobe a API com o bundle publicado em `path` e devolve um cliente httpx; derruba na saída"""
+
+    @asynccontextmanager
+    async def serve(path):
+        monkeypatch.setattr(cache, "redis_client", redis)
+        monkeypatch.setattr(api, "DEFAULT_BUNDLE_PATH", path)
+        monkeypatch.setattr(api, "model", None)
+        cache.local_cache.clear()
+        await api.start_services()
+        try:
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+                yield client
+        finally:
+            await api.stop_services()
+
+    return serve
+
+
+@pytest.fixture
+async def client(serve, bundle_path):
+    async with serve(bundle_path) as client:
+        yield client
+
+
+@pytest.fixture(params=["exact", "ivf"])
+def index_backend(request, client):
+    """Serve com a busca exata ou com o IVF do bundle"""
+    if request.param == "exact":
+        api.model.index = ExactIndex(api.model.bundle.item_vectors)
+    return request.param
+
+
+@pytest.fixture
+def eligible(items_df):
+    """Ids (str) que um pedido pode receber: fora do histórico e dentro dos filtros"""
+    years = items_df["title"].map(lambda title: int(re.search(r"\((\d{4})\)$", title).group(1)))
+    genres = items_df["genres"].str.split("|").map(set)
+
+    def eligible(history, filters=None):
+        filters = filters or {}
+        accepted = set()
+        for item_id in items_df.index:
+            if str(item_id) in history:
+                continue
+            if filters.get("genres") and not genres[item_id] & set(filters["genres"]):
+                continue
+            if genres[item_id] & set(filters.get("exclude_genres") or ()):
+                continue
+            if filters.get("year_min") is not None and years[item_id] < filters["year_min"]:
+                continue
+            if filters.get("year_max") is not None and years[item_id] > filters["year_max"]:
+                continue
+            accepted.add(str(item_id))
+        return accepted
+
+    return eligible
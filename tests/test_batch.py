@@ -0,0 +1,83 @@
+"""/recommend/batch: k e filtros de cada pedido, mesmo resultado e mesmas chaves de cache de /recommend"""
+import json
+
+import pytest
+
+from app import main as api
+
+pytestmark = pytest.mark.anyio
+
+BATCH_K = 7
+
+
+def batch_requests(items_df) -> list:
+    ids = [str(i) for i in items_df.index]
+    return [
+        {"user_id": "short", "item_ids": ids[:1], "num_recommendations": 3},
+        # Sem num_recommendations: vale o do lote
+        {"user_id": "default_k", "item_ids": ids[10:20]},
+        {"user_id": "genres", "item_ids": ids[10:20], "num_recommendations": 12, "filters": {"genres": ["Drama"]}},
+        {"user_id": "exclude", "item_ids": ids[40:100],
+         "filters": {"exclude_genres": ["Drama"], "year_min": 1980}},
+        {"user_id": "selective", "item_ids": ids[:5], "num_recommendations": 25,
+         "filters": {"genres": ["Film-Noir"], "year_min": 2010}},
+        {"user_id": "cold_start", "item_ids": ["unknown"], "num_recommendations": 4},
+        # Só user_id: perfil alimentado por /events
+        {"user_id": "events_user", "num_recommendations": 6},
+    ]
+
+
+async def feed_events(client, user_id, item_ids):
+    response = await client.post("/events", content="\n".join(
+        json.dumps({"user_id": user_id, "item_id": item_id}) for item_id in item_ids
+    ))
+    assert response.status_code == 202
+    await api.event_consumer.wait_idle()
+
+
+async def test_batch_uses_each_request_k_and_filters(client, index_backend, items_df, eligible):
+    requests = batch_requests(items_df)
+    events = [str(i) for i in items_df.index[200:215]]
+    await feed_events(client, "events_user", events)
+
+    response = await client.post("/recommend/batch", json={"requests": requests, "num_recommendations": BATCH_K})
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["user_id"] for result in results] == [request["user_id"] for request in requests]
+
+    for request, result in zip(requests, results):
+        k = request.get("num_recommendations", BATCH_K)
+        history = request.get("item_ids", events)
+        accepted = eligible(history, request.get("filters"))
+        recommended = [item["item_id"] for item in result["recommendations"]]
+        assert result["cached"] is False
+        assert set(recommended) <= accepted, request["user_id"]
+        assert len(recommended) == min(k, len(accepted)), request["user_id"]
+    assert results[-2]["strategy"] == "popular"
+
+
+async def test_batch_matches_single_requests_and_shares_cache(client, index_backend, items_df):
+    requests = batch_requests(items_df)
+    await feed_events(client, "events_user", [str(i) for i in items_df.index[200:215]])
+
+    batch = (await client.post("/recommend/batch", json={"requests": requests, "num_recommendations": BATCH_K}))
+    for request, result in zip(requests, batch.json()["results"]):
+        single = await client.post("/recommend", json={"num_recommendations": BATCH_K, **request})
+        assert single.status_code == 200, single.text
+        # O lote preencheu a mesma chave que /recommend usa para o mesmo histórico, k e filtros
+        assert single.json()["cached"] is True, request["user_id"]
+        assert single.json()["recommendations"] == result["recommendations"], request["user_id"]
+        assert single.json()["strategy"] == result["strategy"]
+
+
+async def test_single_requests_fill_batch_cache(client, index_backend, items_df):
+    requests = batch_requests(items_df)[:5]
+    singles = []
+    for request in requests:
+        response = await client.post("/recommend", json={"num_recommendations": BATCH_K, **request})
+        singles.append(response.json())
+
+    batch = await client.post("/recommend/batch", json={"requests": requests, "num_recommendations": BATCH_K})
+    for single, result in zip(singles, batch.json()["results"]):
+        assert result["cached"] is True
+        assert result["recommendations"] == single["recommendations"]
@@ -0,0 +1,112 @@
+"""Perfis: /events e históricos de /recommend se somam, e o perfil sobrevive à troca de versão do bundle"""
+import json
+
+import numpy as np
+import pytest
+
+import train_model
+from app import main as api
+from app.profiles import sync_profile_state, unique_rows
+from app.scoring import recommend_from_state
+
+pytestmark = pytest.mark.anyio
+
+STORES = pytest.mark.parametrize("redis", [None, "stub"], indirect=True)
+
+
+async def feed_events(client, user_id, item_ids):
+    response = await client.post("/events", content="\n".join(
+        json.dumps({"user_id": user_id, "item_id": item_id}) for item_id in item_ids
+    ))
+    assert response.status_code == 202
+    await api.event_consumer.wait_idle()
+
+
+async def recommend(client, body):
+    response = await client.post("/recommend", json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def stored_ids(user_id) -> set:
+    state = await api.model.profile_store.get(user_id)
+    return {str(item_id) for item_id in api.model.bundle.catalog.item_ids[state.rows]}
+
+
+def scored_alone(item_ids, k) -> dict:
+    """Resultado de referência: o histórico pontuado a partir de um perfil novo, sem store nem cache"""
+    rows = unique_rows(api.model.bundle.catalog.rows_of(item_ids))
+    state, _ = sync_profile_state(None, api.model.bundle.item_vectors, rows)
+    return json.loads(recommend_from_state(api.model, state, k)[0])
+
+
+def assert_same_recommendations(result, expected):
+    assert [item["item_id"] for item in result["recommendations"]] == \
+        [item["item_id"] for item in expected["recommendations"]]
+    assert [item["score"] for item in result["recommendations"]] == \
+        pytest.approx([item["score"] for item in expected["recommendations"]], abs=1e-5)
+
+
+@STORES
+async def test_events_and_history_merge(client, items_df, redis):
+    assert api.model.profile_store.backend == ("redis" if redis else "memory")
+    ids = [str(i) for i in items_df.index]
+    events, history = ids[300:310], ids[:12]
+    await feed_events(client, "user", events)
+
+    # O pedido pontua só o próprio histórico, mas o perfil guarda a união
+    result = await recommend(client, {"user_id": "user", "item_ids": history, "num_recommendations": 10})
+    assert_same_recommendations(result, scored_alone(history, 10))
+    assert await stored_ids("user") == set(events) | set(history)
+
+    # Histórico sem alguns itens do perfil armazenado: eles são subtraídos da soma, não há rebuild
+    partial = history[1:] + events[:8] + ids[100:103]
+    result = await recommend(client, {"user_id": "user", "item_ids": partial, "num_recommendations": 10})
+    assert_same_recommendations(result, scored_alone(partial, 10))
+    assert await stored_ids("user") == set(events) | set(history) | set(partial)
+
+    # Só user_id: recomenda a partir do perfil inteiro, com a chave do histórico equivalente
+    merged = sorted(set(events) | set(history) | set(partial))
+    by_profile = await recommend(client, {"user_id": "user", "num_recommendations": 10})
+    by_history = await recommend(client, {"user_id": "other", "item_ids": merged, "num_recommendations": 10})
+    assert by_history["cached"] is True
+    assert by_history["recommendations"] == by_profile["recommendations"]
+
+
+@STORES
+async def test_profiles_survive_reload(serve, tmp_path, items_df, ratings, redis):
+    path = str(tmp_path / "bundle")
+    train_model.build_bundle(items_df, path, ratings, n_jobs=1)
+    ids = [str(i) for i in items_df.index]
+    events, history = ids[300:310], ids[:12]
+
+    async with serve(path) as client:
+        await feed_events(client, "user", events)
+        await recommend(client, {"user_id": "user", "item_ids": history, "num_recommendations": 10})
+        previous = api.model.version
+
+        # Versão nova sem dois itens do perfil: as linhas de todos os outros mudam
+        removed = [int(history[0]), int(events[5])]
+        train_model.build_bundle(items_df.drop(removed), path, ratings[~ratings["movieId"].isin(removed)],
+                                 n_jobs=1)
+        response = await client.post("/admin/reload")
+        assert response.status_code == 200, response.text
+        assert response.json()["reloaded"] is True
+        assert api.model.version != previous
+
+        # O perfil é refeito pelos ids na versão nova; os itens removidos ficam de fora
+        expected = (set(events) | set(history)) - {str(item_id) for item_id in removed}
+        assert await stored_ids("user") == expected
+        state = await api.model.profile_store.get("user")
+        item_vectors = api.model.bundle.item_vectors
+        assert np.allclose(state.total, np.asarray(item_vectors[state.rows].sum(axis=0)).ravel(), atol=1e-5)
+
+        by_history = await recommend(client, {"user_id": "other", "item_ids": sorted(expected),
+                                              "num_recommendations": 10})
+        by_profile = await recommend(client, {"user_id": "user", "num_recommendations": 10})
+        assert by_profile["cached"] is True
+        assert by_profile["recommendations"] == by_history["recommendations"]
+
+        # E continua recebendo eventos na versão nova
+        await feed_events(client, "user", ids[350:352])
+        assert await stored_ids("user") == expected | set(ids[350:352])
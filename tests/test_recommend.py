@@ -0,0 +1,95 @@
+"""/recommend devolve exatamente k itens não vistos e dentro dos filtros sempre que existirem"""
+import numpy as np
+import pytest
+
+from app import main as api
+
+pytestmark = pytest.mark.anyio
+
+FILTERS = [
+    {"genres": ["Western"]},
+    {"exclude_genres": ["Drama", "Comedy"], "year_min": 1970},
+    # Seletivo: menos itens aceitos que k
+    {"genres": ["Film-Noir"], "year_min": 2010},
+]
+
+
+def ids_of(response) -> list:
+    return [item["item_id"] for item in response.json()["recommendations"]]
+
+
+async def recommend(client, history, k, filters=None, user_id="user"):
+    body = {"user_id": user_id, "item_ids": history, "num_recommendations": k}
+    if filters:
+        body["filters"] = filters
+    response = await client.post("/recommend", json=body)
+    assert response.status_code == 200, response.text
+    return response
+
+
+@pytest.mark.parametrize("k", [50, 100])
+async def test_long_history_returns_exactly_k_unseen(client, index_backend, items_df, eligible, k):
+    history = [str(i) for i in items_df.index[:320]]
+    recommended = ids_of(await recommend(client, history, k))
+
+    assert len(recommended) == min(k, len(eligible(history)))
+    assert len(set(recommended)) == len(recommended)
+    assert set(recommended) <= eligible(history)
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("history_len", [1, 10, 200])
+async def test_filters_apply_before_top_k(client, index_backend, items_df, eligible, filters, history_len):
+    history = [str(i) for i in items_df.index[:history_len]]
+    k = 20
+    accepted = eligible(history, filters)
+    recommended = ids_of(await recommend(client, history, k, filters, user_id=f"user_{history_len}"))
+
+    assert set(recommended) <= accepted
+    if len(accepted) >= k:
+        assert len(recommended) == k
+    else:
+        assert set(recommended) == accepted
+
+
+async def test_ivf_probe_expands_until_k(client, items_df, eligible):
+    index = api.model.index
+    assert index.backend == "ivf"
+    index.nprobe = 1
+    # Uma lista não tem k itens: só a expansão da sondagem completa o resultado
+    k = 60
+    assert np.diff(index.list_offsets).max() < k
+
+    history = [str(i) for i in items_df.index[:10]]
+    recommended = ids_of(await recommend(client, history, k))
+    assert len(recommended) == k
+    assert set(recommended) <= eligible(history)
+
+    # Quase tudo visto: os itens restantes estão espalhados por todas as listas
+    history = [str(i) for i in items_df.index[30:]]
+    recommended = ids_of(await recommend(client, history, 30, user_id="heavy"))
+    assert set(recommended) == eligible(history)
+
+
+async def test_ivf_probe_expands_with_selective_filter(client, items_df, eligible):
+    api.model.index.nprobe = 1
+    history = [str(i) for i in items_df.index[:10]]
+    filters = {"genres": ["Western"], "year_min": 1950}
+    accepted = eligible(history, filters)
+    k = 15
+    assert len(accepted) >= k
+
+    recommended = ids_of(await recommend(client, history, k, filters))
+    assert len(recommended) == k
+    assert set(recommended) <= accepted
+
+
+async def test_repeated_request_is_served_from_cache(client, items_df):
+    history = [str(i) for i in items_df.index[:8]]
+    first = await recommend(client, history, 10)
+    # Mesmo histórico em outra ordem, com duplicatas, para outro usuário: mesma chave
+    second = await recommend(client, history[::-1] + history[:2], 10, user_id="other")
+
+    assert first.json()["cached"] is False
+    assert second.json()["cached"] is True
+    assert ids_of(second) == ids_of(first)
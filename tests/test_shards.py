@@ -0,0 +1,63 @@
+"""Shard sem resposta: resultado parcial marcado na estratégia, fora do cache, até o shard voltar"""
+import asyncio
+import os
+
+import pytest
+
+from app import main as api
+from app.shards import SHARDS_DIR, ShardedIndex, ShardLayout
+
+pytestmark = pytest.mark.anyio
+
+# Os processos dos shards sobem por spawn (importam numpy/scipy): prazo folgado
+SHARD_TIMEOUT_MS = 5000
+REVIVE_TIMEOUT = 60
+
+
+@pytest.fixture
+def sharded(client):
+    """Serve pelos processos dos shards do bundle (fechados com o modelo no shutdown)"""
+    bundle = api.model.bundle
+    layout = ShardLayout.load(os.path.join(bundle.path, SHARDS_DIR))
+    api.model.index = ShardedIndex(bundle.item_vectors, bundle.path, layout, timeout_ms=SHARD_TIMEOUT_MS).start()
+    return api.model.index
+
+
+def body(items_df, start, k=10):
+    # Históricos longos o bastante para ir ao índice (não à tabela de vizinhos)
+    return {"user_id": f"user_{start}", "item_ids": [str(i) for i in items_df.index[start:start + 6]],
+            "num_recommendations": k}
+
+
+async def test_missing_shard_gives_partial_uncached_results(client, sharded, items_df):
+    response = (await client.post("/recommend", json=body(items_df, 0))).json()
+    assert not response["strategy"].endswith("_partial")
+    assert len(response["recommendations"]) == 10
+    assert (await client.post("/recommend", json=body(items_df, 0))).json()["cached"] is True
+
+    sharded._processes[1].kill()
+    sharded._processes[1].join()
+
+    # Só o shard 0 responde: os k itens vêm da faixa dele
+    first_row = sharded.layout.bounds[1]
+    response = (await client.post("/recommend", json=body(items_df, 20))).json()
+    assert response["strategy"].endswith("_partial")
+    assert response["cached"] is False
+    assert len(response["recommendations"]) == 10
+    assert all(api.model.bundle.catalog.rows_of([item["item_id"]])[0] < first_row
+               for item in response["recommendations"])
+    assert (await client.post("/recommend", json=body(items_df, 20))).json()["cached"] is False
+
+    batch = await client.post("/recommend/batch", json={"requests": [body(items_df, 40), body(items_df, 60, k=4)]})
+    assert all(result["strategy"].endswith("_partial") for result in batch.json()["results"])
+    retry = await client.post("/recommend/batch", json={"requests": [body(items_df, 40), body(items_df, 60, k=4)]})
+    assert [result["cached"] for result in retry.json()["results"]] == [False, False]
+
+    # O shard caído é reiniciado; quando volta, o resultado completo vai para o cache
+    deadline = asyncio.get_running_loop().time() + REVIVE_TIMEOUT
+    while response["strategy"].endswith("_partial"):
+        assert asyncio.get_running_loop().time() < deadline, "shard não voltou"
+        await asyncio.sleep(0.2)
+        response = (await client.post("/recommend", json=body(items_df, 20))).json()
+    assert response["cached"] is False
+    assert (await client.post("/recommend", json=body(items_df, 20))).json()["cached"] is True
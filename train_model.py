@@ -1,124 +1,368 @@
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.neighbors import NearestNeighbors
-import joblib
+from joblib import Parallel, cpu_count, delayed
+from numbers import Integral
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+import argparse
 import os
+import resource
+import time
 import requests
 import zipfile
 import logging
+from app.artifacts import load_bundle, new_version_path, publish_bundle, save_bundle
+from app.collaborative import CF_FACTORS, InteractionsBuilder, build_collaborative
+from app.index import INDEX_DIR, build_index, load_index
+from app.neighbors import NEIGHBOR_TABLE_K, NEIGHBORS_DIR, NeighborTable, build_neighbor_table
+from app.popularity import aggregate_ratings, build_popularity
+from app.shards import ShardLayout
+from app.vectors import to_item_vectors
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Índice persistido no bundle ("ivf" ou "exact") e seus parâmetros de treino
+INDEX_BACKEND = os.getenv("TRAIN_INDEX_BACKEND", "ivf")
+IVF_NLIST = int(os.getenv("IVF_NLIST", 0)) or None
+# Shards do catálogo (faixas de linhas com índice próprio, servidas em processos separados); 0 = sem shards
+TRAIN_SHARDS = int(os.getenv("TRAIN_SHARDS", 0))
+# Linhas por pedaço na leitura dos CSVs e na vetorização
+TRAIN_CHUNK_ROWS = int(os.getenv("TRAIN_CHUNK_ROWS", 50_000))
+# Processos do treino (joblib); -1 = um por núcleo
+TRAIN_JOBS = int(os.getenv("TRAIN_JOBS", -1))
+
+TFIDF_PARAMS = dict(
+    max_features=5000,
+    stop_words='english',
+    ngram_range=(1, 2),
+    min_df=1,
+    max_df=0.95
+)
+# Aplicados só depois de somar as contagens de todos os pedaços
+LIMIT_PARAMS = ("max_features", "min_df", "max_df")
+
+def path_size(path):
+    """Tamanho em bytes de um arquivo ou diretório de artefatos"""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(path)
+            for name in files
+        )
+    return os.path.getsize(path)
+
+def peak_rss_mb():
+    """Pico de memória residente do processo principal (os workers do joblib não entram)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
 def download_movielens_data():
     """Download e extração do dataset MovieLens"""
     url = "https://files.grouplens.org/datasets/movielens/ml-latest-small.zip"
-    
+
     if not os.path.exists("data"):
         os.makedirs("data")
-    
+
     if not os.path.exists("data/ml-latest-small"):
         logger.info("Baixando dataset MovieLens...")
         try:
             response = requests.get(url, timeout=30)
             response.raise_for_status()
-            
+
             with open("data/movielens.zip", "wb") as f:
                 f.write(response.content)
-            
+
             with zipfile.ZipFile("data/movielens.zip", 'r') as zip_ref:
                 zip_ref.extractall("data/")
-            
+
             os.remove("data/movielens.zip")
             logger.info("Dataset baixado e extraído com sucesso!")
-            
+
         except Exception as e:
             logger.error(f"Erro ao baixar dataset: {e}")
             raise
     else:
         logger.info("Dataset já existe, pulando download...")
 
-def prepare_data():
-    """Prepara os dados para o modelo de recomendação"""
-    download_movielens_data()
-    
-    # Carregar dados
-    logger.info("Carregando dados...")
-    movies = pd.read_csv("data/ml-latest-small/movies.csv")
-    ratings = pd.read_csv("data/ml-latest-small/ratings.csv")
-    
-    logger.info(f"Carregados {len(movies)} filmes e {len(ratings)} avaliações")
-    
-    # Limpar dados
+def clean_movies(movies):
+    """Linhas de movies.csv -> itens (title, genres, description) indexados por movieId"""
+    movies = movies.copy()
     movies['genres'] = movies['genres'].fillna('Unknown')
     movies['title'] = movies['title'].fillna('Unknown Title')
-    
+
     # Criar descrição combinada (título + gêneros)
     movies['description'] = movies['title'] + " " + movies['genres']
-    
-    # Preparar DataFrame de itens
-    items_df = movies.set_index('movieId')[['title', 'genres', 'description']]
-    
+    return movies.set_index('movieId')[['title', 'genres', 'description']]
+
+def read_movies(path, chunksize=TRAIN_CHUNK_ROWS):
+    """Lê um CSV no formato de movies.csv em pedaços; itens ordenados por id"""
+    chunks = [clean_movies(movies) for movies in pd.read_csv(path, chunksize=chunksize)]
+    # Ordenado por id: a API localiza itens por busca binária no bundle
+    return pd.concat(chunks).sort_index()
+
+def read_ratings(path, chunksize=TRAIN_CHUNK_ROWS):
+    """Lê ratings.csv em pedaços: contagem e soma das notas por filme (popularidade)
+    e as avaliações em arrays compactos (modelo colaborativo)"""
+    ratings = None
+    interactions = InteractionsBuilder()
+    for chunk in pd.read_csv(path, usecols=['userId', 'movieId', 'rating'], chunksize=chunksize):
+        interactions.add(chunk)
+        stats = aggregate_ratings(chunk)
+        ratings = stats if ratings is None else ratings.add(stats, fill_value=0)
+    return ratings, interactions
+
+def prepare_data(data_dir="data/ml-latest-small", chunksize=TRAIN_CHUNK_ROWS):
+    """Prepara os dados para o modelo de recomendação
+
+    Os CSVs são lidos em pedaços de `chunksize` linhas: a memória do treino não
+    cresce com o tamanho de ratings.csv.
+    """
+    download_movielens_data()
+
+    # Carregar dados
+    logger.info("Carregando dados...")
+    items_df = read_movies(os.path.join(data_dir, "movies.csv"), chunksize)
+    ratings, interactions = read_ratings(os.path.join(data_dir, "ratings.csv"), chunksize)
+
+    logger.info(f"Carregados {len(items_df)} filmes e {len(interactions)} avaliações")
     logger.info(f"Dados preparados: {len(items_df)} itens")
-    return items_df
+    return items_df, ratings, interactions
+
+def _split(values, n_jobs, chunksize=TRAIN_CHUNK_ROWS):
+    """Pedaços para os workers: ao menos um por worker, no máximo chunksize linhas cada"""
+    workers = cpu_count() if n_jobs == -1 else max(1, n_jobs)
+    parts = max(workers, -(-len(values) // chunksize))
+    return [part for part in np.array_split(np.asarray(values, dtype=object), parts) if part.size]
+
+def _count_terms(descriptions):
+    """Termos do pedaço (ordenados), com frequência de documento e total de ocorrências"""
+    counter = CountVectorizer(**{key: value for key, value in TFIDF_PARAMS.items() if key not in LIMIT_PARAMS})
+    counts = counter.fit_transform(descriptions)
+    return (
+        np.asarray(counter.get_feature_names_out(), dtype=object),
+        np.bincount(counts.indices, minlength=counts.shape[1]),
+        np.asarray(counts.sum(axis=0)).ravel(),
+    )
+
+def fit_vectorizer(descriptions, n_jobs=TRAIN_JOBS):
+    """Treina o TF-IDF contando termos em paralelo, pedaço a pedaço
+
+    As contagens dos pedaços são somadas e os cortes (max_df, min_df,
+    max_features) e o idf são aplicados como no TfidfVectorizer.fit: o
+    vocabulário e os pesos resultantes são os mesmos do fit sequencial.
+    """
+    results = Parallel(n_jobs=n_jobs)(delayed(_count_terms)(part) for part in _split(descriptions, n_jobs))
+    terms, inverse = np.unique(np.concatenate([r[0] for r in results]), return_inverse=True)
+    dfs = np.zeros(len(terms), dtype=np.int64)
+    tfs = np.zeros(len(terms), dtype=np.int64)
+    np.add.at(dfs, inverse, np.concatenate([r[1] for r in results]))
+    np.add.at(tfs, inverse, np.concatenate([r[2] for r in results]))
+
+    # Mesmos cortes de CountVectorizer._limit_features, sobre o vocabulário ordenado
+    num_docs = len(descriptions)
+    max_df, min_df, limit = TFIDF_PARAMS['max_df'], TFIDF_PARAMS['min_df'], TFIDF_PARAMS['max_features']
+    mask = dfs <= (max_df if isinstance(max_df, Integral) else max_df * num_docs)
+    mask &= dfs >= (min_df if isinstance(min_df, Integral) else min_df * num_docs)
+    if limit is not None and mask.sum() > limit:
+        mask_inds = (-tfs[mask]).argsort()[:limit]
+        new_mask = np.zeros(len(dfs), dtype=bool)
+        new_mask[np.where(mask)[0][mask_inds]] = True
+        mask = new_mask
+
+    vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+    vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms[mask].tolist())}
+    vectorizer.fixed_vocabulary_ = False
+    # idf suavizado (smooth_idf=True), como no TfidfTransformer
+    vectorizer.idf_ = np.log((1 + num_docs) / (1 + dfs[mask])) + 1
+    return vectorizer
+
+def transform_descriptions(vectorizer, descriptions, n_jobs=TRAIN_JOBS):
+    """Vetores dos itens (CSR float32, L2-normalizado) com o TF-IDF congelado, em paralelo"""
+    parts = Parallel(n_jobs=n_jobs)(
+        delayed(vectorizer.transform)(part) for part in _split(descriptions, n_jobs)
+    )
+    return to_item_vectors(sparse.vstack(parts, format="csr"))
+
+def build_item_vectors(items_df, n_jobs=TRAIN_JOBS):
+    """Treina o TF-IDF e gera os vetores de itens (CSR float32, L2-normalizado)"""
+    logger.info("Treinando modelo TF-IDF...")
+    vectorizer = fit_vectorizer(items_df['description'], n_jobs)
+
+    # Criar vetores TF-IDF (mantidos esparsos; a busca usa produto escalar)
+    item_vectors = transform_descriptions(vectorizer, items_df['description'], n_jobs)
+    logger.info(f"Vetores TF-IDF criados: {item_vectors.shape} (nnz={item_vectors.nnz})")
+
+    return vectorizer, item_vectors
 
-def train_model():
+def build_bundle(items_df, path="models/bundle", ratings=None, n_jobs=TRAIN_JOBS, interactions=None,
+                 num_shards=TRAIN_SHARDS):
+    """Vetoriza os itens, constrói índice, shards, vizinhos, popularidade e colaborativo e publica o bundle
+
+    `ratings` são as avaliações agregadas por filme ou cruas (userId, movieId,
+    rating); `interactions` (InteractionsBuilder) alimenta o modelo
+    colaborativo e, se omitido, é montado a partir das avaliações cruas.
+    Com `num_shards` > 0 o catálogo também é dividido em shards, cada um
+    com o próprio índice (SHARD_SERVING=1 na API).
+
+    O bundle é gravado como uma versão nova e só então `path` passa a apontar
+    para ela: APIs rodando recarregam sem nunca ver uma versão pela metade.
+    """
+    vectorizer, item_vectors = build_item_vectors(items_df, n_jobs)
+
+    # Índice de busca (ANN por padrão), persistido junto com os vetores
+    logger.info(f"Construindo índice {INDEX_BACKEND}...")
+    index_params = {"nlist": IVF_NLIST} if INDEX_BACKEND == "ivf" else {}
+    index = build_index(INDEX_BACKEND, item_vectors, **index_params)
+    shards = None
+    if num_shards > 0:
+        logger.info(f"Dividindo o catálogo em {num_shards} shards...")
+        shards = ShardLayout.build(item_vectors, num_shards, INDEX_BACKEND, **index_params)
+
+    # Top-K vizinhos de cada item, em blocos paralelos (históricos curtos)
+    logger.info(f"Calculando tabela de vizinhos (k={NEIGHBOR_TABLE_K})...")
+    neighbor_table = build_neighbor_table(item_vectors, NEIGHBOR_TABLE_K, n_jobs)
+
+    # Ranking de popularidade (média bayesiana das avaliações) para o cold start
+    popularity = None
+    if ratings is not None:
+        logger.info("Calculando ranking de popularidade...")
+        popularity = build_popularity(items_df.index.to_numpy(dtype=np.int64), items_df['genres'].tolist(), ratings)
+
+    # Embeddings colaborativos (SVD truncado das avaliações), misturados ao conteúdo na API
+    if interactions is None and ratings is not None and 'userId' in ratings.columns:
+        interactions = InteractionsBuilder()
+        interactions.add(ratings)
+    collaborative = None
+    if interactions is not None and len(interactions):
+        logger.info(f"Treinando modelo colaborativo ({CF_FACTORS} fatores)...")
+        collaborative = build_collaborative(interactions.matrix(items_df.index.to_numpy(dtype=np.int64)))
+
+    # Salvar modelos
+    logger.info("Salvando modelos...")
+    version_path = new_version_path(path)
+    save_bundle(version_path, items_df, item_vectors, vectorizer, index, neighbor_table, popularity,
+                collaborative, shards, version=os.path.basename(version_path))
+    publish_bundle(version_path, path)
+
+    return vectorizer, item_vectors
+
+def update_bundle(path, new_items_df, n_jobs=TRAIN_JOBS):
+    """Adiciona ou atualiza itens num bundle existente sem retreinar
+
+    Os itens novos são vetorizados com o TF-IDF congelado do bundle; índice,
+    tabela de vizinhos, popularidade e embeddings colaborativos são atualizados a partir dos existentes
+    (custo proporcional aos itens alterados) e o resultado é publicado como
+    uma versão nova do bundle.
+    """
+    bundle = load_bundle(path, mmap_mode="r")
+    catalog = bundle.catalog
+    old_ids = np.asarray(catalog.item_ids)
+    new_ids = new_items_df.index.to_numpy(dtype=np.int64)
+
+    # Linhas do catálogo mesclado (ids ordenados) de itens antigos e alterados
+    item_ids = np.union1d(old_ids, new_ids)
+    old_to_new = np.searchsorted(item_ids, old_ids)
+    changed_rows = np.searchsorted(item_ids, new_ids)
+    num_updated = int(np.isin(new_ids, old_ids).sum())
+    logger.info(f"Atualização incremental: {len(new_ids) - num_updated} itens novos, {num_updated} alterados")
+
+    old_items = pd.DataFrame({
+        'title': [catalog.titles[row] for row in range(len(catalog))],
+        'genres': [catalog.genres[row] for row in range(len(catalog))],
+    }, index=pd.Index(old_ids, name='movieId'))
+    items_df = pd.concat([
+        old_items.drop(new_ids, errors='ignore'), new_items_df[['title', 'genres']]
+    ]).sort_index()
+
+    # Vetores: antigos nas novas posições, alterados com o TF-IDF congelado
+    vectorizer = bundle.vectorizer
+    new_vectors = transform_descriptions(vectorizer, new_items_df['description'], n_jobs)
+    stacked = sparse.vstack([bundle.item_vectors, new_vectors], format="csr")
+    source = np.empty(len(item_ids), dtype=np.int64)
+    source[old_to_new] = np.arange(len(old_ids))
+    source[changed_rows] = len(old_ids) + np.arange(len(new_ids))
+    item_vectors = to_item_vectors(stacked[source])
+
+    index = load_index(os.path.join(path, INDEX_DIR), bundle.item_vectors, backend="auto")
+    index = index.patch(item_vectors, old_to_new, changed_rows)
+
+    neighbor_table = NeighborTable.load(os.path.join(path, NEIGHBORS_DIR))
+    if neighbor_table is not None:
+        neighbor_table = neighbor_table.patch(item_vectors, old_to_new, changed_rows, n_jobs)
+
+    popularity = bundle.popularity
+    if popularity is not None:
+        popularity = popularity.patch(old_to_new, items_df['genres'].tolist())
+
+    collaborative = bundle.collaborative
+    if collaborative is not None:
+        collaborative = collaborative.patch(old_to_new, len(item_ids))
+
+    # As faixas de linhas dos shards mudam com itens novos: refeitos com o mesmo número de shards
+    shards = None
+    if bundle.manifest.get("shards"):
+        num_shards = len(bundle.manifest["shards"]) - 1
+        logger.info(f"Refazendo {num_shards} shards...")
+        shards = ShardLayout.build(item_vectors, num_shards, index.backend,
+                                   **({"nlist": IVF_NLIST} if index.backend == "ivf" else {}))
+
+    version_path = new_version_path(path)
+    save_bundle(version_path, items_df, item_vectors, vectorizer, index, neighbor_table, popularity,
+                collaborative, shards, extra={
+        "incremental": {
+            "base_created_at": bundle.manifest.get("incremental", {}).get(
+                "base_created_at", bundle.manifest.get("created_at")),
+            "added": len(new_ids) - num_updated,
+            "updated": num_updated,
+        },
+    }, version=os.path.basename(version_path))
+    publish_bundle(version_path, path)
+    return item_vectors
+
+def train_model(data_dir="data/ml-latest-small", chunksize=TRAIN_CHUNK_ROWS, n_jobs=TRAIN_JOBS,
+                num_shards=TRAIN_SHARDS):
     """Treina o modelo de recomendação"""
     logger.info("=== Iniciando treinamento do modelo ===")
-    
+    started = time.perf_counter()
+
     # Preparar dados
-    items_df = prepare_data()
-    
-    # Treinar TF-IDF
-    logger.info("Treinando modelo TF-IDF...")
-    vectorizer = TfidfVectorizer(
-        max_features=5000,
-        stop_words='english',
-        ngram_range=(1, 2),
-        min_df=1,
-        max_df=0.95
-    )
-    
-    # Criar vetores TF-IDF
-    item_vectors = vectorizer.fit_transform(items_df['description'])
-    logger.info(f"Vetores TF-IDF criados: {item_vectors.shape}")
-    
-    # Treinar Nearest Neighbors
-    logger.info("Treinando modelo Nearest Neighbors...")
-    nn_model = NearestNeighbors(
-        n_neighbors=min(50, len(items_df)),
-        metric='cosine',
-        algorithm='brute'
-    )
-    nn_model.fit(item_vectors)
-    
+    items_df, ratings, interactions = prepare_data(data_dir, chunksize)
+
     # Criar diretório de modelos
     os.makedirs("models", exist_ok=True)
-    
-    # Salvar modelos
-    logger.info("Salvando modelos...")
-    joblib.dump(vectorizer, "models/tfidf_vectorizer.pkl")
-    joblib.dump(nn_model, "models/nearest_neighbors.pkl")
-    joblib.dump(item_vectors.toarray(), "models/item_vectors.pkl")
-    items_df.to_pickle("models/items_df.pkl")
-    
+
+    vectorizer, item_vectors = build_bundle(items_df, "models/bundle", ratings, n_jobs, interactions, num_shards)
+
     logger.info("=== Modelos salvos com sucesso! ===")
     logger.info(f"Arquivos salvos em: {os.path.abspath('models')}")
-    
+
     # Verificar arquivos salvos
-    model_files = [
-        "models/tfidf_vectorizer.pkl",
-        "models/nearest_neighbors.pkl",
-        "models/item_vectors.pkl", 
-        "models/items_df.pkl"
-    ]
-    
-    for file in model_files:
-        size = os.path.getsize(file) / (1024*1024)  # MB
+    for name in sorted(os.listdir("models/bundle")):
+        file = os.path.join("models/bundle", name)
+        size = path_size(file) / (1024*1024)  # MB
         logger.info(f"✓ {file} ({size:.2f} MB)")
-    
-    return vectorizer, nn_model, items_df, item_vectors
+
+    logger.info(f"Treino completo em {time.perf_counter() - started:.1f}s (pico de memória {peak_rss_mb():.0f} MB)")
+    return vectorizer, items_df, item_vectors
+
+def add_items(csv_path, path="models/bundle", chunksize=TRAIN_CHUNK_ROWS, n_jobs=TRAIN_JOBS):
+    """Adiciona/atualiza os itens de um CSV no formato de movies.csv no bundle existente"""
+    logger.info(f"=== Atualização incremental a partir de {csv_path} ===")
+    started = time.perf_counter()
+    update_bundle(path, read_movies(csv_path, chunksize), n_jobs)
+    logger.info(f"Atualização em {time.perf_counter() - started:.1f}s (pico de memória {peak_rss_mb():.0f} MB)")
 
 if __name__ == "__main__":
-    train_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Treina o bundle de recomendação")
+    parser.add_argument("--add-items", metavar="CSV",
+                        help="CSV no formato de movies.csv: adiciona/atualiza esses itens no bundle sem retreinar")
+    parser.add_argument("--bundle", default="models/bundle", help="Bundle atualizado por --add-items")
+    parser.add_argument("--chunksize", type=int, default=TRAIN_CHUNK_ROWS)
+    parser.add_argument("--n-jobs", type=int, default=TRAIN_JOBS)
+    parser.add_argument("--shards", type=int, default=TRAIN_SHARDS, help="Shards do catálogo; 0 = sem shards")
+    args = parser.parse_args()
+
+    if args.add_items:
+        add_items(args.add_items, args.bundle, args.chunksize, args.n_jobs)
+    else:
+        train_model(chunksize=args.chunksize, n_jobs=args.n_jobs, num_shards=args.shards)